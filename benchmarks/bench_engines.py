@@ -0,0 +1,53 @@
+""" Verification cost of the JWT engines, the numbers behind the default engine.
+
+Decodes the same token with every installed engine and algorithm, once through the engine directly and once through OAuth2Middleware without a token cache, so
+the engine's share of a request is visible. The default engine is the fastest one whose library is installed, in this order: cryptography, PyJWT, python-jose.
+
+Usage:
+    python benchmarks/bench_engines.py [--requests 20000] [--algorithms HS256 RS256 ES256 EdDSA]
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi_auth_middleware import OAuth2Middleware  # noqa: E402
+from fastapi_auth_middleware.engines import ENGINES  # noqa: E402
+from fastapi_auth_middleware.exceptions import InvalidToken  # noqa: E402
+from benchmarks.bench_middlewares import ALGORITHMS, generate_keys, sign  # noqa: E402
+from benchmarks.common import endpoint, measure, print_results, request  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--algorithms", nargs="+", default=list(ALGORITHMS), choices=ALGORITHMS)
+    arguments = parser.parse_args()
+
+    results = {}
+    for algorithm in arguments.algorithms:
+        private_key, public_key = generate_keys(algorithm)
+        token = sign(algorithm, private_key, expires_in=3600)
+
+        for name, engine_class in ENGINES.items():
+            try:
+                engine = engine_class()
+                key = engine.construct_key(public_key, algorithm)
+            except (ImportError, InvalidToken):
+                print(f"{algorithm} {name}: skipped, not supported")
+                continue
+
+            async def decode(engine=engine, key=key):
+                return engine.decode(token, key, algorithms=[algorithm])
+
+            app = OAuth2Middleware(endpoint, public_key=public_key, algorithms=[algorithm], engine=engine)
+            results[f"{algorithm} {name} decode"] = asyncio.run(measure(decode, arguments.requests))
+            results[f"{algorithm} {name} OAuth2Middleware"] = asyncio.run(measure(request(app, authorization=f"Bearer {token}"), arguments.requests))
+
+    print_results(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+""" Throughput and tail latency of FastAPI apps behind AuthMiddleware and OAuth2Middleware under concurrent load.
+
+Where bench_middlewares.py sends one request at a time, this harness runs many asyncio clients at once against complete FastAPI apps, in-process at the ASGI level and
+without a network. The apps are the ones the tests use, tests/basic_fastapi_app.py and tests/custom_oauth2_fastapi_app.py (which renews expired tokens), plus an
+equivalent app behind AuthMiddleware. Every request carries a token drawn from a mix of valid, expired, invalid (forged signature) and missing tokens, and every
+response status is checked against what the app must answer for that kind of token.
+
+For every app, mix and concurrency level, the harness reports throughput and the p50, p95 and p99 latency of single requests, measured from the moment a client sends
+a request until the response has been sent, so time spent waiting for the event loop or for a worker thread is included.
+
+Usage:
+    python benchmarks/bench_load.py [--apps auth oauth2 custom-oauth2] [--concurrency 1 16 64 256] [--requests 2000] [--mix valid=90,expired=5,invalid=5]
+                                    [--tokens 100] [--max-p50 MS] [--max-p95 MS] [--max-p99 MS] [--min-ops OPS] [--save results.json]
+
+A run exits with a non-zero status if any response had an unexpected status or any result crosses one of the thresholds, so a regression in tail latency fails CI.
+Expired tokens are expensive for custom-oauth2: its get_new_token signs a new RS256 token with python-jose on every renewal, which dominates its tail latency.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi import FastAPI  # noqa: E402
+import jwt  # noqa: E402
+
+from fastapi_auth_middleware import AuthMiddleware, FastAPIUser  # noqa: E402
+from fastapi_auth_middleware.engines import get_engine  # noqa: E402
+from benchmarks.common import ResponseRecorder, http_scope, percentile, receive  # noqa: E402
+from tests.keys import PRIVATE_KEY, PUBLIC_KEY  # noqa: E402
+
+KINDS = ("valid", "expired", "invalid", "missing")
+MIXES = ("valid=100", "valid=90,expired=5,invalid=5", "valid=80,invalid=10,missing=10")
+USER = FastAPIUser(first_name="Code", last_name="Specialist", user_id=1)
+
+
+def auth_middleware_app() -> FastAPI:
+    """ The routes of tests/basic_fastapi_app.py behind AuthMiddleware, verifying the same tokens """
+    engine = get_engine()
+    key = engine.construct_key(PUBLIC_KEY, "RS256")
+
+    def verify_header(headers):
+        claims = engine.decode(headers["Authorization"].split(" ")[-1], key, algorithms=["RS256"])
+        return claims["scope"].split(" "), USER
+
+    app = FastAPI(title="AuthMiddleware FastAPI App")
+    app.add_middleware(AuthMiddleware, verify_header=verify_header)
+
+    @app.get("/")
+    def home():
+        return 'Hello World'
+
+    return app
+
+
+def load_app(name: str) -> Tuple[FastAPI, Dict[str, int]]:
+    """ Returns an app and the status it must answer for each kind of token """
+    if name == "auth":
+        return auth_middleware_app(), {"valid": 200, "expired": 400, "invalid": 400, "missing": 400}
+    if name == "oauth2":
+        from tests.basic_fastapi_app import app
+        return app, {"valid": 200, "expired": 401, "invalid": 401, "missing": 401}
+    if name == "custom-oauth2":
+        from tests.custom_oauth2_fastapi_app import app
+        return app, {"valid": 200, "expired": 200, "invalid": 401, "missing": 401}  # Expired tokens are renewed
+    raise ValueError(f"Unknown app {name}")
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """ Parses a mix like "valid=90,expired=5,invalid=5" into weights per kind of token """
+    weights = {}
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in KINDS:
+            raise argparse.ArgumentTypeError(f"Unknown kind of token {kind!r}, expected one of {', '.join(KINDS)}")
+        weights[kind.strip()] = float(weight)
+    if sum(weights.values()) <= 0:
+        raise argparse.ArgumentTypeError(f"The mix {mix!r} has no weight")
+    return weights
+
+
+def sign(subject: int, expires_in: float) -> str:
+    now = int(time.time())
+    return jwt.encode({"sub": str(subject), "iat": now, "exp": now + expires_in, "scope": "a b c"}, key=PRIVATE_KEY, algorithm="RS256")
+
+
+def forge(token: str) -> str:
+    """ Replaces the signature of a token, so it's well-formed but fails verification """
+    signing_input, _, _ = token.rpartition(".")
+    return f"{signing_input}.{'A' * 342}"  # Length of an RS256 signature
+
+
+def create_tokens(distinct: int) -> Dict[str, List[Optional[str]]]:
+    """ Creates distinct tokens per kind, so caches see a realistic number of users instead of a single token """
+    valid = [sign(subject, expires_in=3600) for subject in range(distinct)]
+    return {
+        "valid": valid,
+        "expired": [sign(subject, expires_in=-3600) for subject in range(distinct)],
+        "invalid": [forge(token) for token in valid],
+        "missing": [None],
+    }
+
+
+def create_schedule(weights: Dict[str, float], tokens: Dict[str, List[Optional[str]]], requests: int, seed: int) -> List[Tuple[str, Optional[str]]]:
+    """ Draws the (kind, authorization header) of every request up front, so drawing is not part of the measured latency """
+    rng = random.Random(seed)
+    kinds = rng.choices(list(weights), weights=list(weights.values()), k=requests)
+    schedule = []
+    for kind in kinds:
+        token = rng.choice(tokens[kind])
+        schedule.append((kind, None if token is None else f"Bearer {token}"))
+    return schedule
+
+
+async def run_load(app, schedule: List[Tuple[str, Optional[str]]], expected: Dict[str, int], concurrency: int) -> Dict[str, float]:
+    """ Sends the scheduled requests from concurrent clients
+
+    Args:
+        app: ASGI app
+        schedule (List[Tuple[str, Optional[str]]]): The kind and 'Authorization' header of every request, clients take the next one when they're done
+        expected (Dict[str, int]): Response status per kind of token
+        concurrency (int): Number of clients
+
+    Returns:
+        Dict[str, float]: ops_per_sec, p50_ms, p95_ms, p99_ms, max_ms and the number of errors (responses with an unexpected status)
+    """
+    latencies = []
+    errors = Counter()
+    pending = iter(schedule)  # Shared by all clients
+
+    async def client():
+        for kind, authorization in pending:
+            send = ResponseRecorder()
+            started = time.perf_counter()
+            await app(http_scope("/", authorization), receive, send)
+            latencies.append(time.perf_counter() - started)
+            if send.status != expected[kind]:
+                errors[f"{kind} -> {send.status}"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    for status, count in errors.items():
+        print(f"  unexpected status: {status} ({count}x)")
+    return {
+        "ops_per_sec": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1e3,
+        "p95_ms": percentile(latencies, 0.95) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+        "max_ms": latencies[-1] * 1e3,
+        "errors": sum(errors.values()),
+    }
+
+
+def print_load_results(results: Dict[str, Dict[str, float]]):
+    width = max(len(name) for name in results) + 2
+    print(f"{'case':<{width}}{'ops/sec':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}")
+    for name, result in results.items():
+        print(f"{name:<{width}}{result['ops_per_sec']:>10.0f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['max_ms']:>10.2f}"
+              f"{result['errors']:>8.0f}")
+
+
+def check_thresholds(results: Dict[str, Dict[str, float]], arguments: argparse.Namespace) -> List[str]:
+    """ Returns a description of every result that had errors or crossed a threshold """
+    violations = []
+    for name, result in results.items():
+        if result["errors"]:
+            violations.append(f"{name}: {result['errors']:.0f} responses with an unexpected status")
+        for percentile_name in ("p50", "p95", "p99"):
+            limit = getattr(arguments, f"max_{percentile_name}")
+            if limit is not None and result[f"{percentile_name}_ms"] > limit:
+                violations.append(f"{name}: {percentile_name} {result[f'{percentile_name}_ms']:.2f} ms, allowed {limit:.2f} ms")
+        if arguments.min_ops is not None and result["ops_per_sec"] < arguments.min_ops:
+            violations.append(f"{name}: {result['ops_per_sec']:.0f} ops/sec, required {arguments.min_ops:.0f} ops/sec")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", nargs="+", default=["auth", "oauth2", "custom-oauth2"], choices=["auth", "oauth2", "custom-oauth2"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 16, 64, 256], help="Numbers of concurrent clients. Default is 1 16 64 256")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per app, mix and concurrency level. Default is 2000")
+    parser.add_argument("--warmup", type=int, default=200, help="Requests per app and mix before measuring. Default is 200")
+    parser.add_argument("--mix", nargs="+", default=list(MIXES), help=f"Weights per kind of token ({', '.join(KINDS)}). Default is {' '.join(MIXES)}")
+    parser.add_argument("--tokens", type=int, default=100, help="Distinct tokens per kind. Default is 100")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for drawing the tokens of the requests. Default is 0")
+    parser.add_argument("--max-p50", type=float, metavar="MS", help="Fail if the median latency of any case exceeds this")
+    parser.add_argument("--max-p95", type=float, metavar="MS", help="Fail if the p95 latency of any case exceeds this")
+    parser.add_argument("--max-p99", type=float, metavar="MS", help="Fail if the p99 latency of any case exceeds this")
+    parser.add_argument("--min-ops", type=float, metavar="OPS", help="Fail if the throughput of any case is lower than this")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as JSON")
+    arguments = parser.parse_args()
+
+    try:
+        mixes = {mix: parse_mix(mix) for mix in arguments.mix}
+    except argparse.ArgumentTypeError as error:
+        parser.error(str(error))
+
+    tokens = create_tokens(arguments.tokens)
+    results = {}
+    for app_name in arguments.apps:
+        app, expected = load_app(app_name)
+        for mix, weights in mixes.items():
+            asyncio.run(run_load(app, create_schedule(weights, tokens, arguments.warmup, arguments.seed), expected, concurrency=1))
+            for concurrency in arguments.concurrency:
+                name = f"{app_name} [{mix}] x{concurrency}"
+                schedule = create_schedule(weights, tokens, arguments.requests, arguments.seed + concurrency)
+                results[name] = asyncio.run(run_load(app, schedule, expected, concurrency))
+
+    print_load_results(results)
+
+    if arguments.save:
+        with open(arguments.save, "w") as results_file:
+            json.dump(results, results_file, indent=2, sort_keys=True)
+
+    violations = check_thresholds(results, arguments)
+    for violation in violations:
+        print(f"Violation: {violation}")
+    if violations:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
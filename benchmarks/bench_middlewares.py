@@ -0,0 +1,155 @@
+""" Throughput and allocations of AuthMiddleware and OAuth2Middleware across JWT algorithms.
+
+Drives both middlewares in-process at the ASGI level, without a server or a test client, for every supported signing algorithm and the request paths that
+matter in production: a valid token with a cold and a warm token cache, an expired token that is renewed, a missing 'Authorization' header and an excluded URL.
+
+Algorithms the chosen engine cannot verify are reported as skipped. Tokens are signed with PyJWT, which supports all of them.
+
+Usage:
+    python benchmarks/bench_middlewares.py [--requests 20000] [--algorithms HS256 RS256] [--engine cryptography] [--save baseline.json] [--compare baseline.json]
+                                           [--tolerance 0.2]
+
+Saving a baseline and comparing against it on the same machine exits with a non-zero status if any case got slower than the tolerance allows.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Callable, Dict, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cryptography.hazmat.primitives import serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa  # noqa: E402
+import jwt  # noqa: E402
+
+from fastapi_auth_middleware import AuthMiddleware, FastAPIUser, OAuth2Middleware, TokenCache  # noqa: E402
+from fastapi_auth_middleware.engines import ENGINES, JWTEngine, get_engine  # noqa: E402
+from fastapi_auth_middleware.exceptions import InvalidToken  # noqa: E402
+from benchmarks.common import compare_to_baseline, endpoint, measure, print_results, request, save_baseline  # noqa: E402
+
+ALGORITHMS = ("HS256", "RS256", "ES256", "EdDSA")
+USER = FastAPIUser(first_name="Code", last_name="Specialist", user_id=1)
+
+
+def pem_pair(private_key) -> Tuple[str, str]:
+    private_pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    public_pem = private_key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return private_pem.decode(), public_pem.decode()
+
+
+def generate_keys(algorithm: str) -> Tuple[str, str]:
+    """ Returns a (signing key, verification key) pair for an algorithm """
+    if algorithm == "HS256":
+        secret = "benchmark-secret-with-at-least-256-bits-of-entropy"
+        return secret, secret
+    if algorithm == "RS256":
+        return pem_pair(rsa.generate_private_key(public_exponent=65537, key_size=2048))
+    if algorithm == "ES256":
+        return pem_pair(ec.generate_private_key(ec.SECP256R1()))
+    if algorithm == "EdDSA":
+        return pem_pair(ed25519.Ed25519PrivateKey.generate())
+    raise ValueError(f"Unknown algorithm {algorithm}")
+
+
+def sign(algorithm: str, private_key: str, expires_in: float) -> str:
+    now = int(time.time())
+    return jwt.encode({"sub": "1", "iat": now, "exp": now + expires_in, "scope": "read write"}, key=private_key, algorithm=algorithm)
+
+
+def supported(engine: JWTEngine, algorithm: str, public_key: str) -> bool:
+    try:
+        engine.construct_key(public_key, algorithm)
+        return True
+    except InvalidToken:
+        return False
+
+
+def auth_middleware_cases(engine: JWTEngine, algorithm: str, public_key: str, token: str) -> Dict[str, Tuple[Callable, int]]:
+    key = engine.construct_key(public_key, algorithm)
+
+    def verify_header(headers):
+        claims = engine.decode(headers["Authorization"].split(" ")[-1], key, algorithms=[algorithm])
+        return claims["scope"].split(" "), USER
+
+    app = AuthMiddleware(endpoint, verify_header=verify_header, excluded_urls=["/health"])
+    return {
+        "valid": (request(app, authorization=f"Bearer {token}"), 200),
+        "missing header": (request(app), 400),
+        "excluded url": (request(app, path="/health"), 200),
+    }
+
+
+def oauth2_middleware_cases(engine: JWTEngine, algorithm: str, public_key: str, token: str, expired_token: str) -> Dict[str, Tuple[Callable, int]]:
+    def get_new_token(old_token: str) -> str:
+        return token
+
+    cold_cache = TokenCache()
+    cold = OAuth2Middleware(endpoint, public_key=public_key, algorithms=[algorithm], engine=engine, token_cache=cold_cache)
+    warm = OAuth2Middleware(endpoint, public_key=public_key, algorithms=[algorithm], engine=engine, token_cache=TokenCache())
+    renewing = OAuth2Middleware(endpoint, public_key=public_key, algorithms=[algorithm], engine=engine, get_new_token=get_new_token)
+    uncached = OAuth2Middleware(endpoint, public_key=public_key, algorithms=[algorithm], engine=engine)
+
+    cold_request = request(cold, authorization=f"Bearer {token}")
+
+    async def cold_cache_request():
+        cold_cache.clear()
+        return await cold_request()
+
+    return {
+        "valid, no cache": (request(uncached, authorization=f"Bearer {token}"), 200),
+        "valid, cold cache": (cold_cache_request, 200),
+        "valid, warm cache": (request(warm, authorization=f"Bearer {token}"), 200),
+        "expired, renewed": (request(renewing, authorization=f"Bearer {expired_token}"), 200),
+        "missing header": (request(uncached), 401),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--algorithms", nargs="+", default=list(ALGORITHMS), choices=ALGORITHMS)
+    parser.add_argument("--engine", choices=list(ENGINES), help="Engine that verifies tokens. Default is the fastest installed engine")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="Compare the results to a JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown compared to the baseline. Default is 0.2")
+    arguments = parser.parse_args()
+
+    engine = get_engine(arguments.engine)
+    results = {}
+    for algorithm in arguments.algorithms:
+        private_key, public_key = generate_keys(algorithm)
+        if not supported(engine, algorithm, public_key):
+            print(f"{algorithm}: skipped, not supported by {engine.name}")
+            continue
+
+        token = sign(algorithm, private_key, expires_in=3600)
+        expired_token = sign(algorithm, private_key, expires_in=-3600)
+
+        cases = {f"AuthMiddleware {algorithm} {name}": call for name, call in auth_middleware_cases(engine, algorithm, public_key, token).items()}
+        cases.update({f"OAuth2Middleware {algorithm} {name}": call for name, call in oauth2_middleware_cases(engine, algorithm, public_key, token, expired_token).items()})
+        for name, (call, expected_status) in cases.items():
+            status = asyncio.run(call())
+            if status != expected_status:  # Measuring the wrong path would be worse than not measuring at all
+                sys.exit(f"{name}: expected status {expected_status}, got {status}")
+            results[name] = asyncio.run(measure(call, arguments.requests))
+
+    if not results:
+        sys.exit("No algorithm could be benchmarked")
+
+    print_results(results)
+
+    if arguments.save:
+        save_baseline(arguments.save, results)
+
+    if arguments.compare:
+        regressions = compare_to_baseline(arguments.compare, results, arguments.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+""" Shared helpers to drive ASGI apps in-process and measure them """
+import json
+import math
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Dict, List
+
+HEADERS = [
+    (b"host", b"localhost"),
+    (b"user-agent", b"benchmark"),
+    (b"accept", b"*/*"),
+    (b"accept-encoding", b"gzip, deflate"),
+]
+
+
+def http_scope(path: str = "/", authorization: str = None, method: str = "GET") -> dict:
+    headers = list(HEADERS)
+    if authorization is not None:
+        headers.append((b"authorization", authorization.encode("latin-1")))
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("localhost", 80),
+    }
+
+
+async def receive() -> dict:
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+class ResponseRecorder:
+    """ ASGI send callable that keeps the status of the response """
+
+    def __init__(self):
+        self.status = None
+
+    async def __call__(self, message: dict):
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+
+
+async def endpoint(scope, receive, send):
+    """ Minimal ASGI app behind the middleware """
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"OK"})
+
+
+def request(app, path: str = "/", authorization: str = None) -> Callable[[], Awaitable[int]]:
+    """ Creates a coroutine function that sends one request through an ASGI app and returns the response status """
+
+    async def call() -> int:
+        send = ResponseRecorder()
+        await app(http_scope(path, authorization), receive, send)
+        return send.status
+
+    return call
+
+
+async def measure(call: Callable[[], Awaitable], requests: int, warmup: int = 1000, samples: int = 1000) -> Dict[str, float]:
+    """ Measures throughput and memory allocated per request
+
+    Args:
+        call (Callable[[], Awaitable]): Sends one request
+        requests (int): Number of timed requests
+        warmup (int): Number of requests before measuring, e.g. to fill caches
+        samples (int): Number of requests traced with tracemalloc
+
+    Returns:
+        Dict[str, float]: ops_per_sec, us_per_request and bytes_per_request (peak memory allocated while handling a request)
+    """
+    for _ in range(min(requests, warmup)):
+        await call()
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        await call()
+    elapsed = time.perf_counter() - started
+
+    samples = min(requests, samples)
+    allocated = 0
+    tracemalloc.start()
+    for _ in range(samples):
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        else:  # Python < 3.9, restarting clears the traces and the peak
+            tracemalloc.stop()
+            tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        await call()
+        _, peak = tracemalloc.get_traced_memory()
+        allocated += peak - before
+    tracemalloc.stop()
+
+    return {
+        "ops_per_sec": requests / elapsed,
+        "us_per_request": elapsed / requests * 1e6,
+        "bytes_per_request": allocated / samples,
+    }
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """ Nearest-rank percentile of an ascending list, e.g. fraction 0.99 for p99 """
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def print_results(results: Dict[str, Dict[str, float]]):
+    width = max(len(name) for name in results) + 2
+    print(f"{'case':<{width}}{'ops/sec':>12}{'us/request':>12}{'bytes/request':>15}")
+    for name, result in results.items():
+        print(f"{name:<{width}}{result['ops_per_sec']:>12.0f}{result['us_per_request']:>12.2f}{result['bytes_per_request']:>15.0f}")
+
+
+def save_baseline(path: str, results: Dict[str, Dict[str, float]]):
+    with open(path, "w") as baseline_file:
+        json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+
+def compare_to_baseline(path: str, results: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """ Compares results to a saved baseline
+
+    Args:
+        path (str): Path of a baseline written by save_baseline
+        results (Dict[str, Dict[str, float]]): Current results
+        tolerance (float): Allowed relative slowdown, e.g. 0.2 for 20 %
+
+    Returns:
+        List[str]: A description of every case that regressed
+    """
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]["ops_per_sec"]
+        if result["ops_per_sec"] < expected * (1 - tolerance):
+            regressions.append(f"{name}: {result['ops_per_sec']:.0f} ops/sec, baseline {expected:.0f} ops/sec")
+    return regressions
@@ -2,7 +2,66 @@
 
 __version__ = "1.0.1"
 
-from fastapi_auth_middleware.middleware import FastAPIUser, AuthMiddleware
-from fastapi_auth_middleware.oauth2_middleware import OAuth2Middleware
+import importlib
+from typing import TYPE_CHECKING
 
-__all__ = [FastAPIUser.__name__, AuthMiddleware.__name__, OAuth2Middleware.__name__]
+_LAZY_IMPORTS = {  # {public name: submodule}, a submodule is imported on first access of one of its names
+    "FastAPIUser": "middleware",
+    "AuthMiddleware": "middleware",
+    "OAuth2Middleware": "oauth2_middleware",
+    "TokenCache": "cache",
+    "Keyring": "keys",
+    "JWKSKeySource": "jwks",
+    "VerificationExecutor": "concurrency",
+    "FailureBudget": "throttling",
+    "Metrics": "metrics",
+    "PrometheusMetrics": "metrics",
+    "JWTEngine": "engines",
+    "CryptographyEngine": "engines",
+    "PyJWTEngine": "engines",
+    "JoseEngine": "engines",
+    "ExpiryScheduler": "expiry",
+    "CacheBackend": "cache_backends",
+    "InProcessCacheBackend": "cache_backends",
+    "SharedMemoryCacheBackend": "cache_backends",
+    "RedisCacheBackend": "redis_cache",
+    "ScopePolicy": "policy",
+    "IntrospectionBackend": "introspection",
+    "AdmissionController": "admission",
+    "SessionTokenSigner": "session",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+if TYPE_CHECKING:  # Eager imports for type checkers and IDEs
+    from fastapi_auth_middleware.middleware import FastAPIUser, AuthMiddleware
+    from fastapi_auth_middleware.oauth2_middleware import OAuth2Middleware
+    from fastapi_auth_middleware.cache import TokenCache
+    from fastapi_auth_middleware.keys import Keyring
+    from fastapi_auth_middleware.jwks import JWKSKeySource
+    from fastapi_auth_middleware.concurrency import VerificationExecutor
+    from fastapi_auth_middleware.throttling import FailureBudget
+    from fastapi_auth_middleware.metrics import Metrics, PrometheusMetrics
+    from fastapi_auth_middleware.engines import JWTEngine, CryptographyEngine, PyJWTEngine, JoseEngine
+    from fastapi_auth_middleware.expiry import ExpiryScheduler
+    from fastapi_auth_middleware.cache_backends import CacheBackend, InProcessCacheBackend, SharedMemoryCacheBackend
+    from fastapi_auth_middleware.redis_cache import RedisCacheBackend
+    from fastapi_auth_middleware.policy import ScopePolicy
+    from fastapi_auth_middleware.introspection import IntrospectionBackend
+    from fastapi_auth_middleware.admission import AdmissionController
+    from fastapi_auth_middleware.session import SessionTokenSigner
+
+
+def __getattr__(name: str):
+    """ Imports the submodule of a public name on first access, so e.g. AuthMiddleware users never load the JWT libraries """
+    submodule = _LAZY_IMPORTS.get(name)
+    if submodule is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(f"{__name__}.{submodule}"), name)
+    globals()[name] = value  # Later accesses don't go through __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,107 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque
+
+from fastapi_auth_middleware.exceptions import ServiceOverloaded
+
+
+class AdmissionController:
+    """ Limits the number of verifications that run at the same time, so an overload is answered with fast HTTP 503 responses instead of piling up on the event loop.
+
+    Only verifications are admitted: requests whose token is cached, or that wait for a verification of the same token that is already in flight, pass without a slot.
+    A request that finds all slots taken waits in a bounded FIFO queue. Requests that find the queue full, or wait longer than queue_timeout, are rejected.
+    """
+
+    def __init__(self, max_concurrency: int = 64, max_queue: int = 128, queue_timeout: float = None, retry_after: int or Callable[["AdmissionController"], int] = 1):
+        """ AdmissionController Constructor
+
+        Args:
+            max_concurrency (int): Optional: Verifications that may run at the same time. Default is 64
+            max_queue (int): Optional: Verifications that may wait for a slot, further requests are rejected immediately. Default is 128
+            queue_timeout (float): Optional: Seconds a verification may wait for a slot before it's rejected. Default will wait until a slot is free
+            retry_after (int or Callable[[AdmissionController], int]): Optional: Seconds for the 'Retry-After' header of rejected requests, or a function that computes
+                                                                        them from the controller, e.g. from its queue_depth. Default is 1
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.in_flight = 0  # Verifications holding a slot
+        self.rejected = 0  # Requests rejected since the start
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queue_depth(self) -> int:
+        """ Verifications waiting for a slot """
+        return len(self._waiters)
+
+    def get_retry_after(self) -> int:
+        """ Seconds for the 'Retry-After' header of a rejected request """
+        return self.retry_after(self) if callable(self.retry_after) else self.retry_after
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        raise ServiceOverloaded(reason)
+
+    async def acquire(self):
+        """ Waits for a slot. Every successful acquire must be followed by a release
+
+        Raises:
+            ServiceOverloaded: If the queue is full or the slot did not become free within the queue_timeout
+        """
+        if self.in_flight < self.max_concurrency and not self._waiters:  # Fast path, no waiting
+            self.in_flight += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self._reject("Too many verifications are waiting")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)  # The slot is handed over by release
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():  # Received a slot just as the timeout passed
+                self.release()
+            else:
+                self._remove(waiter)
+            self._reject("Waited too long for a verification slot")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():  # Received a slot, but won't use it
+                self.release()
+            else:
+                self._remove(waiter)
+            raise
+
+    def _remove(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:  # Already handed a slot
+            pass
+
+    def release(self):
+        """ Frees a slot, or hands it to the longest waiting verification """
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # The slot is handed over, in_flight is unchanged
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        """ Holds a slot for the duration of a verification
+
+        Raises:
+            ServiceOverloaded: See acquire
+        """
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
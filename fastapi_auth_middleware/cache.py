@@ -0,0 +1,83 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class TokenCache:
+    """ Bounded LRU cache for verified tokens. Entries are keyed by a digest of the raw token and expire with the token's own 'exp' claim """
+
+    def __init__(self, max_size: int = 1024, ttl: float = None):
+        """ TokenCache Constructor
+
+        Args:
+            max_size (int): Maximum number of entries. The least recently used entry is evicted once the cache is full
+            ttl (float): Optional: Upper bound in seconds for the lifetime of an entry. Default will keep an entry until its 'exp' is reached or it is evicted
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        """ Creates the cache key of a token. The raw token is never stored
+
+        Args:
+            token (str): A raw token
+
+        Returns:
+            bytes: SHA-256 digest of the token
+        """
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[Any]:
+        """ Looks up a token and marks it as recently used
+
+        Args:
+            token (str): A raw token
+
+        Returns:
+            Any: The cached value or None if the token is unknown or has expired
+        """
+        key = self.digest(token)
+        entry = self._entries.get(key)
+
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.time():  # Token lapsed while cached
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, token: str, value: Any, expires_at: float = None):
+        """ Stores a value for a token
+
+        Args:
+            token (str): A raw token
+            value (Any): The value to store, e.g. the decoded token, credentials and user
+            expires_at (float): Optional: Unix timestamp after which the entry is invalid, most likely the token's 'exp' claim
+        """
+        if self.ttl is not None:
+            max_expires_at = time.time() + self.ttl
+            expires_at = max_expires_at if expires_at is None else min(expires_at, max_expires_at)
+
+        key = self.digest(token)
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:  # Evict least recently used entries
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """ Removes all entries """
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,194 @@
+import json
+import mmap
+import os
+import struct
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from fastapi_auth_middleware.cache import TokenCache
+
+
+class CacheBackend:
+    """ Stores the claims of verified tokens, so other processes or hosts don't have to verify them again. Only claims are stored, the credentials and the user are
+    created from them by each process. Entries expire with the token's 'exp' claim. The OAuth2Backend prefixes tokens with a digest of its verification settings, so
+    services that accept different tokens can share one backend.
+
+    A cache backend is trusted like the public key: anyone who can write to it can make the middleware accept arbitrary claims.
+    """
+
+    def __init__(self, ttl: float = None):
+        """ CacheBackend Constructor
+
+        Args:
+            ttl (float): Optional: Upper bound in seconds for the lifetime of an entry, and the lifetime of entries for tokens without 'exp'. Default will only cache tokens
+                         that have an 'exp' claim, until it is reached
+        """
+        self.ttl = ttl
+
+    def expires_at(self, expires_at: Optional[float]) -> Optional[float]:
+        """ Returns when an entry expires, None if it must not be cached at all """
+        if self.ttl is None:
+            return expires_at
+
+        max_expires_at = time.time() + self.ttl
+        return max_expires_at if expires_at is None else min(expires_at, max_expires_at)
+
+    async def get(self, token: str) -> Optional[dict]:
+        """ Looks up the claims of a token
+
+        Args:
+            token (str): A raw token
+
+        Returns:
+            dict: The claims or None if the token is unknown or has expired
+        """
+        raise NotImplementedError  # pragma nocover
+
+    async def set(self, token: str, claims: dict, expires_at: float = None):
+        """ Stores the claims of a verified token
+
+        Args:
+            token (str): A raw token
+            claims (dict): The decoded token
+            expires_at (float): Optional: Unix timestamp after which the entry is invalid, most likely the token's 'exp' claim
+        """
+        raise NotImplementedError  # pragma nocover
+
+
+class InProcessCacheBackend(CacheBackend):
+    """ Cache backend that is local to the process, mostly useful for tests and as a drop-in for a shared backend """
+
+    def __init__(self, max_size: int = 1024, ttl: float = None):
+        """ InProcessCacheBackend Constructor
+
+        Args:
+            max_size (int): Optional: Maximum number of entries, the least recently used entry is evicted first. Default is 1024
+            ttl (float): Optional: See CacheBackend
+        """
+        super().__init__(ttl=ttl)
+        self.cache = TokenCache(max_size=max_size)
+
+    async def get(self, token: str) -> Optional[dict]:
+        return self.cache.get(token)
+
+    async def set(self, token: str, claims: dict, expires_at: float = None):
+        expires_at = self.expires_at(expires_at)
+        if expires_at is not None:
+            self.cache.set(token, claims, expires_at=expires_at)
+
+
+class SharedMemoryCacheBackend(CacheBackend):
+    """ Cache backend in a memory mapped file, shared by all worker processes on a host that open the same path.
+
+    The file is a fixed size hash table of slots, so it never grows. A token is stored in one of a few neighbouring slots, replacing an expired entry or the one that
+    expires first. Readers and writers synchronize with flock, so it requires a POSIX system. Put the file on a tmpfs such as /dev/shm to keep it off the disk.
+    """
+
+    MAGIC = b"FAMCACHE"
+    HEADER = struct.Struct("<8sIII")  # Magic, version, slots, slot size
+    ENTRY = struct.Struct("<d32sI")  # Expiry, token digest, payload length
+    VERSION = 1
+    PROBES = 8  # Neighbouring slots a token may be stored in
+
+    def __init__(self, path: str, slots: int = 4096, slot_size: int = 1024, ttl: float = None):
+        """ SharedMemoryCacheBackend Constructor. Creates the file if it does not exist
+
+        Args:
+            path (str): Path of the file, the same for all workers, e.g. "/dev/shm/fastapi-auth-cache"
+            slots (int): Optional: Number of entries the file can hold. Default is 4096
+            slot_size (int): Optional: Bytes per entry. Claims that don't fit are not shared. Default is 1024
+            ttl (float): Optional: See CacheBackend
+
+        Raises:
+            ValueError: If the file exists but has been created with a different layout
+        """
+        import fcntl  # POSIX only, imported here so the package can be imported anywhere
+
+        super().__init__(ttl=ttl)
+        if slot_size <= self.ENTRY.size:
+            raise ValueError(f"slot_size must be larger than {self.ENTRY.size}")
+
+        self._fcntl = fcntl
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.size = self.HEADER.size + slots * slot_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)  # Claims are sensitive, only the owner may read them
+
+        with self._lock(fcntl.LOCK_EX):
+            existing_size = os.fstat(self._fd).st_size
+            if existing_size == 0:  # First worker creates the table
+                os.ftruncate(self._fd, self.size)
+            self._map = mmap.mmap(self._fd, max(existing_size, self.size))
+
+            if existing_size == 0:
+                self.HEADER.pack_into(self._map, 0, self.MAGIC, self.VERSION, slots, slot_size)
+            elif self.HEADER.unpack_from(self._map, 0) != (self.MAGIC, self.VERSION, slots, slot_size):
+                self.close()
+                raise ValueError(f"{path} has been created with a different layout")
+
+    @contextmanager
+    def _lock(self, operation: int):
+        self._fcntl.flock(self._fd, operation)
+        try:
+            yield
+        finally:
+            self._fcntl.flock(self._fd, self._fcntl.LOCK_UN)
+
+    def _offsets(self, digest: bytes):
+        start = int.from_bytes(digest[:8], "little") % self.slots
+        for probe in range(min(self.PROBES, self.slots)):
+            yield self.HEADER.size + ((start + probe) % self.slots) * self.slot_size
+
+    async def get(self, token: str) -> Optional[dict]:
+        digest = TokenCache.digest(token)
+        now = time.time()
+        payload = None
+
+        with self._lock(self._fcntl.LOCK_SH):
+            for offset in self._offsets(digest):
+                expires_at, key, length = self.ENTRY.unpack_from(self._map, offset)
+                if key == digest:
+                    if expires_at > now:
+                        start = offset + self.ENTRY.size
+                        payload = self._map[start:start + length]
+                    break
+
+        return None if payload is None else json.loads(payload)
+
+    async def set(self, token: str, claims: dict, expires_at: float = None):
+        expires_at = self.expires_at(expires_at)
+        if expires_at is None:
+            return
+
+        payload = json.dumps(claims, separators=(",", ":")).encode()
+        if len(payload) > self.slot_size - self.ENTRY.size:  # Too large to share
+            return
+
+        digest = TokenCache.digest(token)
+        now = time.time()
+
+        with self._lock(self._fcntl.LOCK_EX):
+            target, target_expires_at = None, None
+            for offset in self._offsets(digest):
+                slot_expires_at, key, _ = self.ENTRY.unpack_from(self._map, offset)
+                if key == digest or slot_expires_at <= now:  # Same token or free slot
+                    target = offset
+                    break
+                if target is None or slot_expires_at < target_expires_at:  # Otherwise replace the entry that expires first
+                    target, target_expires_at = offset, slot_expires_at
+
+            self.ENTRY.pack_into(self._map, target, expires_at, digest, len(payload))
+            start = target + self.ENTRY.size
+            self._map[start:start + len(payload)] = payload
+
+    def clear(self):
+        """ Removes all entries, for all workers """
+        with self._lock(self._fcntl.LOCK_EX):
+            self._map[self.HEADER.size:self.size] = bytes(self.size - self.HEADER.size)
+
+    def close(self):
+        """ Unmaps the file. The file itself is kept for the other workers """
+        self._map.close()
+        os.close(self._fd)
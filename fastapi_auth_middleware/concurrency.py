@@ -0,0 +1,146 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional
+
+from fastapi_auth_middleware.exceptions import VerificationQueueFull
+
+
+class VerificationExecutor:
+    """ Runs CPU heavy token verification off the event loop, either on a thread pool or on a process pool """
+
+    def __init__(
+            self,
+            executor: Executor = None,
+            max_workers: int = None,
+            max_concurrency: int = None,
+            max_queue: int = None,
+            inline_algorithms: Iterable[str] = ("HS256", "HS384", "HS512")
+    ):
+        """ VerificationExecutor Constructor
+
+        Args:
+            executor (Executor): Optional: A ThreadPoolExecutor or ProcessPoolExecutor to run verifications on. Default will create a ThreadPoolExecutor with max_workers
+            max_workers (int): Optional: Number of workers of the default executor. Default is the number of CPUs
+            max_concurrency (int): Optional: Maximum number of verifications that are submitted at once, further requests wait on the event loop. Default is unlimited
+            max_queue (int): Optional: Maximum number of verifications waiting for a free worker (or for max_concurrency), further requests are rejected with
+                             VerificationQueueFull, which both middlewares answer with HTTP 503. Default is unlimited
+            inline_algorithms (Iterable[str]): Optional: Algorithms that are cheap enough to verify on the event loop. Default are the HMAC algorithms
+        """
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers=max_workers or os.cpu_count(), thread_name_prefix="token-verification")
+        self.is_process_pool = isinstance(self.executor, ProcessPoolExecutor)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.capacity = max_concurrency or getattr(self.executor, "_max_workers", None) or os.cpu_count()  # Verifications that run at the same time
+        self.pending = 0  # Running and waiting verifications
+        self.inline_algorithms = frozenset(inline_algorithms)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def offloads(self, algorithm: str) -> bool:
+        """ Checks whether tokens of an algorithm are verified on the executor
+
+        Args:
+            algorithm (str): The 'alg' header of a token
+
+        Returns:
+            bool: False if the algorithm is verified inline on the event loop
+        """
+        return algorithm not in self.inline_algorithms
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:  # Semaphores are bound to an event loop
+            self._loop, self._semaphore = loop, asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def run(self, function: Callable, *args, **kwargs) -> Any:
+        """ Runs a function on the executor without blocking the event loop
+
+        Args:
+            function (Callable): The function to run. Must be picklable if a process pool is used
+            *args: Positional arguments of the function
+            **kwargs: Keyword arguments of the function
+
+        Returns:
+            Any: The return value of the function. Exceptions are re-raised
+
+        Raises:
+            VerificationQueueFull: If max_queue verifications are already waiting
+        """
+        if self.max_queue is not None and self.pending >= self.capacity + self.max_queue:
+            raise VerificationQueueFull("Too many verifications are waiting for a worker")
+
+        call = functools.partial(function, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+
+        try:
+            if self.max_concurrency is None:
+                return await loop.run_in_executor(self.executor, call)
+
+            async with self._get_semaphore():
+                return await loop.run_in_executor(self.executor, call)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self, wait: bool = True):
+        """ Shuts down the underlying executor """
+        self.executor.shutdown(wait=wait)
+
+
+class SingleFlight:
+    """ Coalesces concurrent calls with the same key: the first caller runs the function, all others wait for and share its result or exception """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    @staticmethod
+    def _cancelling() -> bool:
+        """ Checks whether cancelling the current task has been requested. Always False before Python 3.11, which can't tell """
+        cancelling = getattr(asyncio.current_task(), "cancelling", None)
+        return cancelling is not None and cancelling() > 0
+
+    async def run(self, key: Hashable, function: Callable[[], Awaitable[Any]]) -> Any:
+        """ Runs a function unless a call with the same key is already in flight
+
+        Args:
+            key (Hashable): Identifies identical calls, e.g. the credential that is verified
+            function (Callable[[], Awaitable[Any]]): Coroutine function without arguments that performs the call
+
+        Returns:
+            Any: The result of the call. Exceptions of the call are raised in every waiting caller. If the caller that runs the function is cancelled, one of the
+                 waiting callers runs it again instead
+        """
+        loop = asyncio.get_running_loop()
+        in_flight = self._calls.get(key)
+
+        while in_flight is not None and in_flight.get_loop() is loop:
+            try:
+                return await asyncio.shield(in_flight)  # A cancelled follower must not cancel the call for everyone else
+            except asyncio.CancelledError:
+                if not in_flight.cancelled() or self._cancelling():  # This follower has been cancelled itself
+                    raise
+            in_flight = self._calls.get(key)  # The leader has been cancelled, e.g. its client disconnected. Follow its successor or take over
+
+        future = self._calls[key] = loop.create_future()
+
+        try:
+            result = await function()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exception:
+            future.set_exception(exception)
+            future.exception()  # Mark as retrieved, there might be no other caller
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
@@ -0,0 +1,28 @@
+import base64
+
+
+def b64url_encode(data: bytes) -> str:
+    """ Encodes bytes as unpadded base64url, the encoding of JWT segments (RFC 7515)
+
+    Args:
+        data (bytes): The bytes to encode
+
+    Returns:
+        str: The encoded bytes without '=' padding
+    """
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def b64url_decode(segment: str) -> bytes:
+    """ Decodes base64url with or without '=' padding, e.g. a segment of a JWT or a JWK parameter
+
+    Args:
+        segment (str): The encoded string
+
+    Returns:
+        bytes: The decoded bytes
+
+    Raises:
+        binascii.Error: If the segment is not valid base64url
+    """
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
@@ -0,0 +1,496 @@
+import binascii
+import hmac
+import importlib.util
+import json
+import time
+from datetime import timedelta
+from typing import Any, List, Optional
+
+from fastapi_auth_middleware.encoding import b64url_decode
+from fastapi_auth_middleware.exceptions import InvalidToken, TokenHasExpired
+
+DEFAULT_OPTIONS = {
+    "verify_signature": True,
+    "verify_aud": True,
+    "verify_iat": True,
+    "verify_exp": True,
+    "verify_nbf": True,
+    "verify_iss": True,
+    "verify_sub": True,
+    "verify_jti": True,
+    "verify_at_hash": True,
+    "require_aud": False,
+    "require_iat": False,
+    "require_exp": False,
+    "require_nbf": False,
+    "require_iss": False,
+    "require_sub": False,
+    "require_jti": False,
+    "require_at_hash": False,
+    "leeway": 0,
+}  # Same defaults as python-jose, options that are not passed fall back to these for every engine
+
+
+class JWTEngine:
+    """ Verifies JWTs with a specific library. Errors of the library are raised as TokenHasExpired or InvalidToken, so the middleware does not depend on the library.
+    Engines keep no state and can be passed to worker processes """
+
+    name: str = None
+
+    def construct_key(self, key: Any, algorithm: str) -> Any:
+        """ Parses a key once, so it can be used for many tokens
+
+        Args:
+            key (Any): A PEM string, an HMAC secret or a JWK dict
+            algorithm (str): The algorithm the key will be used with
+
+        Returns:
+            Any: An engine specific key object that can be passed to decode
+
+        Raises:
+            InvalidToken: If the key can't be used for the algorithm
+        """
+        raise NotImplementedError  # pragma nocover
+
+    def get_unverified_header(self, token: str) -> dict:
+        """ Returns the header of a token without verifying it
+
+        Args:
+            token (str): A raw token
+
+        Returns:
+            dict: The JOSE header
+
+        Raises:
+            InvalidToken: If the token is malformed
+        """
+        raise NotImplementedError  # pragma nocover
+
+    def decode(self, token: str, key: Any, algorithms: List[str] = None, options: dict = None, audience: str = None, issuer: str = None) -> dict:
+        """ Verifies a token and returns its claims
+
+        Args:
+            token (str): A raw token
+            key (Any): A key created by construct_key
+            algorithms (List[str]): Optional: The allowed algorithms. Default will allow the algorithm the key was created for
+            options (dict): Optional: Verification options as used by python-jose, e.g. {"verify_aud": False}. Missing options fall back to DEFAULT_OPTIONS
+            audience (str): Optional: The expected audience
+            issuer (str): Optional: The expected issuer
+
+        Returns:
+            dict: The claims of the token
+
+        Raises:
+            TokenHasExpired: If the token is valid but has expired
+            InvalidToken: For any other reason the token is rejected
+        """
+        raise NotImplementedError  # pragma nocover
+
+    @staticmethod
+    def merge_options(options: Optional[dict]) -> dict:
+        return DEFAULT_OPTIONS if not options else {**DEFAULT_OPTIONS, **options}
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+
+class JoseEngine(JWTEngine):
+    """ Verifies tokens with python-jose """
+
+    name = "python-jose"
+
+    def construct_key(self, key: Any, algorithm: str) -> Any:
+        from jose import jwk
+        from jose.exceptions import JOSEError
+
+        try:
+            return jwk.construct(key, algorithm)
+        except JOSEError as error:
+            raise InvalidToken(f"Invalid key for algorithm {algorithm}: {error}") from None
+
+    def get_unverified_header(self, token: str) -> dict:
+        from jose import jwt
+        from jose.exceptions import JOSEError
+
+        try:
+            return jwt.get_unverified_header(token)
+        except JOSEError as error:
+            raise InvalidToken(str(error)) from None
+
+    def decode(self, token: str, key: Any, algorithms: List[str] = None, options: dict = None, audience: str = None, issuer: str = None) -> dict:
+        from jose import jwt
+        from jose.exceptions import ExpiredSignatureError, JOSEError
+
+        try:
+            return jwt.decode(token=token, key=key, algorithms=algorithms, options=options, audience=audience, issuer=issuer)
+        except ExpiredSignatureError as error:  # The signature has been verified before the claims
+            raise _expired(error, jwt.get_unverified_claims(token), self.merge_options(options), audience, issuer) from None
+        except JOSEError as error:
+            raise InvalidToken(str(error)) from None
+
+
+class _PyJWTKey:
+    """ A key prepared by PyJWT together with the algorithm it was prepared for """
+
+    __slots__ = ("key", "algorithm")
+
+    def __init__(self, key: Any, algorithm: str):
+        self.key = key
+        self.algorithm = algorithm
+
+
+class PyJWTEngine(JWTEngine):
+    """ Verifies tokens with PyJWT. Asymmetric algorithms require PyJWT's optional cryptography dependency """
+
+    name = "pyjwt"
+
+    def construct_key(self, key: Any, algorithm: str) -> _PyJWTKey:
+        import jwt
+        from jwt.algorithms import get_default_algorithms
+
+        try:
+            if isinstance(key, dict):  # JWK
+                return _PyJWTKey(jwt.PyJWK(key, algorithm).key, algorithm)
+            return _PyJWTKey(get_default_algorithms()[algorithm].prepare_key(key), algorithm)
+        except KeyError:
+            raise InvalidToken(f"Unsupported algorithm {algorithm}") from None
+        except (jwt.PyJWTError, ValueError, TypeError) as error:
+            raise InvalidToken(f"Invalid key for algorithm {algorithm}: {error}") from None
+
+    def get_unverified_header(self, token: str) -> dict:
+        import jwt
+
+        try:
+            return jwt.get_unverified_header(token)
+        except jwt.PyJWTError as error:
+            raise InvalidToken(str(error)) from None
+
+    def decode(self, token: str, key: _PyJWTKey, algorithms: List[str] = None, options: dict = None, audience: str = None, issuer: str = None) -> dict:
+        import jwt
+
+        options = self.merge_options(options)
+        pyjwt_options = {
+            "verify_signature": options["verify_signature"],
+            "verify_exp": options["verify_exp"],
+            "verify_nbf": options["verify_nbf"],
+            "verify_iat": options["verify_iat"],
+            "verify_aud": options["verify_aud"],
+            "verify_iss": options["verify_iss"] and issuer is not None,  # python-jose only checks the issuer if one is expected
+            "require": [claim for claim in ("exp", "iat", "nbf", "iss", "sub", "aud", "jti") if options.get(f"require_{claim}")],
+        }
+
+        if algorithms is not None and key.algorithm not in algorithms:
+            raise InvalidToken("The specified alg value is not allowed")
+
+        try:
+            return jwt.decode(token, key.key, algorithms=[key.algorithm], options=pyjwt_options, audience=audience, issuer=issuer, leeway=options["leeway"])
+        except jwt.ExpiredSignatureError as error:  # The signature has been verified before the claims
+            claims = jwt.decode(token, options={"verify_signature": False})
+            raise _expired(error, claims, options, audience, issuer) from None
+        except jwt.PyJWTError as error:
+            raise InvalidToken(str(error)) from None
+
+
+def _expired(error: Exception, claims: dict, options: dict, audience: str = None, issuer: str or List[str] = None) -> TokenHasExpired:
+    """ Creates the TokenHasExpired of a token whose signature is valid, with its claims if all claims but 'exp' are valid too """
+    try:
+        validate_claims(claims, {**options, "verify_exp": False}, audience=audience, issuer=issuer)
+    except InvalidToken:
+        claims = None
+    return TokenHasExpired(str(error), claims=claims)
+
+
+def _numeric_claim(claims: dict, claim: str, name: str) -> int:
+    try:
+        return int(claims[claim])
+    except (TypeError, ValueError):
+        raise InvalidToken(f"{name} claim ({claim}) must be an integer.") from None
+
+
+def validate_claims(claims: dict, options: dict, audience: str = None, issuer: str or List[str] = None):
+    """ Validates the registered claims of a verified token the same way python-jose does
+
+    Args:
+        claims (dict): The claims of the token
+        options (dict): Verification options, see DEFAULT_OPTIONS
+        audience (str): Optional: The expected audience
+        issuer (str or List[str]): Optional: The expected issuer or issuers
+
+    Raises:
+        TokenHasExpired: If the 'exp' claim has passed
+        InvalidToken: If any other claim is invalid
+    """
+    for claim in ("iat", "exp", "nbf", "iss", "sub", "aud", "jti", "at_hash"):
+        if options.get(f"require_{claim}") and claim not in claims:
+            raise InvalidToken(f'missing required key "{claim}" among claims')
+
+    leeway = options.get("leeway", 0)
+    if isinstance(leeway, timedelta):
+        leeway = leeway.total_seconds()
+    now = time.time()
+
+    if options.get("verify_iat") and "iat" in claims:
+        _numeric_claim(claims, "iat", "Issued At")
+
+    if options.get("verify_nbf") and "nbf" in claims:
+        if _numeric_claim(claims, "nbf", "Not Before") > now + leeway:
+            raise InvalidToken("The token is not yet valid (nbf)")
+
+    if options.get("verify_exp") and "exp" in claims:
+        if _numeric_claim(claims, "exp", "Expiration Time") < now - leeway:
+            raise TokenHasExpired("Signature has expired.")
+
+    if options.get("verify_aud") and "aud" in claims:
+        audience_claims = claims["aud"]
+        if isinstance(audience_claims, str):
+            audience_claims = [audience_claims]
+        if not isinstance(audience_claims, list) or not all(isinstance(claim, str) for claim in audience_claims):
+            raise InvalidToken("Invalid claim format in token")
+        if audience not in audience_claims:
+            raise InvalidToken("Invalid audience")
+
+    if options.get("verify_iss") and issuer is not None:
+        if claims.get("iss") not in ((issuer,) if isinstance(issuer, str) else issuer):
+            raise InvalidToken("Invalid issuer")
+
+    if options.get("verify_sub") and "sub" in claims and not isinstance(claims["sub"], str):
+        raise InvalidToken("Subject must be a string.")
+
+    if options.get("verify_jti") and "jti" in claims and not isinstance(claims["jti"], str):
+        raise InvalidToken("JWT ID must be a string.")
+
+
+class _CryptographyKey:
+    """ A parsed key bound to one algorithm, see CryptographyEngine """
+
+    __slots__ = ("algorithm", "verify")
+
+    def __init__(self, algorithm: str, verify: callable):
+        self.algorithm = algorithm
+        self.verify = verify  # verify(signing_input: bytes, signature: bytes) -> bool
+
+
+class CryptographyEngine(JWTEngine):
+    """ Verifies tokens by calling the cryptography package directly. Parsing, signature verification and claim validation happen without any JWT library in between """
+
+    name = "cryptography"
+
+    _HASH_SIZES = {"256": 32, "384": 48, "512": 66}  # Bytes per ECDSA coordinate, ES512 uses P-521
+    _CURVES = {"ES256": "secp256r1", "ES384": "secp384r1", "ES512": "secp521r1"}
+    _JWK_CURVES = {"P-256": "SECP256R1", "P-384": "SECP384R1", "P-521": "SECP521R1"}
+    ALGORITHMS = ("HS256", "HS384", "HS512", "RS256", "RS384", "RS512", "PS256", "PS384", "PS512", "ES256", "ES384", "ES512", "EdDSA")
+
+    def construct_key(self, key: Any, algorithm: str) -> _CryptographyKey:
+        if algorithm not in self.ALGORITHMS:
+            raise InvalidToken(f"Unsupported algorithm {algorithm}")
+
+        if algorithm.startswith("HS"):
+            return self._hmac_key(self._secret(key, algorithm), algorithm)
+
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import ec, ed448, ed25519, padding, rsa
+        from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+
+        public_key = self._public_key(key, algorithm)
+
+        if algorithm.startswith(("RS", "PS")):
+            if not isinstance(public_key, rsa.RSAPublicKey):
+                raise InvalidToken(f"Invalid key for algorithm {algorithm}: not an RSA key")
+            hash_algorithm = getattr(hashes, f"SHA{algorithm[2:]}")()
+            if algorithm.startswith("RS"):
+                signature_padding = padding.PKCS1v15()
+            else:
+                signature_padding = padding.PSS(mgf=padding.MGF1(hash_algorithm), salt_length=hash_algorithm.digest_size)
+
+            def verify(signing_input: bytes, signature: bytes) -> bool:
+                try:
+                    public_key.verify(signature, signing_input, signature_padding, hash_algorithm)
+                    return True
+                except InvalidSignature:
+                    return False
+
+        elif algorithm.startswith("ES"):
+            if not isinstance(public_key, ec.EllipticCurvePublicKey) or public_key.curve.name != self._CURVES[algorithm]:
+                raise InvalidToken(f"Invalid key for algorithm {algorithm}: not a {self._CURVES[algorithm]} key")
+            size = self._HASH_SIZES[algorithm[2:]]
+            signature_algorithm = ec.ECDSA(getattr(hashes, f"SHA{algorithm[2:]}")())
+
+            def verify(signing_input: bytes, signature: bytes) -> bool:
+                if len(signature) != 2 * size:  # JWS uses the raw R || S encoding, cryptography expects DER
+                    return False
+                der_signature = encode_dss_signature(int.from_bytes(signature[:size], "big"), int.from_bytes(signature[size:], "big"))
+                try:
+                    public_key.verify(der_signature, signing_input, signature_algorithm)
+                    return True
+                except InvalidSignature:
+                    return False
+
+        else:  # EdDSA
+            if not isinstance(public_key, (ed25519.Ed25519PublicKey, ed448.Ed448PublicKey)):
+                raise InvalidToken(f"Invalid key for algorithm {algorithm}: not an Ed25519 or Ed448 key")
+
+            def verify(signing_input: bytes, signature: bytes) -> bool:
+                try:
+                    public_key.verify(signature, signing_input)
+                    return True
+                except InvalidSignature:
+                    return False
+
+        return _CryptographyKey(algorithm, verify)
+
+    @staticmethod
+    def _hmac_key(secret: bytes, algorithm: str) -> _CryptographyKey:
+        digest = f"sha{algorithm[2:]}"
+
+        def verify(signing_input: bytes, signature: bytes) -> bool:
+            return hmac.compare_digest(hmac.digest(secret, signing_input, digest), signature)
+
+        return _CryptographyKey(algorithm, verify)
+
+    @staticmethod
+    def _secret(key: Any, algorithm: str) -> bytes:
+        if isinstance(key, dict):
+            if key.get("kty") != "oct":
+                raise InvalidToken(f"Invalid key for algorithm {algorithm}: not an oct JWK")
+            return b64url_decode(key["k"])
+
+        secret = key.encode() if isinstance(key, str) else key
+        if not isinstance(secret, bytes):
+            raise InvalidToken(f"Invalid key for algorithm {algorithm}: expected a string")
+
+        if b"-----BEGIN" in secret or secret.startswith(b"ssh-"):  # Public keys are public, using them as HMAC secret would allow forging tokens
+            raise InvalidToken(f"Invalid key for algorithm {algorithm}: the specified key is an asymmetric key or x509 certificate and should not be used as an HMAC secret")
+        return secret
+
+    def _public_key(self, key: Any, algorithm: str) -> Any:
+        from cryptography import x509
+        from cryptography.exceptions import UnsupportedAlgorithm
+        from cryptography.hazmat.primitives import serialization
+
+        try:
+            if isinstance(key, dict):
+                return self._public_key_from_jwk(key)
+
+            if hasattr(key, "public_key"):  # Private key object of cryptography
+                return key.public_key()
+
+            if not isinstance(key, (str, bytes)):  # Public key object of cryptography
+                return key
+
+            data = key.encode() if isinstance(key, str) else key
+            if b"CERTIFICATE" in data:
+                return x509.load_pem_x509_certificate(data).public_key()
+            if b"PRIVATE KEY" in data:
+                return serialization.load_pem_private_key(data, password=None).public_key()
+            if data.startswith(b"ssh-"):
+                return serialization.load_ssh_public_key(data)
+            return serialization.load_pem_public_key(data)
+
+        except (ValueError, TypeError, KeyError, binascii.Error, UnsupportedAlgorithm) as error:
+            raise InvalidToken(f"Invalid key for algorithm {algorithm}: {error}") from None
+
+    def _public_key_from_jwk(self, key: dict) -> Any:
+        from cryptography.hazmat.primitives.asymmetric import ec, ed448, ed25519, rsa
+
+        def number(name: str) -> int:
+            return int.from_bytes(b64url_decode(key[name]), "big")
+
+        key_type = key.get("kty")
+        if key_type == "RSA":
+            return rsa.RSAPublicNumbers(number("e"), number("n")).public_key()
+        if key_type == "EC":
+            curve = getattr(ec, self._JWK_CURVES[key["crv"]])()
+            return ec.EllipticCurvePublicNumbers(number("x"), number("y"), curve).public_key()
+        if key_type == "OKP" and key.get("crv") == "Ed25519":
+            return ed25519.Ed25519PublicKey.from_public_bytes(b64url_decode(key["x"]))
+        if key_type == "OKP" and key.get("crv") == "Ed448":
+            return ed448.Ed448PublicKey.from_public_bytes(b64url_decode(key["x"]))
+        raise ValueError(f"Unsupported JWK key type {key_type}")
+
+    @staticmethod
+    def _split(token: str):
+        if isinstance(token, bytes):
+            token = token.decode("latin-1")
+
+        segments = token.split(".")
+        if len(segments) != 3:
+            raise InvalidToken("Not enough segments")
+
+        header_segment, payload_segment, signature_segment = segments
+        try:
+            header = json.loads(b64url_decode(header_segment))
+        except (ValueError, binascii.Error):
+            raise InvalidToken("Invalid header padding") from None
+
+        if not isinstance(header, dict):
+            raise InvalidToken("Invalid header string: must be a json object")
+
+        return header, header_segment, payload_segment, signature_segment
+
+    def get_unverified_header(self, token: str) -> dict:
+        return self._split(token)[0]
+
+    def decode(self, token: str, key: _CryptographyKey, algorithms: List[str] = None, options: dict = None, audience: str = None, issuer: str = None) -> dict:
+        options = self.merge_options(options)
+        header, header_segment, payload_segment, signature_segment = self._split(token)
+
+        if options["verify_signature"]:
+            algorithm = header.get("alg")
+            if algorithms is not None and algorithm not in algorithms:
+                raise InvalidToken("The specified alg value is not allowed")
+            if algorithm != key.algorithm:
+                raise InvalidToken("The key does not match the algorithm of the token")
+
+            try:
+                signature = b64url_decode(signature_segment)
+            except (ValueError, binascii.Error):
+                raise InvalidToken("Invalid crypto padding") from None
+
+            if not key.verify(f"{header_segment}.{payload_segment}".encode(), signature):
+                raise InvalidToken("Signature verification failed.")
+
+        try:
+            claims = json.loads(b64url_decode(payload_segment))
+        except (ValueError, binascii.Error):
+            raise InvalidToken("Invalid payload string") from None
+
+        if not isinstance(claims, dict):
+            raise InvalidToken("Invalid payload string: must be a json object")
+
+        try:
+            validate_claims(claims, options, audience=audience, issuer=issuer)
+        except TokenHasExpired as error:
+            raise _expired(error, claims, options, audience, issuer) from None
+        return claims
+
+
+ENGINES = {engine.name: engine for engine in (CryptographyEngine, PyJWTEngine, JoseEngine)}
+_PREFERENCE = (("cryptography", CryptographyEngine), ("jwt", PyJWTEngine), ("jose", JoseEngine))  # Fastest first, see benchmarks/bench_engines.py
+_default_engine: Optional[JWTEngine] = None
+
+
+def get_engine(engine: str or JWTEngine = None) -> JWTEngine:
+    """ Resolves the engine to verify tokens with
+
+    Args:
+        engine (str or JWTEngine): Optional: An engine or the name of one ("cryptography", "pyjwt" or "python-jose"). Default will pick the fastest engine whose library is
+                                   installed, in this order
+
+    Returns:
+        JWTEngine: The engine
+    """
+    global _default_engine
+
+    if isinstance(engine, JWTEngine):
+        return engine
+
+    if engine is not None:
+        try:
+            return ENGINES[engine]()
+        except KeyError:
+            raise ValueError(f"Unknown engine {engine}, choose one of {', '.join(ENGINES)}") from None
+
+    if _default_engine is None:  # Chosen once at startup
+        _default_engine = next(engine_class() for module, engine_class in _PREFERENCE if importlib.util.find_spec(module) is not None)
+    return _default_engine
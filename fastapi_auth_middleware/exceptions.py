@@ -2,5 +2,24 @@ class AuthenticationHeaderMissing(Exception):
     pass
 
 
-class TokenHasExpired(Exception):
+class InvalidToken(Exception):
+    pass
+
+
+class TokenHasExpired(InvalidToken):
+
+    def __init__(self, *args, claims: dict = None):
+        super().__init__(*args)
+        self.claims = claims  # Claims of the expired token if its signature and all its other claims are valid, None if they're unknown
+
+
+class ServiceOverloaded(Exception):
+    pass
+
+
+class VerificationQueueFull(ServiceOverloaded):
+    pass
+
+
+class IntrospectionFailed(ServiceOverloaded):
     pass
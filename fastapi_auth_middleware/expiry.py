@@ -0,0 +1,129 @@
+import asyncio
+import heapq
+import itertools
+import time
+import weakref
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+
+class ScheduledExpiry:
+    """ Handle of a callback scheduled with ExpiryScheduler.schedule """
+
+    __slots__ = ("expires_at", "callback", "cancelled", "fired", "_wheel")
+
+    def __init__(self, wheel: "_Wheel", expires_at: float, callback: Callable[[], Awaitable]):
+        self.expires_at = expires_at
+        self.callback = callback
+        self.cancelled = False
+        self.fired = False
+        self._wheel = wheel
+
+    def cancel(self):
+        """ Cancels the callback in O(1). The entry stays in the heap until it is popped or the heap is compacted """
+        if self.cancelled or self.fired:
+            return
+        self.cancelled = True
+        self.callback = None  # Don't keep the connection alive
+        self._wheel.cancelled += 1
+        self._wheel.compact()
+
+
+class _Wheel:
+    """ Heap of scheduled expiries of one event loop, driven by a single timer """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, clock: Callable[[], float] = time.time):
+        self.loop = loop
+        self.clock = clock
+        self.heap: List[Tuple[float, int, ScheduledExpiry]] = []
+        self.cancelled = 0  # Cancelled entries that are still in the heap
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.timer_at: Optional[float] = None
+        self.tasks: Set[asyncio.Task] = set()
+        self._counter = itertools.count()  # Tie breaker, entries with the same expiry are never compared
+
+    def push(self, entry: ScheduledExpiry):
+        heapq.heappush(self.heap, (entry.expires_at, next(self._counter), entry))
+        if self.timer_at is None or entry.expires_at < self.timer_at:  # New earliest expiry
+            self.arm()
+
+    def compact(self):
+        if self.cancelled > 64 and self.cancelled * 2 > len(self.heap):  # Mostly garbage, rebuild in O(n)
+            self.heap = [item for item in self.heap if not item[2].cancelled]
+            heapq.heapify(self.heap)
+            self.cancelled = 0
+
+    def arm(self):
+        while self.heap and self.heap[0][2].cancelled:  # Lazy deletion
+            heapq.heappop(self.heap)
+            self.cancelled -= 1
+
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = self.timer_at = None
+
+        if self.heap:
+            self.timer_at = self.heap[0][0]
+            delay = max(0.0, self.timer_at - self.clock())  # Expiries are wall clock timestamps, the loop runs on a monotonic clock
+            self.timer = self.loop.call_at(self.loop.time() + delay, self.fire)
+
+    def fire(self):
+        self.timer = self.timer_at = None
+        now = self.clock()
+
+        while self.heap and self.heap[0][0] <= now:
+            _, _, entry = heapq.heappop(self.heap)
+            if entry.cancelled:
+                self.cancelled -= 1
+                continue
+
+            entry.fired = True
+            task = self.loop.create_task(entry.callback())
+            self.tasks.add(task)  # Keep a reference until the callback is done
+            task.add_done_callback(self.tasks.discard)
+            entry.callback = None
+
+        self.arm()
+
+
+class ExpiryScheduler:
+    """ Runs a callback when a token expires, e.g. to close a websocket that was authenticated with it.
+
+    All expiries of an event loop are kept in one heap that is driven by a single timer, instead of one task per connection. Scheduling is O(log n), cancelling is O(1)
+    and cancelled entries are dropped lazily.
+    """
+
+    def __init__(self, close_code: int = 1008, reason: str = "Token has expired", clock: Callable[[], float] = time.time):
+        """ ExpiryScheduler Constructor
+
+        Args:
+            close_code (int): Optional: Close code for websockets whose token has expired. Default is 1008 (policy violation)
+            reason (str): Optional: Close reason for websockets whose token has expired. Default is "Token has expired"
+            clock (Callable[[], float]): Optional: Returns the current Unix timestamp that expiries are compared with. Default is time.time
+        """
+        self.close_code = close_code
+        self.reason = reason
+        self.clock = clock
+        self._wheels: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()  # {event loop: _Wheel}
+
+    def schedule(self, expires_at: float, callback: Callable[[], Awaitable]) -> ScheduledExpiry:
+        """ Schedules a callback on the running event loop
+
+        Args:
+            expires_at (float): Unix timestamp, most likely the token's 'exp' claim
+            callback (Callable[[], Awaitable]): Coroutine function without arguments, runs as task once expires_at has passed
+
+        Returns:
+            ScheduledExpiry: Handle to cancel the callback, e.g. when the connection is closed before the token expires
+        """
+        loop = asyncio.get_running_loop()
+        wheel = self._wheels.get(loop)
+        if wheel is None:
+            wheel = self._wheels[loop] = _Wheel(loop, self.clock)
+
+        entry = ScheduledExpiry(wheel, expires_at, callback)
+        wheel.push(entry)
+        return entry
+
+    def __len__(self) -> int:
+        """ Number of scheduled callbacks that have neither fired nor been cancelled """
+        return sum(len(wheel.heap) - wheel.cancelled for wheel in self._wheels.values())
@@ -0,0 +1,18 @@
+from typing import Optional
+
+from starlette.types import Scope
+
+
+def get_authorization_header(scope: Scope) -> Optional[str]:
+    """ Scans the raw ASGI headers once for the 'Authorization' header. Avoids creating a Headers object for every request
+
+    Args:
+        scope (Scope): The ASGI scope of the request
+
+    Returns:
+        str: The value of the first 'Authorization' header or None if the request has none
+    """
+    for name, value in scope["headers"]:
+        if name == b"authorization":  # ASGI servers lowercase header names
+            return value.decode("latin-1")
+    return None
@@ -0,0 +1,160 @@
+import asyncio
+import time
+from typing import Optional, Tuple
+
+from starlette.authentication import BaseUser
+from starlette.datastructures import Headers
+
+from fastapi_auth_middleware.cache import TokenCache
+from fastapi_auth_middleware.concurrency import SingleFlight
+from fastapi_auth_middleware.exceptions import AuthenticationHeaderMissing, IntrospectionFailed, InvalidToken, TokenHasExpired
+from fastapi_auth_middleware.middleware import FastAPIUser
+from fastapi_auth_middleware.scopes import EMPTY_SCOPES, ScopeSet, parse_scopes
+
+
+class IntrospectionBackend:
+    """ Verifies opaque access tokens with the OAuth2 token introspection endpoint (RFC 7662) of the authorization server.
+
+    All introspections share one connection pool, so requests reuse open connections instead of connecting for every request. Active tokens are cached until their
+    'exp', concurrent introspections of the same token share one HTTP request. Pass the bound verify_header method to the AuthMiddleware:
+
+    Examples:
+        ```python
+        introspection = IntrospectionBackend("https://idp.example.com/oauth2/introspect", client_id="api", client_secret="secret")
+        app.add_middleware(AuthMiddleware, verify_header=introspection.verify_header)
+        ```
+
+    Requires httpx: `pip install fastapi-auth-middleware[introspection]`
+    """
+
+    def __init__(self, url: str, client_id: str = None, client_secret: str = None, get_scopes: callable = None, get_user: callable = None,
+                 token_cache: TokenCache = None, coalesce: bool = True, timeout: float = 5, connect_timeout: float = None, max_connections: int = 100):
+        """ IntrospectionBackend Constructor. The HTTP client is created on first use
+
+        Args:
+            url (str): The introspection endpoint
+            client_id (str): Optional: Client id to authenticate at the endpoint with HTTP Basic auth. Default will not authenticate
+            client_secret (str): Optional: Client secret to authenticate at the endpoint with HTTP Basic auth
+            get_scopes (callable): Optional: A method that returns a list of scopes based on the introspection response. Default will split its 'scope' field
+            get_user (callable): Optional: A method that returns a user object based on the introspection response. Default will create a FastAPIUser with 'sub' as id
+            token_cache (TokenCache): Optional: Cache for active tokens. Entries expire with the response's 'exp', bound them with TokenCache(ttl=...) to notice revoked
+                                      tokens earlier. Responses without 'exp' are only cached with a ttl. Default is a TokenCache with 1024 entries
+            coalesce (bool): Optional: Share one introspection between concurrent requests with the same token. Default is True
+            timeout (float): Optional: Seconds an introspection may take in total. Default is 5
+            connect_timeout (float): Optional: Seconds to establish a connection. Default is timeout
+            max_connections (int): Optional: Maximum number of connections to the endpoint. Default is 100
+        """
+        import httpx  # Optional dependency, only needed for introspection
+
+        self._httpx = httpx
+        self.url = url
+        self.auth = (client_id, client_secret or "") if client_id is not None else None
+        self.get_scopes = self._get_scopes if get_scopes is None else get_scopes
+        self.get_user = self._get_user if get_user is None else get_user
+        self.token_cache = TokenCache() if token_cache is None else token_cache
+        self.single_flight = SingleFlight() if coalesce else None
+        self.timeout = httpx.Timeout(timeout, connect=timeout if connect_timeout is None else connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @staticmethod
+    def _get_scopes(response: dict) -> ScopeSet:
+        scope = response.get("scope")
+        if not isinstance(scope, str):
+            return EMPTY_SCOPES
+        return parse_scopes(scope)
+
+    @staticmethod
+    def _get_user(response: dict) -> FastAPIUser:
+        return FastAPIUser(first_name=None, last_name=None, user_id=response.get("sub"))
+
+    def _get_client(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:  # Pooled connections are bound to the event loop that opened them
+            if self._client is not None:
+                self._discard_client()
+            self._loop = loop
+            self._client = self._httpx.AsyncClient(timeout=self.timeout, limits=self.limits, auth=self.auth)
+        return self._client
+
+    def _discard_client(self):
+        """ Drops the client of another event loop. Its connections can only be closed by the loop that opened them, so they are closed there if it's still running """
+        client, loop = self._client, self._loop
+        self._client = self._loop = None
+
+        if loop.is_running():  # Serves another thread, close the connections without waiting for it
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        # Otherwise the loop is stopped or closed, its connections are released together with the client
+
+    async def verify_header(self, headers: Headers) -> Tuple[ScopeSet, BaseUser]:
+        """ Introspects the bearer token of a request, signature of the verify_header function of the AuthMiddleware
+
+        Args:
+            headers (Headers): The headers of the request
+
+        Returns:
+            Tuple[ScopeSet, BaseUser]: The scopes and the user of the token
+
+        Raises:
+            AuthenticationHeaderMissing: If the request has no 'Authorization' header
+            InvalidToken: If the token is not active
+            IntrospectionFailed: If the endpoint could not be reached or answered with an error. The AuthMiddleware answers it with HTTP 503 and a 'Retry-After' header,
+                                 as the token might be valid
+        """
+        auth_header = headers.get("Authorization")
+        if auth_header is None:
+            raise AuthenticationHeaderMissing
+
+        response = await self.introspect(auth_header.split(" ")[-1])
+        return self.get_scopes(response), self.get_user(response)
+
+    async def introspect(self, token: str) -> dict:
+        """ Introspects a token, from the cache if possible
+
+        Args:
+            token (str): A raw token
+
+        Returns:
+            dict: The introspection response of an active token
+
+        Raises:
+            InvalidToken: If the token is not active
+            IntrospectionFailed: If the endpoint could not be reached or answered with an error
+        """
+        cached = self.token_cache.get(token)
+        if cached is not None:
+            return cached
+
+        if self.single_flight is not None:  # Concurrent requests with the same token share one introspection
+            return await self.single_flight.run(token, lambda: self._introspect(token))
+        return await self._introspect(token)
+
+    async def _introspect(self, token: str) -> dict:
+        try:
+            response = await self._get_client().post(self.url, data={"token": token, "token_type_hint": "access_token"}, headers={"Accept": "application/json"})
+            response.raise_for_status()
+            introspection = response.json()
+        except self._httpx.HTTPError as error:
+            raise IntrospectionFailed(f"Introspection failed: {error!r}") from None
+        except ValueError:  # Not JSON
+            raise IntrospectionFailed("Introspection endpoint returned an invalid response") from None
+
+        if not isinstance(introspection, dict) or introspection.get("active") is not True:
+            raise InvalidToken("Token is not active")
+
+        expires_at = introspection.get("exp")
+        if isinstance(expires_at, (int, float)):
+            if expires_at <= time.time():  # Some servers report lapsed tokens as active
+                raise TokenHasExpired("Token has expired")
+            self.token_cache.set(token, introspection, expires_at=expires_at)
+        elif self.token_cache.ttl is not None:  # Without 'exp' the token is only cached for the ttl
+            self.token_cache.set(token, introspection)
+
+        return introspection
+
+    async def aclose(self):
+        """ Closes the pooled connections """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = self._loop = None
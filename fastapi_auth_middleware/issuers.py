@@ -0,0 +1,117 @@
+import binascii
+import json
+from typing import Dict, Optional, Tuple
+
+from starlette.authentication import AuthenticationBackend, AuthCredentials, BaseUser
+from starlette.requests import HTTPConnection
+
+from fastapi_auth_middleware.encoding import b64url_decode
+from fastapi_auth_middleware.exceptions import AuthenticationHeaderMissing, InvalidToken
+
+
+class UnknownIssuer(InvalidToken):
+    pass
+
+
+def get_unverified_issuer(token: str) -> Optional[str]:
+    """ Reads the 'iss' claim of a token without verifying it, only to choose the keys to verify it with
+
+    Args:
+        token (str): A raw token
+
+    Returns:
+        str: The issuer or None if the token has none
+
+    Raises:
+        InvalidToken: If the token is malformed
+    """
+    try:
+        payload = json.loads(b64url_decode(token.split(".", 2)[1]))
+    except (IndexError, binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidToken("Invalid payload padding") from None
+
+    if not isinstance(payload, dict):
+        raise InvalidToken("Invalid payload string: must be a json object")
+
+    issuer = payload.get("iss")
+    return issuer if isinstance(issuer, str) else None
+
+
+class MultiIssuerBackend(AuthenticationBackend):
+    """ Dispatches tokens to the backend of their issuer. The unverified 'iss' claim is read once and looked up in a dict, so the cost per request does not depend
+    on the number of issuers. The chosen backend verifies the token with the issuer's keys, so a token can't pick the keys of an issuer it wasn't signed by.
+    """
+
+    def __init__(self, backends: Dict[str, AuthenticationBackend]):
+        """ MultiIssuerBackend Constructor
+
+        Args:
+            backends (Dict[str, AuthenticationBackend]): {issuer: backend}, most likely OAuth2Backends. Tokens of other issuers are rejected
+        """
+        self.backends = backends
+
+    def backend_for(self, token: str) -> AuthenticationBackend:
+        """ Looks up the backend of a token's issuer
+
+        Args:
+            token (str): A raw token
+
+        Returns:
+            AuthenticationBackend: The backend of the token's issuer
+
+        Raises:
+            UnknownIssuer: If the token's issuer is not configured
+        """
+        backend = self.backends.get(get_unverified_issuer(token))
+        if backend is None:
+            raise UnknownIssuer("The token's issuer is not accepted")
+        return backend
+
+    async def authenticate(self, conn: HTTPConnection) -> Tuple[AuthCredentials, BaseUser]:
+        """ The authenticate method is invoked each time a route is called that the middleware is applied to.
+
+        Args:
+            conn (HTTPConnection): An HTTP connection of FastAPI/Starlette
+
+        Returns:
+            Tuple[AuthCredentials, BaseUser]: A tuple of AuthCredentials (scopes) and a user object that is or inherits from BaseUser
+        """
+        return await self.authenticate_header(conn.headers.get("Authorization"))
+
+    async def authenticate_header(self, auth_header: str) -> Tuple[AuthCredentials, BaseUser]:
+        """ Same as authenticate, but takes the value of the 'Authorization' header instead of an HTTPConnection
+
+        Args:
+            auth_header (str): The 'Authorization' HTTP header, None if the request has none
+
+        Returns:
+            Tuple[AuthCredentials, BaseUser]: A tuple of AuthCredentials (scopes) and a user object that is or inherits from BaseUser
+        """
+        _, credentials, user = await self.verify_header(auth_header)
+        return credentials, user
+
+    async def verify_header(self, auth_header: str) -> Tuple[dict, AuthCredentials, BaseUser]:
+        """ Same as authenticate_header, but also returns the decoded token
+
+        Args:
+            auth_header (str): The 'Authorization' HTTP header, None if the request has none
+
+        Returns:
+            Tuple[dict, AuthCredentials, BaseUser]: The decoded token, the AuthCredentials (scopes) and the user
+        """
+        if auth_header is None:
+            raise AuthenticationHeaderMissing
+
+        return await self.backend_for(auth_header.split(" ")[-1]).verify_header(auth_header)
+
+    async def verify_expired_header(self, auth_header: str, claims: dict = None) -> Tuple[dict, AuthCredentials, BaseUser]:
+        """ Same as verify_header, but accepts a token whose 'exp' has passed. See OAuth2Backend.verify_expired_header
+
+        Args:
+            auth_header (str): The 'Authorization' HTTP header
+            claims (dict): Optional: The claims of the TokenHasExpired that verify_header raised for the token, so it isn't verified again
+
+        Returns:
+            Tuple[dict, AuthCredentials, BaseUser]: The decoded token, the AuthCredentials (scopes) and the user
+        """
+        return await self.backend_for(auth_header.split(" ")[-1]).verify_expired_header(auth_header, claims=claims)
@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, List, Optional
+
+from fastapi_auth_middleware.engines import JWTEngine, get_engine
+from fastapi_auth_middleware.keys import Keyring
+
+
+class JWKSKeySource:
+    """ Keyring backed by a JWK Set that is loaded from a URL or a file and refreshed in the background
+
+    Requests only ever read the current keyring. A refresh builds a new keyring off the event loop and swaps it in with a single assignment, so keys can be rotated without
+    restarting the process.
+    """
+
+    def __init__(
+            self,
+            url: str = None,
+            path: str = None,
+            algorithms: str or List[str] = None,
+            refresh_interval: float = 300,
+            min_refresh_interval: float = 30,
+            timeout: float = 5,
+            engine: str or JWTEngine = None
+    ):
+        """ JWKSKeySource Constructor. Loads the JWK Set once and starts the background refresh
+
+        Args:
+            url (str): Optional: URL of the JWK Set, most likely the 'jwks_uri' of your OAuth2 Service. Either url or path is required
+            path (str): Optional: Path of a file containing the JWK Set
+            algorithms (str or List[str]): Optional: The allowed algorithms. Keys are parsed for each of them up front
+            refresh_interval (float): Optional: Seconds between background refreshes. None disables the background refresh. Default is 300
+            min_refresh_interval (float): Optional: Minimum seconds between two refreshes that are triggered by tokens with an unknown kid. Default is 30
+            timeout (float): Optional: Timeout in seconds for fetching the JWK Set from the URL. Default is 5
+            engine (str or JWTEngine): Optional: The engine that parses the keys. Default is the fastest installed engine, see get_engine
+        """
+        if (url is None) == (path is None):
+            raise ValueError("Either url or path is required")
+
+        self.url = url
+        self.path = path
+        self.algorithms = algorithms
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self.engine = get_engine(engine)
+        self.last_error: Optional[Exception] = None  # Error of the latest failed refresh, the previous keyring stays active
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jwks-refresh")  # Serializes refreshes
+        self._pending_refresh: Optional[Future] = None
+        self._last_refresh = float("-inf")  # The initial load doesn't count, keys rotated right after startup are picked up by the first unknown kid
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.keyring: Keyring = Keyring.from_jwks(self._load(), algorithms=algorithms, engine=self.engine)  # Fail early on startup
+
+        if refresh_interval is not None:
+            self.start()
+
+    def _load(self) -> dict:
+        if self.path is not None:
+            with open(self.path) as jwks_file:
+                return json.load(jwks_file)
+
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            return json.load(response)
+
+    def refresh(self) -> bool:
+        """ Loads the JWK Set and swaps the keyring. Performs blocking I/O, never call this on the event loop
+
+        Returns:
+            bool: True if the keyring has been replaced, False if loading failed and the previous keyring is still active
+        """
+        self._last_refresh = time.monotonic()
+
+        try:
+            keyring = Keyring.from_jwks(self._load(), algorithms=self.algorithms, engine=self.engine)
+        except Exception as error:  # Keep serving the previous keys, e.g. if the OAuth2 Service is temporarily unavailable
+            self.last_error = error
+            return False
+
+        self.keyring = keyring  # Atomic swap, requests either see the old or the new keyring
+        self.last_error = None
+        return True
+
+    def _refresh_periodically(self):
+        while not self._stopped.wait(self.refresh_interval):
+            self._executor.submit(self.refresh).result()
+
+    def start(self):
+        """ Starts the background refresh thread if it is not running yet """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._refresh_periodically, name="jwks-refresh-timer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stops the background refresh """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    async def refresh_for_kid(self, kid: Optional[str]) -> bool:
+        """ Refreshes the keyring because a token references an unknown kid. Concurrent calls share one refresh and refreshes are rate limited by min_refresh_interval
+
+        Args:
+            kid (str): The unknown kid
+
+        Returns:
+            bool: True if the kid is known after the refresh
+        """
+        if kid in self.keyring:  # Another request already picked up the new key
+            return True
+
+        pending = self._pending_refresh
+        if pending is None or pending.done():
+            if time.monotonic() - self._last_refresh < self.min_refresh_interval:  # Rate limited, e.g. tokens with random kids
+                return False
+            pending = self._pending_refresh = self._executor.submit(self.refresh)
+
+        await asyncio.wrap_future(pending)  # Waits without blocking the event loop
+        return kid in self.keyring
+
+    def get(self, kid: Optional[str], algorithm: str) -> Any:
+        """ Returns the parsed key for a token from the current keyring. See Keyring.get """
+        return self.keyring.get(kid, algorithm)
+
+    def source(self, kid: Optional[str], algorithm: str) -> Any:
+        """ Returns the unparsed key for a token from the current keyring. See Keyring.source """
+        return self.keyring.source(kid, algorithm)
+
+    @property
+    def fingerprint(self) -> str:
+        """ SHA-256 digest of where the JWK Set is loaded from and the allowed algorithms. Unlike Keyring.fingerprint, it doesn't change when the keys are rotated """
+        return hashlib.sha256(json.dumps([self.url, self.path, self.algorithms]).encode()).hexdigest()
+
+    def __contains__(self, kid: Optional[str]) -> bool:
+        return kid in self.keyring
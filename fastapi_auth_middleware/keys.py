@@ -0,0 +1,145 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi_auth_middleware.engines import JWTEngine, get_engine
+from fastapi_auth_middleware.exceptions import InvalidToken
+
+
+class UnknownKeyId(InvalidToken):
+    """ Raised when a token references a key id that is not part of the keyring """
+    pass
+
+
+class Keyring:
+    """ Public keys parsed once into ready-to-use verifier objects, indexed by the 'kid' JWT header """
+
+    def __init__(self, keys: Any, algorithms: str or List[str] = None, engine: str or JWTEngine = None):
+        """ Keyring Constructor
+
+        Args:
+            keys (Any): The verification keys. Either a single key (PEM string, JWK dict), a JWK Set ({"keys": [...]}) or a dict of {kid: key}. A key without a kid (or the only key)
+                        is used for all tokens whose kid is unknown to the keyring
+            algorithms (str or List[str]): Optional: The allowed algorithms. Keys are parsed for each of them up front. Default will parse keys on first use for the token's algorithm
+            engine (str or JWTEngine): Optional: The engine that parses the keys and verifies tokens with them. Default is the fastest installed engine, see get_engine
+        """
+        self.algorithms = [algorithms] if isinstance(algorithms, str) else algorithms
+        self.engine = get_engine(engine)
+        self._keys: Dict[Optional[str], Any] = self._index(keys)
+        self._parsed: Dict[Tuple[Optional[str], str], Any] = {}
+
+        is_jwks = isinstance(keys, dict) and "keys" in keys
+        self._has_fallback = None in self._keys or len(self._keys) == 1  # A key without kid or a single key verifies tokens with any kid, as python-jose would
+        self._fallback_kid = None if None in self._keys else next(iter(self._keys), None)
+        self._fallback_for_any_kid = None in self._keys or not is_jwks  # A rotated JWK Set must not verify new kids with its old key
+
+        for kid, key in self._keys.items():  # Parse up front so requests only do a dict lookup
+            for algorithm in self._algorithms_for(key):
+                try:
+                    self._parsed[(kid, algorithm)] = self._construct(key, algorithm)
+                except InvalidToken:  # Key does not fit this algorithm, tokens using it are rejected on lookup
+                    pass
+
+    @classmethod
+    def from_jwks(cls, jwks: dict, algorithms: str or List[str] = None, engine: str or JWTEngine = None) -> "Keyring":
+        """ Creates a keyring from a JWK Set
+
+        Args:
+            jwks (dict): A JWK Set as defined in RFC 7517, e.g. the response of a 'jwks_uri'
+            algorithms (str or List[str]): Optional: The allowed algorithms
+            engine (str or JWTEngine): Optional: The engine that parses the keys. Default is the fastest installed engine
+
+        Returns:
+            Keyring: A keyring containing all keys of the set
+        """
+        return cls({"keys": jwks.get("keys", [])}, algorithms=algorithms, engine=engine)
+
+    @staticmethod
+    def _index(keys: Any) -> Dict[Optional[str], Any]:
+        if isinstance(keys, dict) and "keys" in keys:  # JWK Set
+            return {key.get("kid"): key for key in keys["keys"]}
+
+        if isinstance(keys, dict) and "kty" in keys:  # Single JWK
+            return {keys.get("kid"): keys}
+
+        if isinstance(keys, dict):  # Mapping of kid to key
+            return dict(keys)
+
+        return {None: keys}  # Single key without kid
+
+    def _algorithms_for(self, key: Any) -> List[str]:
+        if self.algorithms is not None:
+            return self.algorithms
+
+        if isinstance(key, dict) and "alg" in key:
+            return [key["alg"]]
+
+        return []  # Algorithm is unknown until the first token arrives
+
+    def _construct(self, key: Any, algorithm: str) -> Any:
+        return self.engine.construct_key(key, algorithm)
+
+    @property
+    def kids(self) -> List[Optional[str]]:
+        """ The key ids known to this keyring. None stands for the default key """
+        return list(self._keys)
+
+    @property
+    def fingerprint(self) -> str:
+        """ SHA-256 digest of the keys and the allowed algorithms, the same in every process that loads the same keys """
+        keys = [[kid, key] for kid, key in self._keys.items()]  # Keys that aren't PEM strings, secrets or JWKs are identified by their str
+        return hashlib.sha256(json.dumps([keys, self.algorithms], sort_keys=True, default=str).encode()).hexdigest()
+
+    def __contains__(self, kid: Optional[str]) -> bool:
+        return kid in self._keys
+
+    def _resolve(self, kid: Optional[str], algorithm: str) -> Optional[str]:
+        """ Returns the kid of the key that verifies tokens with the given kid and algorithm """
+        if algorithm is None:
+            raise InvalidToken("No algorithm was specified in the JWS header.")
+
+        if self.algorithms is not None and algorithm not in self.algorithms:
+            raise InvalidToken("The specified alg value is not allowed")
+
+        if kid not in self._keys:
+            if not self._has_fallback or (kid is not None and not self._fallback_for_any_kid):
+                raise UnknownKeyId(f"Unknown key id: {kid}")
+            kid = self._fallback_kid  # Fall back to the default key
+
+        return kid
+
+    def get(self, kid: Optional[str], algorithm: str) -> Any:
+        """ Returns the parsed key for a token
+
+        Args:
+            kid (str): The 'kid' header of the token, may be None
+            algorithm (str): The 'alg' header of the token
+
+        Returns:
+            Any: A key object of the keyring's engine that can be passed to its decode method
+
+        Raises:
+            InvalidToken: If the algorithm is not allowed or the key does not fit the algorithm
+            UnknownKeyId: If no key matches the kid
+        """
+        parsed = self._parsed.get((kid, algorithm))
+        if parsed is not None:  # Fast path
+            return parsed
+
+        kid = self._resolve(kid, algorithm)
+        parsed = self._parsed.get((kid, algorithm))
+        if parsed is None:
+            parsed = self._parsed[(kid, algorithm)] = self._construct(self._keys[kid], algorithm)
+        return parsed
+
+    def source(self, kid: Optional[str], algorithm: str) -> Any:
+        """ Returns the key as it was passed to the keyring, e.g. to parse it again in another process. Lookup rules are the same as for get
+
+        Args:
+            kid (str): The 'kid' header of the token, may be None
+            algorithm (str): The 'alg' header of the token
+
+        Returns:
+            Any: The unparsed key, a PEM string, an HMAC secret or a JWK dict
+        """
+        return self._keys[self._resolve(kid, algorithm)]
@@ -0,0 +1,77 @@
+from typing import Any, Callable, List
+
+from starlette.authentication import AuthCredentials, BaseUser
+
+from fastapi_auth_middleware.scopes import ScopeSet, intern_scopes
+
+_UNRESOLVED = object()
+
+
+class LazyAuthCredentials(AuthCredentials):
+    """ AuthCredentials whose scopes are only computed when they are accessed for the first time """
+
+    def __init__(self, resolve: Callable[[], List[str]]):  # noqa  # AuthCredentials.__init__ would resolve the scopes right away
+        """ LazyAuthCredentials Constructor
+
+        Args:
+            resolve (Callable[[], List[str]]): Synchronous function without arguments that returns the scopes
+        """
+        self._resolve = resolve
+        self._scopes = _UNRESOLVED
+
+    @property
+    def resolved(self) -> bool:
+        """ Whether the scopes have been computed already """
+        return self._scopes is not _UNRESOLVED
+
+    @property
+    def scopes(self) -> ScopeSet:
+        if self._scopes is _UNRESOLVED:
+            self._scopes = intern_scopes(self._resolve())
+        return self._scopes
+
+    @scopes.setter
+    def scopes(self, scopes: List[str]):
+        self._scopes = intern_scopes(scopes)
+
+
+class LazyUser(BaseUser):
+    """ Proxy for a user that is only created when one of its attributes is accessed for the first time. All attribute access is forwarded to the resolved user """
+
+    def __init__(self, resolve: Callable[[], BaseUser]):
+        """ LazyUser Constructor
+
+        Args:
+            resolve (Callable[[], BaseUser]): Synchronous function without arguments that returns the user
+        """
+        self._resolve = resolve
+        self._user = _UNRESOLVED
+
+    @property
+    def resolved(self) -> bool:
+        """ Whether the user has been created already """
+        return self._user is not _UNRESOLVED
+
+    @property
+    def user(self) -> BaseUser:
+        """ The resolved user """
+        if self._user is _UNRESOLVED:
+            self._user = self._resolve()
+        return self._user
+
+    @property
+    def is_authenticated(self) -> bool:
+        return self.user.is_authenticated
+
+    @property
+    def display_name(self) -> str:
+        return self.user.display_name
+
+    @property
+    def identity(self) -> str:
+        return self.user.identity
+
+    def __getattr__(self, name: str) -> Any:  # Only called for attributes the proxy itself does not have
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.user, name)
@@ -0,0 +1,118 @@
+import bisect
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from starlette.responses import PlainTextResponse
+
+PHASES = ("header", "split", "decode", "get_scopes", "get_user", "renewal")
+OUTCOMES = ("ok", "missing", "expired", "renewed", "invalid", "forbidden", "throttled", "overloaded", "cache_hit", "cache_miss", "negative_cache_hit",
+            "shared_cache_hit", "shared_cache_miss")
+
+
+class Metrics:
+    """ Hook that receives per-phase latencies and outcome counts of the authentication. This base class discards everything and is the default.
+    Subclass it and set enabled to True to export the values somewhere """
+
+    enabled = False  # Phases are only timed for enabled metrics, so the default costs a single attribute lookup per phase
+
+    def observe(self, phase: str, seconds: float):
+        """ Records how long a phase took
+
+        Args:
+            phase (str): One of "header", "split", "decode", "get_scopes", "get_user" and "renewal"
+            seconds (float): Duration of the phase
+        """
+
+    def increment(self, outcome: str):
+        """ Counts an outcome
+
+        Args:
+            outcome (str): One of "ok", "missing", "expired", "renewed", "invalid", "forbidden", "throttled", "overloaded", "cache_hit", "cache_miss", "negative_cache_hit",
+                           "shared_cache_hit" and "shared_cache_miss"
+        """
+
+    def gauge(self, name: str, description: str, function: Callable[[], float]):
+        """ Registers a value that is read whenever the metrics are exported, e.g. the queue depth of an AdmissionController
+
+        Args:
+            name (str): Name of the gauge, e.g. "admission_queue_depth"
+            description (str): Help text of the gauge
+            function (Callable[[], float]): Returns the current value
+        """
+
+
+class PrometheusMetrics(Metrics):
+    """ Keeps latency histograms per phase and counters per outcome in memory and renders them in the Prometheus text exposition format """
+
+    enabled = True
+    DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+    def __init__(self, namespace: str = "fastapi_auth", buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """ PrometheusMetrics Constructor
+
+        Args:
+            namespace (str): Optional: Prefix of the metric names. Default is "fastapi_auth"
+            buckets (Sequence[float]): Optional: Upper bounds of the histogram buckets in seconds. Default ranges from 10 microseconds to 1 second
+        """
+        self.namespace = namespace
+        self.buckets = tuple(sorted(buckets))
+        self._histograms: Dict[str, List] = {}  # {phase: [bucket counts..., count of larger values, sum]}
+        self._counters: Dict[str, int] = dict.fromkeys(OUTCOMES, 0)
+        self._gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}  # {name: (description, function)}
+
+    def observe(self, phase: str, seconds: float):
+        histogram = self._histograms.get(phase)
+        if histogram is None:
+            histogram = self._histograms[phase] = [0] * (len(self.buckets) + 1) + [0.0]
+
+        histogram[bisect.bisect_left(self.buckets, seconds)] += 1  # Non-cumulative, summed up when rendered
+        histogram[-1] += seconds
+
+    def increment(self, outcome: str):
+        self._counters[outcome] = self._counters.get(outcome, 0) + 1
+
+    def gauge(self, name: str, description: str, function: Callable[[], float]):
+        self._gauges[name] = (description, function)
+
+    def count(self, outcome: str) -> int:
+        """ Returns how often an outcome has been counted """
+        return self._counters.get(outcome, 0)
+
+    def render(self) -> str:
+        """ Renders all metrics in the Prometheus text exposition format
+
+        Returns:
+            str: The metrics, ready to be served on a /metrics route
+        """
+        phase_metric = f"{self.namespace}_phase_seconds"
+        outcome_metric = f"{self.namespace}_outcomes_total"
+        lines = [
+            f"# HELP {phase_metric} Time spent in each phase of the authentication",
+            f"# TYPE {phase_metric} histogram",
+        ]
+
+        for phase, histogram in self._histograms.items():
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets, histogram):
+                cumulative += count
+                lines.append(f'{phase_metric}_bucket{{phase="{phase}",le="{upper_bound!r}"}} {cumulative}')
+            cumulative += histogram[-2]
+            lines.append(f'{phase_metric}_bucket{{phase="{phase}",le="+Inf"}} {cumulative}')
+            lines.append(f'{phase_metric}_sum{{phase="{phase}"}} {histogram[-1]!r}')
+            lines.append(f'{phase_metric}_count{{phase="{phase}"}} {cumulative}')
+
+        lines.append(f"# HELP {outcome_metric} Authentications by outcome")
+        lines.append(f"# TYPE {outcome_metric} counter")
+        for outcome, count in self._counters.items():
+            lines.append(f'{outcome_metric}{{outcome="{outcome}"}} {count}')
+
+        for name, (description, function) in self._gauges.items():
+            gauge_metric = f"{self.namespace}_{name}"
+            lines.append(f"# HELP {gauge_metric} {description}")
+            lines.append(f"# TYPE {gauge_metric} gauge")
+            lines.append(f"{gauge_metric} {function()!r}")
+
+        return "\n".join(lines) + "\n"
+
+    def response(self, *args, **kwargs) -> PlainTextResponse:
+        """ Creates a response with the rendered metrics. Can be used as route directly, e.g. app.add_route("/metrics", metrics.response) """
+        return PlainTextResponse(self.render(), media_type="text/plain; version=0.0.4")
@@ -1,15 +1,28 @@
 import inspect
-from typing import Tuple, Callable, List, Dict
+from typing import TYPE_CHECKING, Tuple, Callable, List, Dict
 
-from fastapi import FastAPI
 from starlette.authentication import AuthenticationBackend, AuthCredentials, AuthenticationError, BaseUser
-from starlette.middleware.authentication import AuthenticationMiddleware
+from starlette.datastructures import Headers
 from starlette.requests import HTTPConnection, Request
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.types import Scope, Receive, Send
+
+from fastapi_auth_middleware.admission import AdmissionController
+from fastapi_auth_middleware.concurrency import SingleFlight, VerificationExecutor
+from fastapi_auth_middleware.exceptions import ServiceOverloaded
+from fastapi_auth_middleware.lazy import LazyAuthCredentials, LazyUser
+from fastapi_auth_middleware.policy import ScopePolicy
+from fastapi_auth_middleware.routes import RouteIndex
+from fastapi_auth_middleware.scopes import ScopeCredentials
+
+if TYPE_CHECKING:  # FastAPI is only needed for annotations, importing it costs more than the whole package
+    from fastapi import FastAPI
 
 
 class FastAPIUser(BaseUser):
-    """ Sample API User that gives basic functionality """
+    """ Sample API User that gives basic functionality. Instances are immutable, so one user can safely be shared between requests """
+
+    __slots__ = ("first_name", "last_name", "user_id")
 
     def __init__(self, first_name: str, last_name: str, user_id: any):
         """ FastAPIUser Constructor
@@ -19,9 +32,21 @@ class FastAPIUser(BaseUser):
             last_name (str): The last name of the user
             user_id (any): The user id, most likely an integer or string
         """
-        self.first_name = first_name
-        self.last_name = last_name
-        self.user_id = user_id
+        object.__setattr__(self, "first_name", first_name)
+        object.__setattr__(self, "last_name", last_name)
+        object.__setattr__(self, "user_id", user_id)
+
+    def __setattr__(self, name: str, value: any):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name: str):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):  # Restoring slots would go through __setattr__, copies and pickles are created with the constructor instead
+        return type(self), (self.first_name, self.last_name, self.user_id)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(first_name={self.first_name!r}, last_name={self.last_name!r}, user_id={self.user_id!r})"
 
     @property
     def is_authenticated(self) -> bool:
@@ -46,15 +71,60 @@ class FastAPIUser(BaseUser):
 class FastAPIAuthBackend(AuthenticationBackend):
     """ Auth Backend for FastAPI """
 
-    def __init__(self, verify_header: Callable[[Dict], Tuple[List[str], BaseUser]], excluded_urls: List[str] = None):
+    def __init__(
+            self,
+            verify_header: Callable[[Dict], Tuple[List[str], BaseUser]],
+            excluded_urls: List[str] = None,
+            verification_executor: VerificationExecutor = None,
+            coalesce: bool = False,
+            lazy: bool = False,
+            admission: AdmissionController = None
+    ):
         """ Auth Backend constructor. Part of an AuthenticationMiddleware as backend.
 
         Args:
             verify_header (callable): A function handle that returns a list of scopes and a BaseUser
-            excluded_urls (List[str]): A list of URL paths (e.g. ['/login', '/contact']) the middleware should not check for user credentials ( == public routes)
+            excluded_urls (List[str]): A list of URL paths (e.g. ['/login', '/contact']) the middleware should not check for user credentials ( == public routes). Also accepts
+                                       methods ('GET /health'), prefixes ('/public/*') and regular expressions ('^/items/[0-9]+$'), see RouteIndex
+            verification_executor (VerificationExecutor): Optional: Executor to run a synchronous verify_header on, e.g. if it performs blocking I/O. Default will call it on the
+                                                          event loop. Coroutine functions are always awaited
+            coalesce (bool): Optional: Share one verify_header call between concurrent requests with the same 'Authorization' header. Only enable this if the result of
+                             verify_header depends on nothing but that header. Default is False
+            lazy (bool): Optional: Allow verify_header to return functions without arguments instead of the scopes and the user. They are only called when request.auth or
+                         request.user is accessed. Default is False
+            admission (AdmissionController): Optional: Limits concurrent verify_header calls. Requests that share an in-flight call with coalesce don't take a slot.
+                                             Default is unlimited
         """
         self.verify_header = verify_header
+        self.admission = admission
         self.excluded_urls = [] if excluded_urls is None else excluded_urls
+        self.excluded_routes = RouteIndex(self.excluded_urls)  # Compiled once, a request only costs a dict lookup
+        self.verification_executor = verification_executor
+        self.single_flight = SingleFlight() if coalesce else None
+        self.lazy = lazy
+
+        if inspect.iscoroutinefunction(verify_header):  # Dispatch strategy is fixed once instead of being inspected per request
+            self._dispatch = self._await_verify_header
+        elif verification_executor is not None:
+            self._dispatch = self._run_verify_header_in_executor
+        else:
+            self._dispatch = self._call_verify_header
+
+    async def _await_verify_header(self, headers: Headers):
+        return await self.verify_header(headers)
+
+    async def _run_verify_header_in_executor(self, headers: Headers):
+        return await self.verification_executor.run(self.verify_header, headers)
+
+    async def _call_verify_header(self, headers: Headers):
+        return self.verify_header(headers)
+
+    async def _dispatch_admitted(self, headers: Headers):
+        if self.admission is None:
+            return await self._dispatch(headers)
+
+        async with self.admission.slot():
+            return await self._dispatch(headers)
 
     async def authenticate(self, conn: HTTPConnection) -> Tuple[AuthCredentials, BaseUser]:
         """ The 'magic' happens here. The authenticate method is invoked each time a route is called that the middleware is applied to.
@@ -65,36 +135,45 @@ class FastAPIAuthBackend(AuthenticationBackend):
         Returns:
             Tuple[AuthCredentials, BaseUser]: A tuple of AuthCredentials (scopes) and a user object that is or inherits from BaseUser
         """
-        if conn.url.path in self.excluded_urls:
-            return AuthCredentials(scopes=[]), "Unauthenticated User"
+        return await self.authenticate_scope(conn.scope)
+
+    async def authenticate_scope(self, scope: Scope) -> Tuple[AuthCredentials, BaseUser]:
+        """ Same as authenticate, but works on the raw ASGI scope without creating an HTTPConnection
+
+        Args:
+            scope (Scope): The ASGI scope of the request
+
+        Returns:
+            Tuple[AuthCredentials, BaseUser]: A tuple of AuthCredentials (scopes) and a user object that is or inherits from BaseUser
+        """
+        if self.excluded_routes and self.excluded_routes.match(scope.get("method"), scope["path"]) is not None:
+            return ScopeCredentials(), "Unauthenticated User"
+
+        headers = Headers(raw=scope["headers"])  # Wraps the raw header list without copying it
 
         try:
-            if inspect.iscoroutinefunction(self.verify_header):
-                scopes, user = await self.verify_header(conn.headers)
+            credential = headers.get("Authorization") if self.single_flight is not None else None
+            if credential is not None:  # Concurrent requests with the same credential share one verification
+                scopes, user = await self.single_flight.run(credential, lambda: self._dispatch_admitted(headers))
             else:
-                scopes, user = self.verify_header(conn.headers)
+                scopes, user = await self._dispatch_admitted(headers)
+
+        except ServiceOverloaded:  # Not an authentication error, the middleware answers with HTTP 503
+            raise
 
         except Exception as exception:
             raise AuthenticationError(exception) from None
 
-        return AuthCredentials(scopes=scopes), user
+        if self.lazy:
+            credentials = LazyAuthCredentials(scopes) if callable(scopes) else ScopeCredentials(scopes)
+            return credentials, LazyUser(user) if callable(user) else user
 
+        return ScopeCredentials(scopes), user
 
-# noinspection PyPep8Naming
-def AuthMiddleware(
-        app: FastAPI,
-        verify_header: Callable[[str], Tuple[List[str], BaseUser]],
-        auth_error_handler: Callable[[Request, AuthenticationError], JSONResponse] = None,
-        excluded_urls: List[str] = None
-):
-    """ Factory method, returning an AuthenticationMiddleware
-    Intentionally not named with lower snake case convention as this is a factory method returning a class. Should feel like a class.
 
-    Args:
-        app (FastAPI): The FastAPI instance the middleware should be applied to. The `add_middleware` function of FastAPI adds the app as first argument by default.
-        verify_header (Callable[[str], Tuple[List[str], BaseUser]]): A function handle that returns a list of scopes and a BaseUser
-        auth_error_handler (Callable[[Request, Exception], JSONResponse]): Optional error handler for creating responses when an exception was raised in verify_authorization_header
-        excluded_urls (List[str]): A list of URL paths (e.g. ['/login', '/contact']) the middleware should not check for user credentials ( == public routes)
+class AuthMiddleware:
+    """ Lean ASGI middleware that authenticates each request with a verify_header function. Works on the raw ASGI scope and only creates an HTTPConnection if the
+    auth_error_handler has to be called
 
     Examples:
         ```python
@@ -104,7 +183,98 @@ def AuthMiddleware(
             return scopes, user
 
         app = FastAPI()
-        app.add_middleware(AuthMiddleware, verify_authorization_header=verify_authorization_header)
+        app.add_middleware(AuthMiddleware, verify_header=verify_authorization_header)
         ```
     """
-    return AuthenticationMiddleware(app, backend=FastAPIAuthBackend(verify_header=verify_header, excluded_urls=excluded_urls), on_error=auth_error_handler)
+
+    def __init__(
+            self,
+            app: "FastAPI",
+            verify_header: Callable[[str], Tuple[List[str], BaseUser]],
+            auth_error_handler: Callable[[Request, AuthenticationError], JSONResponse] = None,
+            excluded_urls: List[str] = None,
+            verification_executor: VerificationExecutor = None,
+            coalesce: bool = False,
+            lazy: bool = False,
+            scope_policy: ScopePolicy or Dict = None,
+            admission: AdmissionController = None
+    ):
+        """ AuthMiddleware Constructor
+
+        Args:
+            app (FastAPI): The FastAPI instance the middleware should be applied to. The `add_middleware` function of FastAPI adds the app as first argument by default.
+            verify_header (Callable[[str], Tuple[List[str], BaseUser]]): A function handle that returns a list of scopes and a BaseUser
+            auth_error_handler (Callable[[Request, Exception], JSONResponse]): Optional error handler for creating responses when an exception was raised in verify_authorization_header
+            excluded_urls (List[str]): A list of URL paths (e.g. ['/login', '/contact']) the middleware should not check for user credentials ( == public routes). Also accepts
+                                       methods ('GET /health'), prefixes ('/public/*') and regular expressions ('^/items/[0-9]+$'), see RouteIndex
+            verification_executor (VerificationExecutor): Optional: Executor to run a synchronous verify_header on, e.g. if it performs blocking I/O. Default will call it on the
+                                                          event loop
+            coalesce (bool): Optional: Share one verify_header call between concurrent requests with the same 'Authorization' header. Only enable this if the result of
+                             verify_header depends on nothing but that header. Default is False
+            lazy (bool): Optional: Allow verify_header to return functions without arguments instead of the scopes and the user. They are only called when request.auth or
+                         request.user is accessed. Default is False
+            scope_policy (ScopePolicy or Dict): Optional: Scopes required per route, as ScopePolicy or as dict of {route: scopes}. Requests without them are answered with
+                                                HTTP 403 before the app is called. Default leaves authorization to the app
+            admission (AdmissionController): Optional: Limits concurrent verify_header calls. Requests beyond its queue are answered with HTTP 503 and a 'Retry-After'
+                                             header. Default is unlimited
+        """
+        self.app = app
+        self.admission = admission
+        self.backend = FastAPIAuthBackend(
+            verify_header=verify_header,
+            excluded_urls=excluded_urls,
+            verification_executor=verification_executor,
+            coalesce=coalesce,
+            lazy=lazy,
+            admission=admission
+        )
+        self.on_error = self.default_on_error if auth_error_handler is None else auth_error_handler
+        self.scope_policy = scope_policy if scope_policy is None or isinstance(scope_policy, ScopePolicy) else ScopePolicy(scope_policy)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] not in ("http", "websocket"):  # pragma nocover # Filter for relevant requests
+            await self.app(scope, receive, send)  # pragma nocover # Bypass
+            return  # End
+
+        try:  # to Authenticate
+            scope["auth"], scope["user"] = await self.backend.authenticate_scope(scope)
+
+        except ServiceOverloaded:  # Too many verifications, fail fast instead of queueing without bound
+            if scope["type"] == "websocket":
+                await send({"type": "websocket.close", "code": 1013})  # Try again later
+            else:
+                await self.service_overloaded(self._get_retry_after())(scope, receive, send)
+            return  # End
+
+        except AuthenticationError as exception:
+            response = self.on_error(HTTPConnection(scope), exception)  # The connection is only needed for the error handler
+            if scope["type"] == "websocket":
+                await send({"type": "websocket.close", "code": 1000})
+            else:
+                await response(scope, receive, send)
+            return  # End
+
+        if self.scope_policy is not None and not self.scope_policy.allows(scope.get("method"), scope["path"], scope["auth"].scopes):  # Authenticated, but not authorized
+            if scope["type"] == "websocket":
+                await send({"type": "websocket.close", "code": 1008})
+            else:
+                await self.insufficient_scope()(scope, receive, send)
+            return  # End
+
+        await self.app(scope, receive, send)
+
+    def _get_retry_after(self) -> int:
+        """ Seconds for the 'Retry-After' header of a rejected request, 1 if the overload was not detected by an AdmissionController, e.g. a full VerificationExecutor """
+        return 1 if self.admission is None else self.admission.get_retry_after()
+
+    @staticmethod
+    def default_on_error(conn: HTTPConnection, exception: Exception) -> Response:
+        return PlainTextResponse(str(exception), status_code=400)
+
+    @staticmethod
+    def insufficient_scope(*args, **kwargs) -> Response:
+        return PlainTextResponse("Your token lacks the scopes this route requires", status_code=403)
+
+    @staticmethod
+    def service_overloaded(retry_after: int, *args, **kwargs) -> Response:
+        return PlainTextResponse("The service is overloaded, please retry later", status_code=503, headers={"Retry-After": str(retry_after)})
@@ -1,47 +1,208 @@
-from typing import Tuple, List
+import asyncio
+import hashlib
+import inspect
+import json
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
 
-from fastapi import FastAPI
-from jose import ExpiredSignatureError
-from jose import jwt
 from starlette.authentication import AuthenticationBackend, AuthCredentials, BaseUser
 from starlette.datastructures import MutableHeaders
 from starlette.requests import HTTPConnection
 from starlette.responses import PlainTextResponse
 from starlette.types import Scope, Receive, Send, Message
 
-from fastapi_auth_middleware import FastAPIUser
-from fastapi_auth_middleware.exceptions import AuthenticationHeaderMissing
+from fastapi_auth_middleware.admission import AdmissionController
+from fastapi_auth_middleware.cache import TokenCache
+from fastapi_auth_middleware.cache_backends import CacheBackend
+from fastapi_auth_middleware.concurrency import SingleFlight, VerificationExecutor
+from fastapi_auth_middleware.engines import JWTEngine, get_engine
+from fastapi_auth_middleware.exceptions import AuthenticationHeaderMissing, InvalidToken, ServiceOverloaded, TokenHasExpired
+from fastapi_auth_middleware.expiry import ExpiryScheduler
+from fastapi_auth_middleware.headers import get_authorization_header
+from fastapi_auth_middleware.issuers import MultiIssuerBackend
+from fastapi_auth_middleware.jwks import JWKSKeySource
+from fastapi_auth_middleware.keys import Keyring, UnknownKeyId
+from fastapi_auth_middleware.lazy import LazyAuthCredentials, LazyUser
+from fastapi_auth_middleware.metrics import Metrics
+from fastapi_auth_middleware.middleware import FastAPIUser
+from fastapi_auth_middleware.policy import ScopePolicy
+from fastapi_auth_middleware.scopes import EMPTY_SCOPES, ScopeCredentials, ScopeSet, parse_scopes
+from fastapi_auth_middleware.session import SessionTokenSigner
+from fastapi_auth_middleware.throttling import FailureBudget, get_client_host
+
+if TYPE_CHECKING:  # FastAPI is only needed for annotations, importing it costs more than the whole package
+    from fastapi import FastAPI
+
+
+_process_keys = {}  # Keys parsed inside a worker process of a ProcessPoolExecutor
+
+
+def _get_process_key(engine: JWTEngine, key_source, algorithm: str) -> Any:
+    """ Parses a key inside a worker process. The key is passed unparsed and parsed once per process """
+    cache_key = (engine.name, json.dumps(key_source, sort_keys=True) if isinstance(key_source, dict) else key_source, algorithm)
+    key = _process_keys.get(cache_key)
+
+    if key is None:
+        key = _process_keys[cache_key] = engine.construct_key(key_source, algorithm)
+
+    return key
+
+
+def _decode_in_process(engine: JWTEngine, token: str, key_source, algorithm: str, **options) -> dict:
+    """ Decodes a token inside a worker process """
+    return engine.decode(token, _get_process_key(engine, key_source, algorithm), **options)
+
+
+def _decode_batch(engine: JWTEngine, tokens: List[str], key: Any, **options) -> List[dict or InvalidToken]:
+    """ Decodes tokens that share a key. A rejected token yields its error instead of claims """
+    decoded = []
+    for token in tokens:
+        try:
+            decoded.append(engine.decode(token, key, **options))
+        except InvalidToken as error:
+            decoded.append(error)
+    return decoded
+
+
+def _decode_batch_in_process(engine: JWTEngine, tokens: List[str], key_source, algorithm: str, **options) -> List[dict or InvalidToken]:
+    """ Decodes tokens that share a key inside a worker process """
+    return _decode_batch(engine, tokens, _get_process_key(engine, key_source, algorithm), **options)
+
+
+class VerificationResult:
+    """ Outcome of the verification of a single token by OAuth2Backend.verify_many """
+
+    __slots__ = ("claims", "credentials", "user", "error")
+
+    def __init__(self, claims: dict = None, credentials: AuthCredentials = None, user: BaseUser = None, error: Exception = None):
+        """ VerificationResult Constructor
+
+        Args:
+            claims (dict): The decoded token, None if it has been rejected
+            credentials (AuthCredentials): The scopes of the token, None if it has been rejected
+            user (BaseUser): The user of the token, None if it has been rejected
+            error (Exception): Why the token has been rejected, most likely an InvalidToken such as TokenHasExpired. None if it is valid
+        """
+        self.claims = claims
+        self.credentials = credentials
+        self.user = user
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        """ Whether the token is valid """
+        return self.error is None
+
+    def __repr__(self):
+        return f"VerificationResult(error={self.error!r})" if self.error is not None else f"VerificationResult(claims={self.claims!r})"
 
 
 class OAuth2Middleware:
 
-    def __init__(self, app: FastAPI, public_key: str, get_new_token: callable = None, get_scopes: callable = None, get_user: callable = None,
-                 decode_token_options: dict = None, issuer: str = None, audience: str = None, algorithms: str or List[str] = None):
+    def __init__(self, app: "FastAPI", public_key: str or dict or Keyring or JWKSKeySource = None, get_new_token: callable = None, get_scopes: callable = None, get_user: callable = None,
+                 decode_token_options: dict = None, issuer: str = None, audience: str = None, algorithms: str or List[str] = None, token_cache: TokenCache = None,
+                 verification_executor: VerificationExecutor = None, coalesce: bool = False, renewal_ttl: float = None,
+                 lazy: bool = False, negative_cache: TokenCache = None, failure_budget: FailureBudget = None, metrics: Metrics = None,
+                 engine: str or JWTEngine = None, expiry_scheduler: ExpiryScheduler = None, shared_cache: CacheBackend = None,
+                 scope_policy: ScopePolicy or dict = None, issuers: Dict[str, dict] = None, admission: AdmissionController = None,
+                 session_signer: SessionTokenSigner = None):
         """ Constructor if the OAuth2Middleware
 
         Args:
             app (FastAPI): FastAPI instance
             get_new_token (callable): Optional: Function that returns a new token with an old one. Takes an access token as input argument Most likely you have a refresh token stored
-                                      somewhere to renew the token. Default will not renew the token and raise a HTTP 401 instead.
-            public_key (str): Public key of your OAuth2 Service to verify the jwt's signature
+                                      somewhere to renew the token. May be a coroutine function. Concurrent renewals of the same token share one call.
+                                      Default will not renew the token and raise a HTTP 401 instead.
+            public_key (str or dict or Keyring or JWKSKeySource): Public key of your OAuth2 Service to verify the jwt's signature. Multiple keys may be passed as a dict of
+                                                                  {kid: key}, a JWK Set or a Keyring. Use a JWKSKeySource to rotate keys at runtime
             get_scopes (callable): Optional: A method that returns a list of scopes based on a decoded_token input. Default will extract scopes from the token.
             get_user (callable): Optional: A method that returns a user Object based on a decoded_token input. Default will create a basic user from the token.
             decode_token_options (dict): Optional: A dictionary of decode options. Possible options are: verify_iat, verify_nbf, verify_exp, verify_iss, verify_aud. Default is
                                          {"verify_exp": True, "verify_iat": True, "verify_nbf": False, "verify_iss": False, "verify_aud": False }
             issuer (str): The issuer of the jwt. Required if the "verify_iss" option is enabled
             audience (str): The audience of the jwt. Required if the "verify_aud" option is enabled
+            token_cache (TokenCache): Optional: A cache for verified tokens. Default will verify the signature on every request
+            verification_executor (VerificationExecutor): Optional: Executor to verify signatures off the event loop. Default will verify on the event loop
+            coalesce (bool): Optional: Share one verification between concurrent requests with the same token. Default is False
+            renewal_ttl (float): Optional: Seconds a renewed token is reused for further requests with the same expired token. Default will call get_new_token for every request
+            lazy (bool): Optional: Call get_scopes and get_user only when request.auth or request.user is accessed. Both must be synchronous then. Default is False
+            negative_cache (TokenCache): Optional: A cache for rejected tokens, most likely with a short ttl. Repeated invalid tokens are rejected without verifying them again
+            failure_budget (FailureBudget): Optional: Limits failed authentications per client IP. Once exceeded, requests are answered with HTTP 429 without verification
+            metrics (Metrics): Optional: Receives per-phase latencies and outcome counts, e.g. PrometheusMetrics. Default discards them
+            engine (str or JWTEngine): Optional: The library that verifies tokens, "cryptography", "pyjwt" or "python-jose". Default is the fastest installed one
+            expiry_scheduler (ExpiryScheduler): Optional: Closes websockets once the token they were opened with expires. Default will only check the token on connect
+            shared_cache (CacheBackend): Optional: A cache for the claims of verified tokens, shared with other workers, e.g. SharedMemoryCacheBackend or RedisCacheBackend.
+                                         It is asked after the token_cache. Default will verify tokens in every worker
+            scope_policy (ScopePolicy or dict): Optional: Scopes required per route, as ScopePolicy or as dict of {route: scopes}. Requests without them are answered with
+                                                HTTP 403 before the app is called. Default leaves authorization to the app
+            issuers (Dict[str, dict]): Optional: Verify tokens of several issuers instead of a single public_key, as {issuer: settings}. The settings take public_key and
+                                       optionally get_scopes, get_user, decode_token_options, audience, algorithms and engine, missing ones fall back to the arguments of
+                                       the middleware. Each token is verified with the keys of its 'iss' claim, tokens of other issuers are rejected
+            admission (AdmissionController): Optional: Limits concurrent verifications of uncached tokens. Requests beyond its queue are answered with HTTP 503 and a
+                                             'Retry-After' header. Default is unlimited
+            session_signer (SessionTokenSigner): Optional: Returns a short-lived HMAC signed session token in a response header (default "New-Session-Token") for
+                                                 each verified access token. Clients may send it instead of the access token, it's verified without the public key.
+                                                 Default only accepts access tokens
+
+        Raises:
+            ValueError: If neither or both of public_key and issuers are passed
         """
+        if (public_key is None) == (issuers is None):
+            raise ValueError("Pass either public_key or issuers")
+
         self.app = app
-        self.backend: OAuth2Backend = OAuth2Backend(
-            public_key=public_key,
-            get_scopes=get_scopes,
-            get_user=get_user,
-            decode_token_options=decode_token_options,
-            issuer=issuer,
-            audience=audience,
-            algorithms=algorithms
+        self.scope_policy = scope_policy if scope_policy is None or isinstance(scope_policy, ScopePolicy) else ScopePolicy(scope_policy)
+        self.expiry_scheduler = expiry_scheduler
+        self.metrics = metrics if metrics is not None else Metrics()
+        backend_options = dict(  # Shared by the backends of all issuers
+            token_cache=token_cache,
+            verification_executor=verification_executor,
+            coalesce=coalesce,
+            lazy=lazy,
+            negative_cache=negative_cache,
+            metrics=self.metrics,
+            shared_cache=shared_cache,
+            admission=admission,
+            session_signer=session_signer
         )
+        self.admission = admission
+        self.session_signer = session_signer
+        self.session_tokens = TokenCache(ttl=session_signer.lifetime / 2) if session_signer is not None else None  # {access token: session token}
+        if admission is not None:
+            self.metrics.gauge("admission_queue_depth", "Verifications waiting for a slot", lambda: admission.queue_depth)
+            self.metrics.gauge("admission_in_flight", "Verifications holding a slot", lambda: admission.in_flight)
+
+        if issuers is None:
+            self.backend: OAuth2Backend or MultiIssuerBackend = OAuth2Backend(
+                public_key=public_key,
+                get_scopes=get_scopes,
+                get_user=get_user,
+                decode_token_options=decode_token_options,
+                issuer=issuer,
+                audience=audience,
+                algorithms=algorithms,
+                engine=engine,
+                **backend_options
+            )
+        else:
+            self.backend = MultiIssuerBackend({
+                issuer: OAuth2Backend(
+                    public_key=settings["public_key"],
+                    get_scopes=settings.get("get_scopes", get_scopes),
+                    get_user=settings.get("get_user", get_user),
+                    decode_token_options=settings.get("decode_token_options", decode_token_options),
+                    issuer=issuer,
+                    audience=settings.get("audience", audience),
+                    algorithms=settings.get("algorithms", algorithms),
+                    engine=settings.get("engine", engine),
+                    **backend_options
+                ) for issuer, settings in issuers.items()
+            })
+        self.failure_budget = failure_budget
         self.get_new_token = get_new_token
+        self.renewed_tokens = TokenCache(ttl=renewal_ttl) if renewal_ttl else None  # {old token: new token}
+        self._renewals = SingleFlight()
+        self._get_new_token_is_async = inspect.iscoroutinefunction(get_new_token)
 
     async def __call__(
             self,
@@ -54,37 +215,200 @@ class OAuth2Middleware:
             await self.app(scope, receive, send)  # pragma nocover # Bypass
             return  # End
 
-        connection = HTTPConnection(scope)  # Scoped connection
+        metrics = self.metrics
+        started = time.perf_counter() if metrics.enabled else None
+        auth_header = get_authorization_header(scope)  # Single scan of the raw headers, no HTTPConnection needed
+        if started is not None:
+            metrics.observe("header", time.perf_counter() - started)
+
+        client = get_client_host(scope) if self.failure_budget is not None else None
+
+        if self.failure_budget is not None and self.failure_budget.exhausted(client):  # Client keeps sending invalid tokens
+            metrics.increment("throttled")
+            response = self.too_many_failures()
+            await response(scope, receive, send)
+            return  # End
 
         try:  # to Authenticate
 
-            scope["auth"], scope["user"] = await self.backend.authenticate(connection)  # Authentication
-            await self.app(scope, receive, send)  # Token is valid
+            claims, scope["auth"], scope["user"] = await self.backend.verify_header(auth_header)  # Authentication
 
         except AuthenticationHeaderMissing:  # Request has no 'Authorization' HTTP Header
+            metrics.increment("missing")
             response = self.auth_header_missing()
             await response(scope, receive, send)
             return  # End
 
-        except ExpiredSignatureError:  # Token has expired
+        except TokenHasExpired as error:  # Token has expired
 
             if self.get_new_token is None:  # No renewal has been set. Raise an exception (HTTP 401) instead
+                metrics.increment("expired")
+                self._record_failure(client)
                 response = self.token_has_expired()
                 await response(scope, receive, send)
                 return  # End
 
             else:  # get_new_token method is implemented
 
-                old_token = connection.headers.get("Authorization")
-                new_token = self.get_new_token(old_token)  # Get a new token
+                if self.scope_policy is not None and self.scope_policy.required(scope.get("method"), scope["path"]):  # The expired token must still carry the route's scopes
+                    try:
+                        _, credentials, _ = await self.backend.verify_expired_header(auth_header, claims=error.claims)  # Verified again only if the claims are unknown
+                    except InvalidToken:
+                        metrics.increment("invalid")
+                        self._record_failure(client)
+                        await self.token_has_expired()(scope, receive, send)
+                        return  # End
+                    except ServiceOverloaded:
+                        await self._overloaded(scope, receive, send)
+                        return  # End
+
+                    if not self.scope_policy.allows(scope.get("method"), scope["path"], credentials.scopes):
+                        await self._forbid(scope, receive, send)
+                        return  # End
+
+                new_token = await self.renew_token(auth_header)  # Get a new token
+                metrics.increment("renewed")
+
+                await self.app(scope, receive, self._send_with_header(send, "New-Access-Token", new_token))
+
+        except ServiceOverloaded:  # Too many verifications, fail fast instead of queueing without bound
+            await self._overloaded(scope, receive, send)
+            return  # End
+
+        except InvalidToken:  # Token is invalid, e.g. forged or signed with an unknown key
+            metrics.increment("invalid")
+            self._record_failure(client)
+            response = self.token_has_expired()
+            await response(scope, receive, send)
+            return  # End
+
+        else:
+            if self.scope_policy is not None and not self.scope_policy.allows(scope.get("method"), scope["path"], scope["auth"].scopes):  # Authenticated, not authorized
+                await self._forbid(scope, receive, send)
+                return  # End
+
+            metrics.increment("ok")
+            expires_at = claims.get("exp")
+
+            if self.expiry_scheduler is not None and scope["type"] == "websocket" and isinstance(expires_at, (int, float)):
+                await self._call_until_expired(scope, receive, send, expires_at)
+                return  # End
+
+            access_token = auth_header.split(" ")[-1]
+            if self.session_signer is not None and scope["type"] == "http" and not self.session_signer.is_session_token(access_token):
+                session_token = self.issue_session_token(access_token, claims)
+                if session_token is not None:  # Following requests may send the session token instead
+                    await self.app(scope, receive, self._send_with_header(send, self.session_signer.header, session_token))
+                    return  # End
+
+            await self.app(scope, receive, send)  # Token is valid
+
+    def _get_retry_after(self) -> int:
+        """ Seconds for the 'Retry-After' header of a rejected request, 1 if the overload was not detected by an AdmissionController, e.g. a full VerificationExecutor """
+        return 1 if self.admission is None else self.admission.get_retry_after()
+
+    async def _overloaded(self, scope: Scope, receive: Receive, send: Send):
+        """ Rejects a request that could not be verified because the service is overloaded """
+        self.metrics.increment("overloaded")
+        if scope["type"] == "websocket":
+            await send({"type": "websocket.close", "code": 1013})  # Try again later
+        else:
+            await self.service_overloaded(self._get_retry_after())(scope, receive, send)
+
+    async def _forbid(self, scope: Scope, receive: Receive, send: Send):
+        """ Rejects a request whose token lacks the scopes the scope_policy requires for the route """
+        self.metrics.increment("forbidden")
+        if scope["type"] == "websocket":
+            await send({"type": "websocket.close", "code": 1008})
+        else:
+            await self.insufficient_scope()(scope, receive, send)
+
+    @staticmethod
+    def _send_with_header(send: Send, name: str, value: str) -> Send:
+        """ Wraps send to add a header to the response """
+
+        async def send_with_header(message: Message) -> None:
+            if message["type"] == "http.response.start":  # Ensure this isn't called before stack is to be closed
+                headers = MutableHeaders(scope=message)
+                headers.append(name, value)
+            await send(message)
+
+        return send_with_header
+
+    async def _call_until_expired(self, scope: Scope, receive: Receive, send: Send, expires_at: float):
+        """ Calls the app with a websocket that is closed with the scheduler's close code once its token expires """
+
+        async def close():
+            self.metrics.increment("expired")
+            await send({"type": "websocket.close", "code": self.expiry_scheduler.close_code, "reason": self.expiry_scheduler.reason})
+
+        expiry = self.expiry_scheduler.schedule(expires_at, close)
+
+        async def send_until_expired(message: Message) -> None:
+            if expiry.fired:  # Connection has been closed, the app learns about it with its next receive
+                return
+            if message["type"] == "websocket.close":  # App closes the connection itself
+                expiry.cancel()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_until_expired)
+        finally:
+            expiry.cancel()  # Lazily removed from the scheduler
+
+    def _record_failure(self, client: str):
+        if self.failure_budget is not None:
+            self.failure_budget.record_failure(client)
+
+    def issue_session_token(self, access_token: str, claims: dict) -> Optional[str]:
+        """ Returns the session token for an access token. It's issued once and returned again for half of its lifetime, so clients always receive one that is
+        valid for at least another half lifetime
+
+        Args:
+            access_token (str): The verified access token, without "Bearer"
+            claims (dict): The decoded access token
+
+        Returns:
+            str: The session token or None if the access token has already expired
+        """
+        session_token = self.session_tokens.get(access_token)
+        if session_token is None:
+            session_token = self.session_signer.issue(claims)
+            if session_token is not None:
+                self.session_tokens.set(access_token, session_token, expires_at=claims.get("exp"))
+        return session_token
+
+    async def renew_token(self, old_token: str) -> str:
+        """ Returns a new token for an expired one. Concurrent calls for the same token share one get_new_token call and the result is memoized for renewal_ttl
+
+        Args:
+            old_token (str): The expired 'Authorization' HTTP header
+
+        Returns:
+            str: The new token
+        """
+        if self.renewed_tokens is not None:
+            new_token = self.renewed_tokens.get(old_token)
+            if new_token is not None:  # Renewed recently
+                return new_token
+
+        return await self._renewals.run(old_token, lambda: self._renew_token(old_token))
+
+    async def _renew_token(self, old_token: str) -> str:
+        started = time.perf_counter() if self.metrics.enabled else None
+
+        if self._get_new_token_is_async:
+            new_token = await self.get_new_token(old_token)
+        else:
+            new_token = self.get_new_token(old_token)
+
+        if started is not None:
+            self.metrics.observe("renewal", time.perf_counter() - started)
 
-                async def send_with_new_access_token(message: Message) -> None:
-                    if message["type"] == "http.response.start":  # Ensure this isn't called before stack is to be closed
-                        headers = MutableHeaders(scope=message)
-                        headers.append("New-Access-Token", new_token)
-                    await send(message)
+        if self.renewed_tokens is not None:
+            self.renewed_tokens.set(old_token, new_token)
 
-                await self.app(scope, receive, send_with_new_access_token)
+        return new_token
 
     @staticmethod
     def auth_header_missing(*args, **kwargs):
@@ -94,24 +418,47 @@ class OAuth2Middleware:
     def token_has_expired(*args, **kwargs):
         return PlainTextResponse("Your 'Authorization' HTTP header is invalid", status_code=401)
 
+    @staticmethod
+    def too_many_failures(*args, **kwargs):
+        return PlainTextResponse("Too many requests with an invalid 'Authorization' HTTP header", status_code=429)
+
+    @staticmethod
+    def insufficient_scope(*args, **kwargs):
+        return PlainTextResponse("Your token lacks the scopes this route requires", status_code=403)
+
+    @staticmethod
+    def service_overloaded(retry_after: int, *args, **kwargs):
+        return PlainTextResponse("The service is overloaded, please retry later", status_code=503, headers={"Retry-After": str(retry_after)})
+
 
 class OAuth2Backend(AuthenticationBackend):
     """ OAuth2 Backend """
 
     def __init__(
             self,
-            public_key: str,
+            public_key: str or dict or Keyring or JWKSKeySource,
             get_scopes: callable,
             get_user: callable,
             issuer: str,
             audience: str,
             decode_token_options: dict,
-            algorithms: str or List[str]
+            algorithms: str or List[str],
+            token_cache: TokenCache = None,
+            verification_executor: VerificationExecutor = None,
+            coalesce: bool = False,
+            lazy: bool = False,
+            negative_cache: TokenCache = None,
+            metrics: Metrics = None,
+            engine: str or JWTEngine = None,
+            shared_cache: CacheBackend = None,
+            admission: AdmissionController = None,
+            session_signer: SessionTokenSigner = None
     ):
         """
 
         Args:
-            public_key (str): Public key of your OAuth2 Service to verify the jwt's signature
+            public_key (str or dict or Keyring or JWKSKeySource): Public key of your OAuth2 Service to verify the jwt's signature. Multiple keys may be passed as a dict of
+                                                                  {kid: key}, a JWK Set or a Keyring. Use a JWKSKeySource to rotate keys at runtime
             get_scopes (callable): Optional: A method that returns a list of scopes based on a decoded_token input. Default will extract scopes from the token.
             get_user (callable): Optional: A method that returns a user Object based on a decoded_token input. Default will create a basic user from the token.
             issuer (str): The issuer of the jwt. Required if the "verify_iss" option is enabled
@@ -127,8 +474,45 @@ class OAuth2Backend(AuthenticationBackend):
                                             "verify_jti": False,  # JWT ID
                                             "verify_at_hash": False,  # Audience
                                         }
+            token_cache (TokenCache): Optional: A cache for verified tokens. Default will verify the signature on every request
+            verification_executor (VerificationExecutor): Optional: Executor to verify signatures off the event loop. Default will verify on the event loop
+            coalesce (bool): Optional: Share one verification between concurrent requests with the same token. Default is False
+            lazy (bool): Optional: Call get_scopes and get_user only when request.auth or request.user is accessed. Both must be synchronous then. Default is False
+            negative_cache (TokenCache): Optional: A cache for rejected tokens, most likely with a short ttl. Repeated invalid tokens are rejected without verifying them again
+            metrics (Metrics): Optional: Receives the latencies of the split, decode, get_scopes and get_user phases and cache hits and misses. Default discards them
+            engine (str or JWTEngine): Optional: The library that verifies tokens, "cryptography", "pyjwt" or "python-jose". Default is the engine of the passed Keyring or
+                                       JWKSKeySource, otherwise the fastest installed one
+            shared_cache (CacheBackend): Optional: A cache for the claims of verified tokens, shared with other workers, e.g. SharedMemoryCacheBackend or RedisCacheBackend.
+                                         It is asked after the token_cache, the credentials and the user are created from the shared claims. Entries are only shared by
+                                         backends with the same keys, audience, issuer, algorithms and decode_token_options. Default will verify tokens in every worker
+            admission (AdmissionController): Optional: Limits concurrent verifications. Cached tokens and requests that share an in-flight verification don't take a slot.
+                                             Default is unlimited
+            session_signer (SessionTokenSigner): Optional: Accepts session tokens of this signer besides access tokens. Default only accepts access tokens
+
+        Raises:
+            ValueError: If engine differs from the engine of the passed Keyring or JWKSKeySource, whose keys could not be used
         """
         self.public_key = public_key
+        self.metrics = metrics if metrics is not None else Metrics()
+
+        if isinstance(public_key, (Keyring, JWKSKeySource)):
+            self.keyring = public_key
+            self.engine = public_key.engine if engine is None else get_engine(engine)
+            if type(self.engine) is not type(public_key.engine):
+                raise ValueError(f"The keyring parses keys for {public_key.engine.name}, but {self.engine.name} has been chosen as engine")
+        else:
+            self.engine = get_engine(engine)  # Chosen once at startup
+            self.keyring = Keyring(public_key, algorithms=algorithms, engine=self.engine)  # Keys are parsed once, not per request
+
+        self.token_cache = token_cache
+        self.negative_cache = negative_cache
+        self.shared_cache = shared_cache
+        self.admission = admission
+        self.session_signer = session_signer
+        self.session_tokens = TokenCache(ttl=session_signer.lifetime / 2) if session_signer is not None else None  # {access token: session token}
+        self.verification_executor = verification_executor
+        self.single_flight = SingleFlight() if coalesce else None
+        self.lazy = lazy
         self.issuer = issuer
         self.audience = audience
         self.algorithms = algorithms
@@ -157,20 +541,24 @@ class OAuth2Backend(AuthenticationBackend):
         else:
             self.decode_token_options = decode_token_options
 
+        # Shared cache entries are only valid for backends that verify tokens the same way, e.g. not for a service with another audience that uses the same Redis
+        settings = [self.keyring.fingerprint, self.audience, self.issuer, self.algorithms, self.decode_token_options]
+        self._shared_namespace = hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()[:16] + ":"
+
     @staticmethod
-    def _get_scopes(decoded_token: dict) -> List[str]:
+    def _get_scopes(decoded_token: dict) -> ScopeSet:
         """ Default method if not method for getting scopes is passed
 
         Args:
             decoded_token (dict): A decoded JWT
 
         Returns:
-            List[str]: List of scopes. Empty list if none set
+            ScopeSet: Set of scopes, shared by all tokens with the same scope claim. Empty if none set
         """
-        try:
-            return decoded_token["scope"].split(" ")
-        except KeyError or AttributeError:  # Token does not define a scope field or the scope is empty
-            return []
+        scope = decoded_token.get("scope")
+        if not isinstance(scope, str):  # Token does not define a scope field or the scope is empty
+            return EMPTY_SCOPES
+        return parse_scopes(scope)
 
     @staticmethod
     def _get_user(decoded_token: dict) -> FastAPIUser:
@@ -191,6 +579,31 @@ class OAuth2Backend(AuthenticationBackend):
 
         return FastAPIUser(user_id=decoded_token.get("sub"), first_name=first_name, last_name=last_name)
 
+    async def _get_key(self, kid: str, algorithm: str):
+        try:
+            return self.keyring.get(kid, algorithm)
+        except UnknownKeyId:
+            if isinstance(self.keyring, JWKSKeySource) and await self.keyring.refresh_for_kid(kid):  # Keys might have been rotated
+                return self.keyring.get(kid, algorithm)
+            raise
+
+    def _decode_options(self) -> dict:
+        return dict(options=self.decode_token_options, audience=self.audience, issuer=self.issuer, algorithms=self.algorithms)
+
+    async def _decode(self, token: str, kid: str, algorithm: str, verify_exp: bool = True) -> dict:
+        key = await self._get_key(kid, algorithm)
+        options = self._decode_options()
+        if not verify_exp:  # The signature and all other claims are still verified
+            options["options"] = {**options["options"], "verify_exp": False}
+
+        if self.verification_executor is None or not self.verification_executor.offloads(algorithm):  # Cheap enough for the event loop
+            return self.engine.decode(token, key, **options)
+
+        if self.verification_executor.is_process_pool:  # Parsed keys can't be pickled, the worker process parses and keeps its own copy
+            return await self.verification_executor.run(_decode_in_process, self.engine, token, self.keyring.source(kid, algorithm), algorithm, **options)
+
+        return await self.verification_executor.run(self.engine.decode, token, key, **options)
+
     async def authenticate(self, conn: HTTPConnection) -> Tuple[AuthCredentials, BaseUser]:
         """ The authenticate method is invoked each time a route is called that the middleware is applied to.
 
@@ -200,14 +613,247 @@ class OAuth2Backend(AuthenticationBackend):
         Returns:
             Tuple[AuthCredentials, BaseUser]: A tuple of AuthCredentials (scopes) and a user object that is or inherits from BaseUser
         """
-        if "Authorization" not in conn.headers:
+        return await self.authenticate_header(conn.headers.get("Authorization"))
+
+    async def authenticate_header(self, auth_header: str) -> Tuple[AuthCredentials, BaseUser]:
+        """ Same as authenticate, but takes the value of the 'Authorization' header instead of an HTTPConnection
+
+        Args:
+            auth_header (str): The 'Authorization' HTTP header, None if the request has none
+
+        Returns:
+            Tuple[AuthCredentials, BaseUser]: A tuple of AuthCredentials (scopes) and a user object that is or inherits from BaseUser
+        """
+        _, credentials, user = await self.verify_header(auth_header)
+        return credentials, user
+
+    async def verify_header(self, auth_header: str) -> Tuple[dict, AuthCredentials, BaseUser]:
+        """ Same as authenticate_header, but also returns the decoded token, e.g. to enforce its 'exp' claim later on
+
+        Args:
+            auth_header (str): The 'Authorization' HTTP header, None if the request has none
+
+        Returns:
+            Tuple[dict, AuthCredentials, BaseUser]: The decoded token, the AuthCredentials (scopes) and the user
+        """
+        if auth_header is None:
             raise AuthenticationHeaderMissing
 
-        auth_header = conn.headers["Authorization"]
+        metrics = self.metrics
+        started = time.perf_counter() if metrics.enabled else None
         token = auth_header.split(" ")[-1]  # Generic approach: "Bearer eyJsn..." -> "eyJsn...", "Access Token eyJsn..." -> "eyJsn..."
-        decoded_token = jwt.decode(token=token, key=self.public_key, options=self.decode_token_options, audience=self.audience, issuer=self.issuer, algorithms=self.algorithms)
+        if started is not None:
+            metrics.observe("split", time.perf_counter() - started)
+
+        if self.token_cache is not None:
+            cached = self.token_cache.get(token)
+            if cached is not None:  # Token has already been verified and has not expired yet
+                metrics.increment("cache_hit")
+                return cached
+            metrics.increment("cache_miss")
+
+        if self.negative_cache is not None:
+            rejected = self.negative_cache.get(token)
+            if rejected is not None:  # Token has been rejected recently, fail with the same error without verifying it again
+                metrics.increment("negative_cache_hit")
+                raise self._rejected(rejected)
+
+        try:
+            if self.session_signer is not None and self.session_signer.is_session_token(token):  # Cheap HMAC check, no need to coalesce or admit it
+                claims, expires_at = self.session_signer.verify(token)
+                return self._accept(token, claims, expires_at=expires_at)
+
+            if self.single_flight is not None:  # Concurrent requests with the same token share one verification
+                return await self.single_flight.run(token, lambda: self._verify_admitted(token))
+
+            return await self._verify_admitted(token)
+
+        except InvalidToken as error:
+            self._reject(token, error)
+            raise
+
+    async def verify_expired_header(self, auth_header: str, claims: dict = None) -> Tuple[dict, AuthCredentials, BaseUser]:
+        """ Same as verify_header, but accepts a token whose 'exp' has passed, e.g. to check its scopes before it's renewed. Caches are neither asked nor filled
+
+        Args:
+            auth_header (str): The 'Authorization' HTTP header
+            claims (dict): Optional: The claims of the TokenHasExpired that verify_header raised for the token, so it isn't verified again. Default will verify the token
+
+        Returns:
+            Tuple[dict, AuthCredentials, BaseUser]: The decoded token, the AuthCredentials (scopes) and the user
+
+        Raises:
+            InvalidToken: If the signature or any other claim is invalid
+            ServiceOverloaded: If the verification_executor has no room for the token
+        """
+        token = auth_header.split(" ")[-1]
+        if claims is None:
+            header = self.engine.get_unverified_header(token)
+            claims = await self._decode(token, header.get("kid"), header.get("alg"), verify_exp=False)
+        return self._accept(token, claims, cache=False)
+
+    async def verify_many(self, tokens: Iterable[str]) -> List[VerificationResult]:
+        """ Verifies many tokens at once, e.g. bearer tokens forwarded to a fan-in service, with the keys and options of this backend.
+
+        Duplicates are verified once. The remaining tokens are grouped by key and algorithm, so each key is looked up once per batch, and every group is split into chunks
+        that are verified in parallel on the verification_executor. Tokens of algorithms the executor does not offload, or all tokens if there is no executor, are verified
+        on the event loop. The token cache, the negative cache and the shared cache are used and filled like for single requests.
+
+        Args:
+            tokens (Iterable[str]): Raw tokens, without "Bearer"
+
+        Returns:
+            List[VerificationResult]: One result per token, in the order of the tokens. Duplicates share their result
+        """
+        tokens = list(tokens)
+        results: Dict[str, VerificationResult] = {}
+        groups: Dict[Tuple[Optional[str], Optional[str]], List[str]] = {}
+        unknown = []
+
+        for token in dict.fromkeys(tokens):  # Deduplicated, in order
+            if self.token_cache is not None:
+                cached = self.token_cache.get(token)
+                if cached is not None:  # Token has already been verified and has not expired yet
+                    results[token] = VerificationResult(*cached)
+                    continue
+
+            if self.negative_cache is not None:
+                rejected = self.negative_cache.get(token)
+                if rejected is not None:  # Token has been rejected recently
+                    results[token] = VerificationResult(error=self._rejected(rejected))
+                    continue
+
+            unknown.append(token)
+
+        if self.shared_cache is not None and unknown:
+            shared_claims = await asyncio.gather(*(self.shared_cache.get(self._shared_namespace + token) for token in unknown))
+            for token, claims in zip(unknown, shared_claims):
+                if claims is not None:  # Verified by another worker
+                    results[token] = VerificationResult(*self._accept(token, claims))
+            unknown = [token for token in unknown if token not in results]
+
+        for token in unknown:
+            try:
+                header = self.engine.get_unverified_header(token)
+            except InvalidToken as error:
+                results[token] = VerificationResult(error=self._reject(token, error))
+                continue
+
+            groups.setdefault((header.get("kid"), header.get("alg")), []).append(token)
+
+        await asyncio.gather(*(self._verify_group(kid, algorithm, group, results) for (kid, algorithm), group in groups.items()))
+
+        if self.shared_cache is not None:
+            await asyncio.gather(*(self._share(token, results[token].claims) for token in unknown if results[token].ok))
+
+        return [results[token] for token in tokens]
+
+    async def _verify_group(self, kid: Optional[str], algorithm: Optional[str], tokens: List[str], results: Dict[str, VerificationResult]):
+        """ Verifies tokens that share a key and stores a result for each of them """
+        try:
+            key = await self._get_key(kid, algorithm)
+        except InvalidToken as error:  # Unknown kid or algorithm, the whole group is rejected
+            for token in tokens:
+                results[token] = VerificationResult(error=self._reject(token, error))
+            return
+
+        options = self._decode_options()
+        executor = self.verification_executor
+
+        if executor is None or not executor.offloads(algorithm):  # Cheap enough for the event loop
+            decoded = _decode_batch(self.engine, tokens, key, **options)
+        else:
+            size = -(-len(tokens) // executor.capacity)  # One chunk per worker, chunks instead of single tokens keep the executor's queue short
+            chunks = [tokens[start:start + size] for start in range(0, len(tokens), size)]
+
+            if executor.is_process_pool:  # Parsed keys can't be pickled, the worker process parses and keeps its own copy
+                key_source = self.keyring.source(kid, algorithm)
+                calls = [executor.run(_decode_batch_in_process, self.engine, chunk, key_source, algorithm, **options) for chunk in chunks]
+            else:
+                calls = [executor.run(_decode_batch, self.engine, chunk, key, **options) for chunk in chunks]
+
+            decoded = []
+            for chunk, outcome in zip(chunks, await asyncio.gather(*calls, return_exceptions=True)):
+                if isinstance(outcome, BaseException):  # e.g. VerificationQueueFull, the chunk could not be verified
+                    if not isinstance(outcome, Exception):
+                        raise outcome
+                    outcome = [outcome] * len(chunk)
+                decoded.extend(outcome)
+
+        for token, outcome in zip(tokens, decoded):
+            if isinstance(outcome, Exception):
+                results[token] = VerificationResult(error=self._reject(token, outcome))
+            else:
+                results[token] = VerificationResult(*self._accept(token, outcome))
+
+    def _reject(self, token: str, error: Exception) -> Exception:
+        """ Remembers a rejected token in the negative cache """
+        if self.negative_cache is not None and isinstance(error, InvalidToken):
+            self.negative_cache.set(token, (type(error), error.args, vars(error)))  # The attributes keep e.g. the claims of a TokenHasExpired
+        return error
+
+    @staticmethod
+    def _rejected(rejected: tuple) -> Exception:
+        """ Recreates the error of a token from the negative cache """
+        error_type, error_args, error_attributes = rejected
+        error = error_type(*error_args)
+        vars(error).update(error_attributes)
+        return error
+
+    def _timed(self, phase: str, function: callable, *args):
+        """ Calls a function and reports its duration as phase to the metrics """
+        if not self.metrics.enabled:
+            return function(*args)
+
+        started = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.metrics.observe(phase, time.perf_counter() - started)
+
+    async def _share(self, token: str, decoded_token: dict):
+        """ Stores the claims of a verified token in the shared cache for the other workers """
+        await self.shared_cache.set(self._shared_namespace + token, decoded_token, expires_at=decoded_token.get("exp"))
+
+    async def _verify_admitted(self, token: str) -> Tuple[dict, AuthCredentials, BaseUser]:
+        """ Verifies a token once the admission controller grants a slot. Tokens in the shared cache, and writing to it, don't hold a slot """
+        if self.shared_cache is not None:
+            claims = await self.shared_cache.get(self._shared_namespace + token)
+            if claims is not None:  # Another worker has already verified the token
+                self.metrics.increment("shared_cache_hit")
+                return self._accept(token, claims)
+            self.metrics.increment("shared_cache_miss")
+
+        if self.admission is None:
+            verified = await self._verify(token)
+        else:
+            async with self.admission.slot():
+                verified = await self._verify(token)
+
+        if self.shared_cache is not None:
+            await self._share(token, verified[0])
+        return verified
+
+    async def _verify(self, token: str) -> Tuple[dict, AuthCredentials, BaseUser]:
+        started = time.perf_counter() if self.metrics.enabled else None
+        header = self.engine.get_unverified_header(token)
+        decoded_token = await self._decode(token, header.get("kid"), header.get("alg"))
+        if started is not None:
+            self.metrics.observe("decode", time.perf_counter() - started)
+
+        return self._accept(token, decoded_token)
+
+    def _accept(self, token: str, decoded_token: dict, expires_at: float = None, cache: bool = True) -> Tuple[dict, AuthCredentials, BaseUser]:
+        """ Creates the credentials and the user of a verified token and, unless cache is False, caches them until expires_at, by default the token's 'exp' """
+        if self.lazy:  # Routes that never access request.auth or request.user never pay for them
+            credentials = LazyAuthCredentials(lambda: self._timed("get_scopes", self.get_scopes, decoded_token))
+            user = LazyUser(lambda: self._timed("get_user", self.get_user, decoded_token))
+        else:
+            credentials = ScopeCredentials(self._timed("get_scopes", self.get_scopes, decoded_token))
+            user = self._timed("get_user", self.get_user, decoded_token)
 
-        scopes = self.get_scopes(decoded_token)
-        user = self.get_user(decoded_token)
+        verified = (decoded_token, credentials, user)
+        if cache and self.token_cache is not None:
+            self.token_cache.set(token, verified, expires_at=decoded_token.get("exp") if expires_at is None else expires_at)
 
-        return AuthCredentials(scopes=scopes), user
+        return verified
@@ -0,0 +1,89 @@
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional
+
+from fastapi_auth_middleware.routes import RouteIndex
+from fastapi_auth_middleware.scopes import ScopeSet, intern_scopes
+
+
+class ScopePolicy:
+    """ Required scopes per route, checked by the middleware before the app is called. Unlike `requires`, unauthorized requests never enter the app stack.
+
+    The policy is compiled once: every scope that occurs in it gets a bit, and the routes are compiled into a RouteIndex of required bitmasks. A request costs one route
+    lookup and a bitwise AND, the bitmask of a token's scopes is cached per ScopeSet.
+
+    Examples:
+        ```python
+        policy = ScopePolicy({
+            "GET /items/*": "items:read",
+            "POST /items/*": ["items:read", "items:write"],
+            "^/admin/.*$": "admin",
+        })
+        app.add_middleware(OAuth2Middleware, public_key=public_key, scope_policy=policy)
+        ```
+    """
+
+    def __init__(self, routes: Dict[Any, str or Iterable[str]]):
+        """ ScopePolicy Constructor
+
+        Args:
+            routes (Dict[Any, str or Iterable[str]]): {route: required scopes}. Routes are described in RouteIndex. A single scope may be passed as str, every scope of a list
+                                                      is required. Requests to routes that aren't listed are allowed
+        """
+        self.routes = routes
+        self.bits: Dict[str, int] = {}  # {scope: bit}
+
+        for required in routes.values():
+            for scope in self._scopes(required):
+                self.bits.setdefault(scope, 1 << len(self.bits))
+
+        self.index = RouteIndex({route: self._required_mask(required) for route, required in routes.items()})
+        self.mask = lru_cache(maxsize=4096)(self._mask)  # Identical scopes share one ScopeSet, so hits are the rule
+
+    @staticmethod
+    def _scopes(required: str or Iterable[str]) -> Iterable[str]:
+        return [required] if isinstance(required, str) else required
+
+    def _required_mask(self, required: str or Iterable[str]) -> int:
+        mask = 0
+        for scope in self._scopes(required):
+            mask |= self.bits[scope]
+        return mask
+
+    def _mask(self, scopes: ScopeSet) -> int:
+        """ Bitmask of the scopes, scopes that are not part of the policy are ignored """
+        mask = 0
+        for scope in scopes:
+            mask |= self.bits.get(scope, 0)
+        return mask
+
+    def required(self, method: Optional[str], path: str) -> int:
+        """ Looks up the bitmask of the scopes a route requires
+
+        Args:
+            method (str): HTTP method of the request, None for websockets
+            path (str): Path of the request, most likely scope["path"]
+
+        Returns:
+            int: The bitmask, 0 if the route requires no scopes
+        """
+        required = self.index.match(method, path)
+        return 0 if required is None else required
+
+    def allows(self, method: Optional[str], path: str, scopes: Iterable[str]) -> bool:
+        """ Checks whether the scopes satisfy the policy of a route
+
+        Args:
+            method (str): HTTP method of the request, None for websockets
+            path (str): Path of the request, most likely scope["path"]
+            scopes (Iterable[str]): Scopes of the request, most likely request.auth.scopes
+
+        Returns:
+            bool: True if the route requires no scopes or all of them are present
+        """
+        required = self.required(method, path)
+        if not required:
+            return True
+        return self.mask(intern_scopes(scopes)) & required == required
+
+    def __bool__(self) -> bool:
+        return bool(self.index)
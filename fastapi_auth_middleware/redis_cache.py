@@ -0,0 +1,178 @@
+import asyncio
+import json
+import time
+from typing import List, Optional
+
+from fastapi_auth_middleware.cache import TokenCache
+from fastapi_auth_middleware.cache_backends import CacheBackend
+
+
+class RedisError(Exception):
+    """ Error reply of the Redis server """
+    pass
+
+
+def _encode_command(*arguments) -> bytes:
+    """ Encodes a command as RESP array of bulk strings """
+    parts = [b"*%d\r\n" % len(arguments)]
+    for argument in arguments:
+        data = argument if isinstance(argument, bytes) else str(argument).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+async def _read_reply(reader: asyncio.StreamReader):
+    """ Reads one RESP2 reply. Bulk strings are returned as bytes, error replies are raised as RedisError """
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection closed by the Redis server")
+
+    kind, data = line[:1], line[1:-2]
+    if kind == b"+":
+        return data
+    if kind == b"-":
+        raise RedisError(data.decode(errors="replace"))
+    if kind == b":":
+        return int(data)
+    if kind == b"$":
+        length = int(data)
+        if length == -1:  # Nil, e.g. GET of an unknown key
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if kind == b"*":
+        length = int(data)
+        if length == -1:
+            return None
+        return [await _read_reply(reader) for _ in range(length)]
+
+    raise RedisError(f"Unknown reply type {kind!r}")
+
+
+class _Connection:
+    __slots__ = ("reader", "writer")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def execute(self, *arguments):
+        self.writer.write(_encode_command(*arguments))
+        await self.writer.drain()
+        return await _read_reply(self.reader)
+
+    def close(self):
+        self.writer.close()
+
+
+class RedisCacheBackend(CacheBackend):
+    """ Cache backend in Redis, shared by all workers on all hosts. Speaks the Redis protocol (RESP) itself, so there's no additional dependency.
+
+    Entries are stored with SET ... PX and expire in Redis together with the token. Keys are a digest of the token, the raw token is never sent to Redis. The cache fails
+    open: if Redis is slow or unavailable, a lookup is a miss and the token is verified as usual.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0, password: str = None, prefix: str = "fastapi-auth:", ttl: float = None,
+                 timeout: float = 0.25, max_connections: int = 8):
+        """ RedisCacheBackend Constructor. Connections are opened on first use
+
+        Args:
+            host (str): Optional: Host of the Redis server. Default is "127.0.0.1"
+            port (int): Optional: Port of the Redis server. Default is 6379
+            db (int): Optional: Database to SELECT. Default is 0
+            password (str): Optional: Password to AUTH with. Default will not authenticate
+            prefix (str): Optional: Prefix of all keys. Entries of backends with different verification settings never collide, see CacheBackend. Default is "fastapi-auth:"
+            ttl (float): Optional: See CacheBackend
+            timeout (float): Optional: Seconds a command, including connecting, may take before it's treated as a miss. Default is 0.25
+            max_connections (int): Optional: Maximum number of connections per event loop, further commands wait for a free connection. Default is 8
+        """
+        super().__init__(ttl=ttl)
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.prefix = prefix.encode()
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.last_error: Optional[Exception] = None  # Most recent failure, for health checks
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._idle: List[_Connection] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _key(self, token: str) -> bytes:
+        return self.prefix + TokenCache.digest(token).hex().encode()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:  # Connections and the semaphore are bound to the loop that created them
+            self._loop = loop
+            self._idle = []
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+        return self._semaphore
+
+    async def _connect(self) -> _Connection:
+        connection = _Connection(*await asyncio.open_connection(self.host, self.port))
+        try:
+            if self.password is not None:
+                await connection.execute("AUTH", self.password)
+            if self.db:
+                await connection.execute("SELECT", self.db)
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    async def _execute(self, *arguments):
+        async with self._get_semaphore():
+            connection = self._idle.pop() if self._idle else await self._connect()
+            try:
+                reply = await connection.execute(*arguments)
+            except BaseException:  # The connection's state is unknown, e.g. a reply might still be pending after a timeout
+                connection.close()
+                raise
+            self._idle.append(connection)
+            return reply
+
+    async def execute(self, *arguments):
+        """ Executes a command with the backend's timeout
+
+        Args:
+            *arguments: Command and arguments, e.g. "GET", "key"
+
+        Returns:
+            The reply: bytes, int, list or None
+
+        Raises:
+            RedisError: If the server replies with an error
+            OSError: If the server can't be reached
+            asyncio.TimeoutError: If the command did not complete within the timeout
+        """
+        return await asyncio.wait_for(self._execute(*arguments), self.timeout)
+
+    async def get(self, token: str) -> Optional[dict]:
+        try:
+            payload = await self.execute("GET", self._key(token))
+        except (RedisError, OSError, asyncio.TimeoutError) as error:  # Fail open, verify the token instead
+            self.last_error = error
+            return None
+
+        return None if payload is None else json.loads(payload)
+
+    async def set(self, token: str, claims: dict, expires_at: float = None):
+        expires_at = self.expires_at(expires_at)
+        if expires_at is None:
+            return
+
+        milliseconds = int((expires_at - time.time()) * 1000)
+        if milliseconds <= 0:  # Already expired
+            return
+
+        try:
+            await self.execute("SET", self._key(token), json.dumps(claims, separators=(",", ":")), "PX", milliseconds)
+        except (RedisError, OSError, asyncio.TimeoutError) as error:
+            self.last_error = error
+
+    async def close(self):
+        """ Closes the idle connections of the running event loop """
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
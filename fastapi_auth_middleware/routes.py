@@ -0,0 +1,141 @@
+import re
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Tuple
+
+HTTP_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "TRACE", "CONNECT"})
+
+
+class _PrefixNode:
+    __slots__ = ("children", "values")
+
+    def __init__(self):
+        self.children: Dict[str, "_PrefixNode"] = {}
+        self.values: Dict[Optional[str], Any] = {}  # {method: value}, None matches every method
+
+
+class RouteIndex:
+    """ Routes compiled into a fast lookup structure: a dict for exact paths, a prefix trie for '/path/*' routes and one combined regex for patterns
+
+    Routes are strings, optionally prefixed with an HTTP method:
+
+        "/login"                   exact path, every method
+        "GET /health"              exact path, GET only
+        "/public/*"                "/public" and everything below it
+        "^/items/[0-9]+$"          regular expression (must match the full path)
+        re.compile("/static/.*")   precompiled regular expression
+
+    Exact paths take precedence over prefixes (longest prefix wins) and prefixes over patterns. Method specific routes take precedence over routes for every method.
+    """
+
+    def __init__(self, routes: Dict[Any, Any] or Iterable[Any] = None):
+        """ RouteIndex Constructor
+
+        Args:
+            routes (Dict[Any, Any] or Iterable[Any]): Optional: Routes as described above. Either a dict of {route: value} or an iterable of routes, whose values are True
+        """
+        if routes is None:
+            routes = {}
+        elif not isinstance(routes, dict):
+            routes = {route: True for route in routes}
+
+        self.routes = routes
+        self._exact: Dict[Tuple[Optional[str], str], Any] = {}
+        self._prefixes = _PrefixNode()
+        self._has_prefixes = False
+        patterns: Dict[Optional[str], List[Tuple[str, Any]]] = {}
+
+        for route, value in routes.items():
+            method, path = self._parse(route)
+
+            if isinstance(path, Pattern):
+                patterns.setdefault(method, []).append((path.pattern, value))
+            elif path.startswith("^"):
+                patterns.setdefault(method, []).append((path, value))
+            elif path.endswith("/*"):
+                self._insert_prefix(method, path[:-2], value)
+            else:
+                self._exact[(method, path)] = value
+
+        self._patterns: Dict[Optional[str], Tuple[Pattern, Dict[str, Any]]] = {method: self._combine(entries) for method, entries in patterns.items()}
+        self._empty = not routes
+
+    @staticmethod
+    def _parse(route: Any) -> Tuple[Optional[str], Any]:
+        if isinstance(route, str):
+            method, _, path = route.partition(" ")
+            if path and method.upper() in HTTP_METHODS:
+                return method.upper(), path.strip()
+        return None, route
+
+    @staticmethod
+    def _segments(path: str) -> List[str]:
+        return [segment for segment in path.split("/") if segment]
+
+    def _insert_prefix(self, method: Optional[str], prefix: str, value: Any):
+        node = self._prefixes
+        for segment in self._segments(prefix):
+            node = node.children.setdefault(segment, _PrefixNode())
+        node.values[method] = value
+        self._has_prefixes = True
+
+    @staticmethod
+    def _combine(entries: List[Tuple[str, Any]]) -> Tuple[Pattern, Dict[str, Any]]:
+        values = {f"_route{index}": value for index, (_, value) in enumerate(entries)}
+        combined = "|".join(f"(?P<_route{index}>{pattern})" for index, (pattern, _) in enumerate(entries))
+        return re.compile(combined), values
+
+    def _match_prefix(self, method: Optional[str], path: str) -> Optional[Any]:
+        node, match = self._prefixes, None
+
+        for segment in [None] + self._segments(path):  # None stands for the root node ("/*")
+            if segment is not None:
+                node = node.children.get(segment)
+                if node is None:
+                    break
+            if method in node.values:
+                match = node.values[method]
+            elif None in node.values:
+                match = node.values[None]
+
+        return match
+
+    def _match_pattern(self, method: Optional[str], path: str) -> Optional[Any]:
+        for key in (method, None):
+            compiled = self._patterns.get(key)
+            if compiled is not None:
+                pattern, values = compiled
+                match = pattern.fullmatch(path)
+                if match is not None:
+                    return values[match.lastgroup]
+        return None
+
+    def match(self, method: Optional[str], path: str) -> Optional[Any]:
+        """ Looks up the value of the route matching a request
+
+        Args:
+            method (str): HTTP method of the request, None for websockets
+            path (str): Path of the request, most likely scope["path"]
+
+        Returns:
+            Any: The value of the matching route or None if no route matches
+        """
+        if self._empty:
+            return None
+
+        value = self._exact.get((method, path))
+        if value is None:
+            value = self._exact.get((None, path))
+
+        if value is None and self._has_prefixes:
+            value = self._match_prefix(method, path)
+
+        if value is None and self._patterns:
+            value = self._match_pattern(method, path)
+
+        return value
+
+    def __contains__(self, route: Tuple[Optional[str], str]) -> bool:
+        method, path = route
+        return self.match(method, path) is not None
+
+    def __bool__(self) -> bool:
+        return not self._empty
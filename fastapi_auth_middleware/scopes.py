@@ -0,0 +1,74 @@
+import sys
+from functools import lru_cache
+from typing import Iterable, Tuple
+
+from starlette.authentication import AuthCredentials
+
+
+class ScopeSet(frozenset):
+    """ Immutable set of scopes with O(1) membership checks that keeps the order of the scopes for iteration (e.g. when returned as JSON) """
+
+    __slots__ = ("_order",)
+
+    def __new__(cls, scopes: Iterable[str] = ()):
+        order = tuple(dict.fromkeys(sys.intern(scope) for scope in scopes))  # Deduplicated, in order of appearance
+        instance = super().__new__(cls, order)
+        instance._order = order
+        return instance
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self._order)!r})"
+
+
+EMPTY_SCOPES = ScopeSet()
+
+
+@lru_cache(maxsize=4096)
+def parse_scopes(scope: str) -> ScopeSet:
+    """ Parses a space separated 'scope' claim. Identical claims share one ScopeSet instance
+
+    Args:
+        scope (str): The 'scope' claim of a token, e.g. "read write"
+
+    Returns:
+        ScopeSet: The scopes of the claim
+    """
+    return ScopeSet(scope.split())
+
+
+@lru_cache(maxsize=4096)
+def _intern_scopes(scopes: Tuple[str, ...]) -> ScopeSet:
+    return ScopeSet(scopes)
+
+
+def intern_scopes(scopes: Iterable[str]) -> ScopeSet:
+    """ Converts scopes into a ScopeSet. Identical scopes share one ScopeSet instance
+
+    Args:
+        scopes (Iterable[str]): Scopes, e.g. as returned by get_scopes or verify_header
+
+    Returns:
+        ScopeSet: The interned scopes
+    """
+    if isinstance(scopes, ScopeSet):
+        return scopes
+
+    if scopes is None:
+        return EMPTY_SCOPES
+
+    return _intern_scopes(tuple(scopes))
+
+
+class ScopeCredentials(AuthCredentials):
+    """ AuthCredentials holding an interned ScopeSet instead of a list, so `requires` checks are set lookups """
+
+    def __init__(self, scopes: Iterable[str] = None):  # noqa  # AuthCredentials.__init__ would copy the scopes into a list
+        """ ScopeCredentials Constructor
+
+        Args:
+            scopes (Iterable[str]): Optional: The scopes. Default is no scopes
+        """
+        self.scopes = intern_scopes(scopes)
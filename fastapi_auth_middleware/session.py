@@ -0,0 +1,106 @@
+import binascii
+import hmac
+import json
+import time
+from typing import List, Optional, Tuple
+
+from fastapi_auth_middleware.encoding import b64url_decode, b64url_encode
+from fastapi_auth_middleware.exceptions import InvalidToken
+
+
+class SessionExpired(InvalidToken):
+    pass
+
+
+class SessionTokenSigner:
+    """ Issues and verifies short-lived session tokens, signed with HMAC-SHA256 instead of the identity provider's asymmetric key.
+
+    Once the OAuth2Middleware has verified an access token, it returns a session token with the same claims in a response header. Clients that send the session token
+    instead of the access token are verified with a constant time HMAC comparison, which is far cheaper than an RSA or EC signature. A session token never outlives the
+    access token it was issued for. Session tokens look like "fas1.<claims>.<signature>", so they are told apart from JWTs by their prefix.
+    """
+
+    PREFIX = "fas1."
+    EXPIRY_CLAIM = "_session_exp"  # Added to the claims inside the token and removed again when it's verified
+
+    def __init__(self, secret: str or bytes, lifetime: float = 300, previous_secrets: List[str or bytes] = None, header: str = "New-Session-Token"):
+        """ SessionTokenSigner Constructor
+
+        Args:
+            secret (str or bytes): Key to sign session tokens with, at least 32 bytes. Must be the same for all workers that should accept each other's tokens
+            lifetime (float): Optional: Seconds a session token is valid, never longer than the access token's 'exp'. Default is 300
+            previous_secrets (List[str or bytes]): Optional: Keys that are still accepted, but no longer used to sign, e.g. during a key rotation. Default is none
+            header (str): Optional: Response header that delivers new session tokens. Default is "New-Session-Token"
+
+        Raises:
+            ValueError: If a secret is shorter than 32 bytes
+        """
+        self.keys = [self._key(secret)] + [self._key(previous) for previous in previous_secrets or []]
+        self.lifetime = lifetime
+        self.header = header
+
+    @staticmethod
+    def _key(secret: str or bytes) -> bytes:
+        key = secret.encode() if isinstance(secret, str) else secret
+        if len(key) < 32:
+            raise ValueError("Session secrets must be at least 32 bytes long")
+        return key
+
+    @classmethod
+    def is_session_token(cls, token: str) -> bool:
+        """ Checks whether a token is a session token by its prefix, without verifying it """
+        return token.startswith(cls.PREFIX)
+
+    def issue(self, claims: dict) -> Optional[str]:
+        """ Issues a session token for the claims of a verified access token
+
+        Args:
+            claims (dict): The decoded access token
+
+        Returns:
+            str: The session token or None if the access token has already expired
+        """
+        expires_at = time.time() + self.lifetime
+        access_token_expires_at = claims.get("exp")
+        if isinstance(access_token_expires_at, (int, float)):
+            expires_at = min(expires_at, access_token_expires_at)  # Never valid longer than the access token
+
+        if expires_at <= time.time():
+            return None
+
+        payload = json.dumps({**claims, self.EXPIRY_CLAIM: expires_at}, separators=(",", ":")).encode()
+        signing_input = self.PREFIX + b64url_encode(payload)
+        return f"{signing_input}.{b64url_encode(hmac.digest(self.keys[0], signing_input.encode(), 'sha256'))}"
+
+    def verify(self, token: str) -> Tuple[dict, float]:
+        """ Verifies a session token
+
+        Args:
+            token (str): A session token
+
+        Returns:
+            Tuple[dict, float]: The claims of the access token it was issued for and the expiry of the session token
+
+        Raises:
+            InvalidToken: If the token is malformed or its signature does not match
+            SessionExpired: If the session token has expired
+        """
+        signing_input, _, signature_segment = token.rpartition(".")
+        if not signing_input.startswith(self.PREFIX) or "." in signing_input[len(self.PREFIX):]:
+            raise InvalidToken("Invalid session token")
+
+        try:
+            signature = b64url_decode(signature_segment)
+        except (binascii.Error, ValueError):
+            raise InvalidToken("Invalid session token") from None
+
+        message = signing_input.encode()
+        if not any(hmac.compare_digest(hmac.digest(key, message, "sha256"), signature) for key in self.keys):
+            raise InvalidToken("Signature verification failed.")
+
+        claims = json.loads(b64url_decode(signing_input[len(self.PREFIX):]))
+        expires_at = claims.pop(self.EXPIRY_CLAIM)
+        if expires_at <= time.time():
+            raise SessionExpired("Session token has expired")
+
+        return claims, expires_at
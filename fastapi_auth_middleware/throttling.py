@@ -0,0 +1,75 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from starlette.types import Scope
+
+
+def get_client_host(scope: Scope) -> Optional[str]:
+    """ Returns the client address of a request
+
+    Args:
+        scope (Scope): The ASGI scope of the request
+
+    Returns:
+        str: The host of the client or None if the server did not provide it
+    """
+    client = scope.get("client")
+    return client[0] if client else None
+
+
+class FailureBudget:
+    """ Counts failed authentications per client within a fixed time window. Once a client has used up its budget, its requests are rejected without verifying them """
+
+    def __init__(self, max_failures: int = 20, window: float = 60, max_clients: int = 10000):
+        """ FailureBudget Constructor
+
+        Args:
+            max_failures (int): Optional: Failed authentications a client may have per window. Default is 20
+            window (float): Optional: Length of a window in seconds. Default is 60
+            max_clients (int): Optional: Number of clients that are tracked at once, the least recently failing client is forgotten first. Default is 10000
+        """
+        self.max_failures = max_failures
+        self.window = window
+        self.max_clients = max_clients
+        self._clients: OrderedDict = OrderedDict()  # {client: (window start, failures)}
+
+    def exhausted(self, client: Optional[str]) -> bool:
+        """ Checks whether a client has used up its budget
+
+        Args:
+            client (str): The client, most likely its IP address. None is never throttled
+
+        Returns:
+            bool: True if the client's requests should be rejected
+        """
+        entry = self._clients.get(client)
+        if entry is None:
+            return False
+
+        started, failures = entry
+        if time.monotonic() - started >= self.window:  # Window has passed, the budget is restored
+            del self._clients[client]
+            return False
+
+        return failures >= self.max_failures
+
+    def record_failure(self, client: Optional[str]):
+        """ Records a failed authentication of a client
+
+        Args:
+            client (str): The client, most likely its IP address. None is not tracked
+        """
+        if client is None:
+            return
+
+        now = time.monotonic()
+        started, failures = self._clients.get(client, (now, 0))
+        if now - started >= self.window:
+            started, failures = now, 0
+
+        self._clients[client] = (started, failures + 1)
+        self._clients.move_to_end(client)
+
+        while len(self._clients) > self.max_clients:
+            self._clients.popitem(last=False)
@@ -0,0 +1,18 @@
+import pytest
+
+from fastapi_auth_middleware.engines import get_engine
+
+
+@pytest.fixture
+def decode_calls(monkeypatch) -> list:
+    """ Records the token of every call to the default engine's decode, i.e. every signature verification """
+    calls = []
+    engine = get_engine()
+    decode = engine.decode
+
+    def decode_and_record(token, *args, **kwargs):
+        calls.append(token)
+        return decode(token, *args, **kwargs)
+
+    monkeypatch.setattr(engine, "decode", decode_and_record)
+    return calls
@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from fastapi_auth_middleware import AdmissionController, AuthMiddleware, FastAPIUser, InProcessCacheBackend, OAuth2Middleware, PrometheusMetrics, TokenCache
+from fastapi_auth_middleware.exceptions import ServiceOverloaded
+from fastapi_auth_middleware.oauth2_middleware import OAuth2Backend
+from tests.keys import PUBLIC_KEY, sign_token
+
+
+def busy(admission: AdmissionController) -> AdmissionController:
+    """ Takes all slots, as if other verifications were running """
+    admission.in_flight = admission.max_concurrency
+    return admission
+
+
+class TestAdmissionController:
+
+    def test_limits_concurrency(self):
+        admission = AdmissionController(max_concurrency=2, max_queue=10)
+        running, peak = 0, 0
+
+        async def verification():
+            nonlocal running, peak
+            async with admission.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        async def main():
+            await asyncio.gather(*(verification() for _ in range(8)))
+
+        asyncio.run(main())
+        assert peak == 2
+        assert admission.in_flight == 0 and admission.queue_depth == 0
+
+    def test_fifo(self):
+        admission = AdmissionController(max_concurrency=1, max_queue=10)
+        order = []
+
+        async def verification(index):
+            async with admission.slot():
+                order.append(index)
+                await asyncio.sleep(0)
+
+        async def main():
+            await asyncio.gather(*(verification(index) for index in range(5)))
+
+        asyncio.run(main())
+        assert order == [0, 1, 2, 3, 4]
+
+    def test_queue_full(self):
+        admission = AdmissionController(max_concurrency=1, max_queue=1)
+
+        async def main():
+            await admission.acquire()
+            waiting = asyncio.ensure_future(admission.acquire())
+            await asyncio.sleep(0)
+            assert admission.queue_depth == 1
+
+            with pytest.raises(ServiceOverloaded):
+                await admission.acquire()
+
+            admission.release()  # Handed to the waiting verification
+            await waiting
+            assert admission.in_flight == 1 and admission.queue_depth == 0
+            admission.release()
+
+        asyncio.run(main())
+        assert admission.rejected == 1
+        assert admission.in_flight == 0
+
+    def test_queue_timeout(self):
+        admission = busy(AdmissionController(max_concurrency=1, queue_timeout=0.01))
+        with pytest.raises(ServiceOverloaded):
+            asyncio.run(admission.acquire())
+        assert admission.queue_depth == 0
+
+    def test_cancelled_waiter(self):
+        admission = AdmissionController(max_concurrency=1)
+
+        async def main():
+            await admission.acquire()
+            waiting = asyncio.ensure_future(admission.acquire())
+            await asyncio.sleep(0)
+            waiting.cancel()
+            await asyncio.sleep(0)
+            assert admission.queue_depth == 0
+            admission.release()
+
+        asyncio.run(main())
+        assert admission.in_flight == 0
+
+    def test_retry_after(self):
+        assert AdmissionController(retry_after=5).get_retry_after() == 5
+        assert AdmissionController(retry_after=lambda admission: 1 + admission.queue_depth).get_retry_after() == 1
+
+
+class TestOAuth2BackendAdmission:
+
+    def test_cached_tokens_pass(self):
+        admission = AdmissionController(max_concurrency=1, max_queue=0)
+        backend = OAuth2Backend(public_key=PUBLIC_KEY, get_scopes=None, get_user=None, issuer=None, audience=None, decode_token_options=None, algorithms=["RS256"],
+                                token_cache=TokenCache(), admission=admission)
+        cached, uncached = sign_token(sub="1"), sign_token(sub="2")
+        asyncio.run(backend.verify_header(f"Bearer {cached}"))
+
+        busy(admission)
+        claims, _, _ = asyncio.run(backend.verify_header(f"Bearer {cached}"))
+        assert claims["sub"] == "1"
+        with pytest.raises(ServiceOverloaded):
+            asyncio.run(backend.verify_header(f"Bearer {uncached}"))
+
+
+    def test_shared_cache_hits_pass(self):
+        admission = AdmissionController(max_concurrency=1, max_queue=0)
+        shared_cache = InProcessCacheBackend()
+
+        def oauth2_backend():
+            return OAuth2Backend(public_key=PUBLIC_KEY, get_scopes=None, get_user=None, issuer=None, audience=None, decode_token_options=None, algorithms=["RS256"],
+                                 shared_cache=shared_cache, admission=admission)
+
+        token = sign_token()
+        asyncio.run(oauth2_backend().verify_header(f"Bearer {token}"))  # Verified and shared by one worker
+
+        busy(admission)
+        claims, _, _ = asyncio.run(oauth2_backend().verify_header(f"Bearer {token}"))  # Read by another worker without a slot
+        assert claims["sub"] == "1"
+        assert admission.rejected == 0
+
+
+class TestMiddlewareAdmission:
+
+    @staticmethod
+    def create_app(middleware, **kwargs) -> FastAPI:
+        app = FastAPI()
+        app.add_middleware(middleware, **kwargs)
+
+        @app.get("/")
+        def home():
+            return {}
+
+        return app
+
+    def test_oauth2_middleware(self):
+        admission = AdmissionController(max_concurrency=1, max_queue=0, retry_after=3)
+        metrics = PrometheusMetrics()
+        client = TestClient(self.create_app(OAuth2Middleware, public_key=PUBLIC_KEY, admission=admission, metrics=metrics))
+        assert client.get("/", headers={"Authorization": f"Bearer {sign_token()}"}).status_code == 200
+
+        busy(admission)
+        response = client.get("/", headers={"Authorization": f"Bearer {sign_token(sub='2')}"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "3"
+        assert metrics.count("overloaded") == 1
+        assert "fastapi_auth_admission_in_flight 1" in metrics.render()
+        assert "fastapi_auth_admission_queue_depth 0" in metrics.render()
+
+    def test_auth_middleware(self):
+        def verify_header(headers):
+            return [], FastAPIUser(first_name="Code", last_name="Specialist", user_id=1)
+
+        admission = AdmissionController(max_concurrency=1, max_queue=0)
+        client = TestClient(self.create_app(AuthMiddleware, verify_header=verify_header, admission=admission))
+        assert client.get("/", headers={"Authorization": "Bearer x"}).status_code == 200
+
+        busy(admission)
+        response = client.get("/", headers={"Authorization": "Bearer x"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,307 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+from fastapi import FastAPI
+from starlette.requests import Request
+from starlette.testclient import TestClient
+
+from fastapi_auth_middleware import InProcessCacheBackend, OAuth2Middleware, PrometheusMetrics, RedisCacheBackend, SharedMemoryCacheBackend, TokenCache
+from fastapi_auth_middleware.exceptions import InvalidToken, TokenHasExpired
+from fastapi_auth_middleware.oauth2_middleware import OAuth2Backend
+from fastapi_auth_middleware.redis_cache import RedisError, _read_reply
+from tests.keys import PUBLIC_KEY, sign_token
+
+
+class FakeRedis:
+    """ Minimal Redis server that understands AUTH, SELECT, GET and SET ... PX, running on its own event loop """
+
+    def __init__(self, password: str = None):
+        self.password = password
+        self.data = {}
+        self.commands = []
+        self.delay = 0
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> "FakeRedis":
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def __exit__(self, *args):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.ready.set()
+        self.loop.run_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        authenticated = self.password is None
+        while True:
+            try:
+                command = await _read_reply(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                break
+            name = command[0].upper()
+            self.commands.append(name)
+            await asyncio.sleep(self.delay)
+
+            if name == b"AUTH":
+                authenticated = command[1].decode() == self.password
+                writer.write(b"+OK\r\n" if authenticated else b"-WRONGPASS invalid password\r\n")
+            elif not authenticated:
+                writer.write(b"-NOAUTH Authentication required.\r\n")
+            elif name == b"SELECT":
+                writer.write(b"+OK\r\n")
+            elif name == b"GET":
+                value, expires_at = self.data.get(command[1], (None, 0))
+                if value is None or expires_at <= time.time():
+                    writer.write(b"$-1\r\n")
+                else:
+                    writer.write(b"$%d\r\n%s\r\n" % (len(value), value))
+            elif name == b"SET" and command[3].upper() == b"PX":
+                self.data[command[1]] = (command[2], time.time() + int(command[4]) / 1000)
+                writer.write(b"+OK\r\n")
+            else:
+                writer.write(b"-ERR unknown command\r\n")
+            await writer.drain()
+        writer.close()
+
+
+@pytest.fixture
+def redis():
+    with FakeRedis() as server:
+        yield server
+
+
+def backend(shared_cache, **kwargs) -> OAuth2Backend:
+    settings = dict(public_key=PUBLIC_KEY, get_scopes=None, get_user=None, issuer=None, audience=None, decode_token_options=None, algorithms=["RS256"])
+    return OAuth2Backend(shared_cache=shared_cache, **{**settings, **kwargs})
+
+
+class TestInProcessCacheBackend:
+
+    def test_get_and_set(self):
+        cache = InProcessCacheBackend()
+
+        async def main():
+            await cache.set("token", {"sub": "1"}, expires_at=time.time() + 60)
+            assert await cache.get("token") == {"sub": "1"}
+            await cache.set("lapsed", {"sub": "2"}, expires_at=time.time() - 1)
+            assert await cache.get("lapsed") is None
+            await cache.set("unbounded", {"sub": "3"})  # Tokens without exp are only cached with a ttl
+            assert await cache.get("unbounded") is None
+
+        asyncio.run(main())
+
+    def test_ttl(self):
+        cache = InProcessCacheBackend(ttl=0.05)
+
+        async def main():
+            await cache.set("token", {"sub": "1"}, expires_at=time.time() + 60)
+            await cache.set("unbounded", {"sub": "2"})
+            assert await cache.get("unbounded") == {"sub": "2"}
+            await asyncio.sleep(0.1)
+            assert await cache.get("token") is None
+
+        asyncio.run(main())
+
+
+def _share_from_other_process(path: str, token: str):
+    cache = SharedMemoryCacheBackend(path, slots=64, slot_size=256)
+    asyncio.run(cache.set(token, {"sub": "from another process"}, expires_at=time.time() + 60))
+    cache.close()
+
+
+class TestSharedMemoryCacheBackend:
+
+    @pytest.fixture
+    def path(self, tmp_path) -> str:
+        return str(tmp_path / "cache")
+
+    def test_get_and_set(self, path):
+        cache = SharedMemoryCacheBackend(path, slots=64, slot_size=256)
+
+        async def main():
+            assert await cache.get("token") is None
+            await cache.set("token", {"sub": "1", "scope": "a b"}, expires_at=time.time() + 60)
+            assert await cache.get("token") == {"sub": "1", "scope": "a b"}
+            await cache.set("token", {"sub": "1", "scope": "c"}, expires_at=time.time() + 60)  # Replaced in place
+            assert await cache.get("token") == {"sub": "1", "scope": "c"}
+            await cache.set("lapsed", {"sub": "2"}, expires_at=time.time() - 1)
+            assert await cache.get("lapsed") is None
+            await cache.set("large", {"sub": "x" * 1024}, expires_at=time.time() + 60)  # Does not fit into a slot
+            assert await cache.get("large") is None
+
+        asyncio.run(main())
+        cache.clear()
+        assert asyncio.run(cache.get("token")) is None
+        cache.close()
+
+    def test_shared_between_processes(self, path):
+        cache = SharedMemoryCacheBackend(path, slots=64, slot_size=256)
+        process = multiprocessing.get_context("spawn").Process(target=_share_from_other_process, args=(path, "token"))
+        process.start()
+        process.join()
+
+        assert process.exitcode == 0
+        assert asyncio.run(cache.get("token")) == {"sub": "from another process"}
+        cache.close()
+
+    def test_full(self, path):
+        cache = SharedMemoryCacheBackend(path, slots=4, slot_size=128)
+
+        async def main():
+            for i in range(16):
+                await cache.set(f"token{i}", {"sub": str(i)}, expires_at=time.time() + 60 + i)
+            assert await cache.get("token15") == {"sub": "15"}  # Evicts the entries that expire first
+            assert sum([await cache.get(f"token{i}") is not None for i in range(16)]) == 4
+
+        asyncio.run(main())
+        cache.close()
+
+    def test_layout_mismatch(self, path):
+        SharedMemoryCacheBackend(path, slots=64, slot_size=256).close()
+        with pytest.raises(ValueError):
+            SharedMemoryCacheBackend(path, slots=128, slot_size=256)
+
+    def test_slot_size_too_small(self, path):
+        with pytest.raises(ValueError):
+            SharedMemoryCacheBackend(path, slot_size=16)
+
+
+class TestRedisCacheBackend:
+
+    def test_get_and_set(self, redis):
+        cache = RedisCacheBackend(port=redis.port, db=2)
+
+        async def main():
+            assert await cache.get("token") is None
+            await cache.set("token", {"sub": "1"}, expires_at=time.time() + 60)
+            assert await cache.get("token") == {"sub": "1"}
+            await cache.set("lapsed", {"sub": "2"}, expires_at=time.time() - 1)
+            assert await cache.get("lapsed") is None
+            await cache.close()
+
+        asyncio.run(main())
+        assert redis.commands.count(b"SELECT") == 1  # Connections are reused
+        assert all(key.startswith(b"fastapi-auth:") and b"token" not in key for key in redis.data)
+
+    def test_expires(self, redis):
+        cache = RedisCacheBackend(port=redis.port)
+
+        async def main():
+            await cache.set("token", {"sub": "1"}, expires_at=time.time() + 0.05)
+            await asyncio.sleep(0.1)
+            assert await cache.get("token") is None
+
+        asyncio.run(main())
+
+    def test_password(self):
+        with FakeRedis(password="secret") as server:
+            assert asyncio.run(self._round_trip(RedisCacheBackend(port=server.port, password="secret"))) == {"sub": "1"}
+
+            cache = RedisCacheBackend(port=server.port, password="wrong")
+            assert asyncio.run(self._round_trip(cache)) is None
+            assert isinstance(cache.last_error, RedisError)
+
+    @staticmethod
+    async def _round_trip(cache: RedisCacheBackend):
+        await cache.set("token", {"sub": "1"}, expires_at=time.time() + 60)
+        return await cache.get("token")
+
+    def test_fails_open(self, redis):
+        redis.delay = 0.2
+        cache = RedisCacheBackend(port=redis.port, timeout=0.05)
+        assert asyncio.run(cache.get("token")) is None
+        assert isinstance(cache.last_error, asyncio.TimeoutError)
+
+        unreachable = RedisCacheBackend(port=1)
+        assert asyncio.run(unreachable.get("token")) is None
+        assert isinstance(unreachable.last_error, OSError)
+
+
+class TestOAuth2BackendSharedCache:
+
+    def test_verified_once_across_backends(self, decode_calls):
+        shared_cache = InProcessCacheBackend()
+        worker1, worker2 = backend(shared_cache), backend(shared_cache)  # Like two processes on the same shared cache
+        token = sign_token(scope="a b")
+
+        claims1, _, _ = asyncio.run(worker1.verify_header(f"Bearer {token}"))
+        claims2, credentials, user = asyncio.run(worker2.verify_header(f"Bearer {token}"))
+
+        assert len(decode_calls) == 1
+        assert claims1 == claims2
+        assert list(credentials.scopes) == ["a", "b"]
+        assert user.identity == "1"
+
+    def test_not_shared_across_verification_settings(self, decode_calls):
+        shared_cache = InProcessCacheBackend()
+        api = backend(shared_cache, audience="api", decode_token_options={"verify_aud": True})
+        other = backend(shared_cache, audience="other", decode_token_options={"verify_aud": True})  # Another service on the same shared cache
+        token = sign_token(aud="api")
+
+        asyncio.run(api.verify_header(f"Bearer {token}"))
+        with pytest.raises(InvalidToken):
+            asyncio.run(other.verify_header(f"Bearer {token}"))
+        assert len(decode_calls) == 2
+
+    def test_token_cache_first(self):
+        metrics = PrometheusMetrics()
+        shared_cache = InProcessCacheBackend()
+        worker = backend(shared_cache, token_cache=TokenCache(), metrics=metrics)
+        token = sign_token()
+
+        for _ in range(3):
+            asyncio.run(worker.verify_header(f"Bearer {token}"))
+        assert metrics.count("shared_cache_miss") == 1
+        assert metrics.count("cache_hit") == 2
+
+        asyncio.run(backend(shared_cache, metrics=metrics).verify_header(f"Bearer {token}"))
+        assert metrics.count("shared_cache_hit") == 1
+
+    def test_expired_tokens_not_shared(self):
+        shared_cache = InProcessCacheBackend()
+        worker = backend(shared_cache)
+        with pytest.raises(TokenHasExpired):
+            asyncio.run(worker.verify_header(f"Bearer {sign_token(timedelta(hours=-1))}"))
+        assert len(shared_cache.cache) == 0
+
+    def test_verify_many(self, decode_calls):
+        shared_cache = InProcessCacheBackend()
+        tokens = [sign_token(sub=str(i)) for i in range(4)]
+
+        asyncio.run(backend(shared_cache).verify_many(tokens[:2]))
+        results = asyncio.run(backend(shared_cache).verify_many(tokens))
+
+        assert len(decode_calls) == 4
+        assert [result.claims["sub"] for result in results] == ["0", "1", "2", "3"]
+
+    def test_middleware_with_redis(self, redis, decode_calls):
+        token = sign_token()
+
+        def create_app():
+            app = FastAPI()
+            app.add_middleware(OAuth2Middleware, public_key=PUBLIC_KEY, shared_cache=RedisCacheBackend(port=redis.port))
+
+            @app.get("/")
+            def home(request: Request):
+                return {"sub": request.user.identity}
+
+            return app
+
+        for _ in range(2):  # Two workers
+            with TestClient(create_app()) as client:
+                assert client.get("/", headers={"Authorization": f"Bearer {token}"}).json() == {"sub": "1"}
+        assert len(decode_calls) == 1
@@ -0,0 +1,348 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from starlette.requests import Request
+from jose import jwt
+from starlette.testclient import TestClient
+
+from fastapi_auth_middleware import AuthMiddleware, FastAPIUser, OAuth2Middleware, VerificationExecutor
+from fastapi_auth_middleware.concurrency import SingleFlight
+from fastapi_auth_middleware.exceptions import VerificationQueueFull
+from fastapi_auth_middleware.middleware import FastAPIAuthBackend
+from fastapi_auth_middleware.oauth2_middleware import OAuth2Backend
+from tests.keys import PUBLIC_KEY, PRIVATE_KEY
+
+
+def claims():
+    return {
+        "sub": "1",
+        "iat": datetime.utcnow(),
+        "exp": datetime.utcnow() + timedelta(hours=1),  # Valid for 1 hour
+        "name": "Code Specialist",
+        "scope": "a b c"
+    }
+
+
+class CountingExecutor(ThreadPoolExecutor):
+
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+def oauth2_client(public_key, algorithms, verification_executor: VerificationExecutor) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(OAuth2Middleware, public_key=public_key, algorithms=algorithms, verification_executor=verification_executor)
+
+    @app.get("/")
+    def home():
+        return 'Hello World'
+
+    return TestClient(app)
+
+
+class TestVerificationExecutor:
+
+    def test_default_executor(self):
+        executor = VerificationExecutor(max_workers=2)
+        assert isinstance(executor.executor, ThreadPoolExecutor)
+        assert not executor.is_process_pool
+        executor.shutdown()
+
+    def test_offloads(self):
+        executor = VerificationExecutor()
+        assert not executor.offloads("HS256")
+        assert executor.offloads("RS256")
+        assert executor.offloads("ES256")
+
+    def test_run(self):
+        executor = VerificationExecutor(max_workers=1)
+        thread_name = asyncio.run(executor.run(lambda: threading.current_thread().name))
+        assert thread_name.startswith("token-verification")
+
+    def test_run_raises(self):
+        def fail():
+            raise ValueError("invalid")
+
+        with pytest.raises(ValueError):
+            asyncio.run(VerificationExecutor(max_workers=1).run(fail))
+
+    def test_max_concurrency(self):
+        executor = VerificationExecutor(max_workers=4, max_concurrency=2)
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def work():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            threading.Event().wait(0.02)
+            with lock:
+                running[0] -= 1
+
+        async def main():
+            await asyncio.gather(*(executor.run(work) for _ in range(8)))
+
+        asyncio.run(main())
+        assert peak[0] == 2
+
+    def test_max_queue(self):
+        executor = VerificationExecutor(max_workers=1, max_queue=1)
+        release = threading.Event()
+
+        async def main():
+            first = asyncio.ensure_future(executor.run(release.wait))
+            second = asyncio.ensure_future(executor.run(release.wait))
+            await asyncio.sleep(0)
+            assert executor.pending == 2
+
+            with pytest.raises(VerificationQueueFull):
+                await executor.run(release.wait)
+
+            release.set()
+            await asyncio.gather(first, second)
+
+        asyncio.run(main())
+        assert executor.pending == 0
+
+
+class TestAuthMiddlewareDispatch:
+
+    @staticmethod
+    def verify_header(headers):
+        return ["authenticated"], FastAPIUser(first_name="Code", last_name="Specialist", user_id=threading.current_thread().name)
+
+    @staticmethod
+    async def verify_header_async(headers):
+        return ["authenticated"], FastAPIUser(first_name="Code", last_name="Specialist", user_id=1)
+
+    def test_dispatch_fixed_at_construction(self):
+        executor = VerificationExecutor(max_workers=1)
+        assert FastAPIAuthBackend(self.verify_header)._dispatch.__name__ == "_call_verify_header"
+        assert FastAPIAuthBackend(self.verify_header, verification_executor=executor)._dispatch.__name__ == "_run_verify_header_in_executor"
+        assert FastAPIAuthBackend(self.verify_header_async, verification_executor=executor)._dispatch.__name__ == "_await_verify_header"
+
+    def test_sync_verify_header_in_executor(self):
+        app = FastAPI()
+        app.add_middleware(AuthMiddleware, verify_header=self.verify_header, verification_executor=VerificationExecutor(max_workers=1))
+
+        @app.get("/")
+        def home(request: Request):
+            return request.user.identity
+
+        response = TestClient(app).get("/", headers={"Authorization": "ey.."})
+        assert response.status_code == 200
+        assert response.json().startswith("token-verification")
+
+
+class TestOAuth2MiddlewareVerificationExecutor:
+
+    def test_rsa_offloaded(self):
+        executor = CountingExecutor()
+        client = oauth2_client(PUBLIC_KEY, ["RS256"], VerificationExecutor(executor=executor))
+        token = jwt.encode(claims(), key=PRIVATE_KEY, algorithm="RS256")
+        assert client.get("/", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+        assert executor.submitted == 1
+
+    def test_hmac_inline(self):
+        executor = CountingExecutor()
+        client = oauth2_client("secret", ["HS256"], VerificationExecutor(executor=executor))
+        token = jwt.encode(claims(), key="secret", algorithm="HS256")
+        assert client.get("/", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+        assert executor.submitted == 0
+
+    def test_process_pool(self):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            client = oauth2_client(PUBLIC_KEY, ["RS256"], VerificationExecutor(executor=executor))
+            token = jwt.encode(claims(), key=PRIVATE_KEY, algorithm="RS256")
+            for _ in range(2):
+                assert client.get("/", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+
+
+class TestVerificationQueueFull:
+
+    @staticmethod
+    def busy_executor() -> VerificationExecutor:
+        """ Takes all workers and queue places, as if other verifications were running """
+        executor = VerificationExecutor(max_workers=1, max_queue=0)
+        executor.pending = executor.capacity
+        return executor
+
+    def test_oauth2_middleware(self):
+        client = oauth2_client(PUBLIC_KEY, ["RS256"], self.busy_executor())
+        response = client.get("/", headers={"Authorization": f"Bearer {jwt.encode(claims(), key=PRIVATE_KEY, algorithm='RS256')}"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+    def test_auth_middleware(self):
+        app = FastAPI()
+        app.add_middleware(AuthMiddleware, verify_header=TestAuthMiddlewareDispatch.verify_header, verification_executor=self.busy_executor())
+
+        @app.get("/")
+        def home():
+            return 'Hello World'
+
+        response = TestClient(app).get("/", headers={"Authorization": "ey.."})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+
+class TestSingleFlight:
+
+    def test_coalesces_concurrent_calls(self):
+        single_flight, calls = SingleFlight(), []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return object()
+
+        async def main():
+            return await asyncio.gather(*(single_flight.run("key", call) for _ in range(10)))
+
+        results = asyncio.run(main())
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+        assert len(single_flight) == 0
+
+    def test_shares_exception(self):
+        single_flight, calls = SingleFlight(), []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("invalid")
+
+        async def main():
+            return await asyncio.gather(*(single_flight.run("key", call) for _ in range(5)), return_exceptions=True)
+
+        results = asyncio.run(main())
+        assert len(calls) == 1
+        assert all(isinstance(result, ValueError) for result in results)
+
+    def test_different_keys(self):
+        single_flight, calls = SingleFlight(), []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+
+        async def main():
+            await asyncio.gather(single_flight.run("a", call), single_flight.run("b", call))
+
+        asyncio.run(main())
+        assert len(calls) == 2
+
+    def test_sequential_calls_are_not_coalesced(self):
+        single_flight, calls = SingleFlight(), []
+
+        async def call():
+            calls.append(1)
+
+        async def main():
+            await single_flight.run("key", call)
+            await single_flight.run("key", call)
+
+        asyncio.run(main())
+        assert len(calls) == 2
+
+    def test_cancelled_leader(self):
+        single_flight = SingleFlight()
+
+        calls = []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "verified"
+
+        async def main():
+            leader = asyncio.ensure_future(single_flight.run("key", call))
+            await asyncio.sleep(0)
+            followers = [asyncio.ensure_future(single_flight.run("key", call)) for _ in range(3)]
+            await asyncio.sleep(0)
+            leader.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await leader
+            return await asyncio.gather(*followers)
+
+        assert asyncio.run(main()) == ["verified"] * 3
+        assert len(calls) == 2  # One follower took over for the others
+        assert len(single_flight) == 0
+
+    def test_cancelled_follower(self):
+        single_flight = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.01)
+            return "verified"
+
+        async def main():
+            leader = asyncio.ensure_future(single_flight.run("key", call))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(single_flight.run("key", call))
+            await asyncio.sleep(0)
+            follower.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await follower
+            return await leader
+
+        assert asyncio.run(main()) == "verified"
+
+
+class TestCoalescedVerification:
+
+    def test_fastapi_auth_backend(self):
+        calls = []
+
+        async def verify_header(headers):
+            calls.append(headers["Authorization"])
+            await asyncio.sleep(0.01)
+            return ["authenticated"], FastAPIUser(first_name="Code", last_name="Specialist", user_id=1)
+
+        backend = FastAPIAuthBackend(verify_header, coalesce=True)
+
+        def scope(token):
+            return {"type": "http", "method": "GET", "path": "/", "headers": [(b"authorization", token.encode())]}
+
+        async def main():
+            return await asyncio.gather(*(backend.authenticate_scope(scope("a")) for _ in range(10)), backend.authenticate_scope(scope("b")))
+
+        asyncio.run(main())
+        assert sorted(calls) == ["a", "b"]
+
+    def test_fastapi_auth_backend_without_header(self):
+        calls = []
+
+        async def verify_header(headers):
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return [], FastAPIUser(first_name="Code", last_name="Specialist", user_id=1)
+
+        backend = FastAPIAuthBackend(verify_header, coalesce=True)
+
+        async def main():
+            await asyncio.gather(*(backend.authenticate_scope({"type": "http", "method": "GET", "path": "/", "headers": []}) for _ in range(3)))
+
+        asyncio.run(main())
+        assert len(calls) == 3  # Nothing to coalesce on
+
+    def test_oauth2_backend(self, decode_calls):
+        backend = OAuth2Backend(public_key=PUBLIC_KEY, get_scopes=None, get_user=None, issuer=None, audience=None, decode_token_options=None, algorithms=["RS256"],
+                                verification_executor=VerificationExecutor(max_workers=4), coalesce=True)
+        token = jwt.encode(claims(), key=PRIVATE_KEY, algorithm="RS256")
+
+        async def main():
+            return await asyncio.gather(*(backend.authenticate_header(f"Bearer {token}") for _ in range(10)))
+
+        results = asyncio.run(main())
+        assert len(decode_calls) == 1
+        assert all(user is results[0][1] for _, user in results)
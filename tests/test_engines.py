@@ -0,0 +1,198 @@
+import base64
+import time
+
+import jwt as pyjwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from fastapi_auth_middleware import OAuth2Middleware, Keyring, JWTEngine, CryptographyEngine, PyJWTEngine, JoseEngine
+from fastapi_auth_middleware.engines import get_engine, validate_claims
+from fastapi_auth_middleware.exceptions import InvalidToken, TokenHasExpired
+from fastapi_auth_middleware.oauth2_middleware import _decode_in_process
+from tests.keys import PUBLIC_KEY, PRIVATE_KEY
+
+ENGINES = [CryptographyEngine(), PyJWTEngine(), JoseEngine()]
+SECRET = "a-secret-that-is-long-enough-for-hs256"
+
+
+def pem(key, private: bool) -> str:
+    if private:
+        return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode()
+    return key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+
+
+EC_KEY = ec.generate_private_key(ec.SECP256R1())
+ED_KEY = ed25519.Ed25519PrivateKey.generate()
+KEYS = {  # {algorithm: (signing key, verification key)}
+    "HS256": (SECRET, SECRET),
+    "RS256": (PRIVATE_KEY, PUBLIC_KEY),
+    "ES256": (pem(EC_KEY, private=True), pem(EC_KEY, private=False)),
+    "EdDSA": (pem(ED_KEY, private=True), pem(ED_KEY, private=False)),
+}
+
+
+def sign(algorithm: str, **claims) -> str:
+    now = int(time.time())
+    return pyjwt.encode({"sub": "1", "iat": now, "exp": now + 3600, **claims}, KEYS[algorithm][0], algorithm=algorithm)
+
+
+def construct(engine: JWTEngine, algorithm: str):
+    if isinstance(engine, JoseEngine) and algorithm == "EdDSA":
+        pytest.skip("python-jose does not support EdDSA")
+    return engine.construct_key(KEYS[algorithm][1], algorithm)
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda engine: engine.name)
+class TestEngines:
+
+    @pytest.mark.parametrize("algorithm", list(KEYS))
+    def test_decode(self, engine, algorithm):
+        key = construct(engine, algorithm)
+        token = sign(algorithm, scope="a b")
+        assert engine.get_unverified_header(token)["alg"] == algorithm
+        assert engine.decode(token, key, algorithms=[algorithm])["scope"] == "a b"
+
+    @pytest.mark.parametrize("algorithm", list(KEYS))
+    def test_forged_signature(self, engine, algorithm):
+        key = construct(engine, algorithm)
+        token = sign(algorithm)
+        forged = token.rsplit(".", 1)[0] + "." + base64.urlsafe_b64encode(b"forged" * 8).decode().rstrip("=")
+        with pytest.raises(InvalidToken):
+            engine.decode(forged, key, algorithms=[algorithm])
+
+    def test_jwk(self, engine):
+        jwk = {"kty": "oct", "k": base64.urlsafe_b64encode(SECRET.encode()).decode().rstrip("=")}
+        assert engine.decode(sign("HS256"), engine.construct_key(jwk, "HS256"))["sub"] == "1"
+
+    def test_expired(self, engine):
+        key = construct(engine, "RS256")
+        with pytest.raises(TokenHasExpired) as expired:
+            engine.decode(sign("RS256", exp=int(time.time()) - 60, scope="a b"), key, algorithms=["RS256"])
+        assert expired.value.claims["scope"] == "a b"
+
+    def test_expired_with_invalid_audience(self, engine):
+        key = construct(engine, "RS256")
+        with pytest.raises(TokenHasExpired) as expired:
+            engine.decode(sign("RS256", exp=int(time.time()) - 60, aud="other"), key, audience="api")
+        assert expired.value.claims is None
+
+    def test_expired_with_leeway(self, engine):
+        key = construct(engine, "RS256")
+        assert engine.decode(sign("RS256", exp=int(time.time()) - 60), key, options={"leeway": 120})["sub"] == "1"
+
+    def test_not_yet_valid(self, engine):
+        key = construct(engine, "RS256")
+        with pytest.raises(InvalidToken):
+            engine.decode(sign("RS256", nbf=int(time.time()) + 3600), key)
+
+    def test_audience_and_issuer(self, engine):
+        key = construct(engine, "RS256")
+        token = sign("RS256", aud="api", iss="https://issuer")
+        assert engine.decode(token, key, audience="api", issuer="https://issuer")["sub"] == "1"
+        with pytest.raises(InvalidToken):
+            engine.decode(token, key, audience="other")
+        with pytest.raises(InvalidToken):
+            engine.decode(token, key, audience="api", issuer="https://other")
+
+    def test_algorithm_not_allowed(self, engine):
+        key = construct(engine, "RS256")
+        with pytest.raises(InvalidToken):
+            engine.decode(sign("RS256"), key, algorithms=["ES256"])
+
+    def test_public_key_as_hmac_secret(self, engine):
+        with pytest.raises(InvalidToken):
+            engine.construct_key(PUBLIC_KEY, "HS256")
+
+    def test_malformed_token(self, engine):
+        key = construct(engine, "RS256")
+        for token in ("garbage", "a.b", "not.a.token"):
+            with pytest.raises(InvalidToken):
+                engine.get_unverified_header(token)
+            with pytest.raises(InvalidToken):
+                engine.decode(token, key)
+
+    def test_decode_in_process(self, engine):
+        assert _decode_in_process(engine, sign("RS256"), PUBLIC_KEY, "RS256", algorithms=["RS256"])["sub"] == "1"
+
+    def test_middleware(self, engine):
+        app = FastAPI()
+        app.add_middleware(OAuth2Middleware, public_key=PUBLIC_KEY, engine=engine)
+
+        @app.get("/")
+        def home():
+            return 'Hello World'
+
+        client = TestClient(app)
+        assert client.get("/", headers={"Authorization": f"Bearer {sign('RS256')}"}).status_code == 200
+        assert client.get("/", headers={"Authorization": f"Bearer {sign('RS256', exp=int(time.time()) - 60)}"}).status_code == 401
+        assert client.get("/", headers={"Authorization": f"Bearer {sign('HS256')}"}).status_code == 401
+
+
+class TestCryptographyEngine:
+
+    def test_key_does_not_fit_algorithm(self):
+        engine = CryptographyEngine()
+        with pytest.raises(InvalidToken):
+            engine.construct_key(PUBLIC_KEY, "ES256")
+        with pytest.raises(InvalidToken):
+            engine.construct_key(KEYS["ES256"][1], "ES384")
+        with pytest.raises(InvalidToken):
+            engine.construct_key(PUBLIC_KEY, "none")
+
+    def test_key_of_other_algorithm(self):
+        engine = CryptographyEngine()
+        key = engine.construct_key(PUBLIC_KEY, "RS256")
+        token = pyjwt.encode({"sub": "1"}, PRIVATE_KEY, algorithm="PS256")
+        with pytest.raises(InvalidToken):
+            engine.decode(token, key)
+
+    def test_jwk_public_keys(self):
+        engine = CryptographyEngine()
+        for algorithm in ("RS256", "ES256", "EdDSA"):
+            jwk = pyjwt.algorithms.get_default_algorithms()[algorithm].to_jwk(
+                serialization.load_pem_public_key(KEYS[algorithm][1].encode()), as_dict=True)
+            assert engine.decode(sign(algorithm), engine.construct_key(jwk, algorithm))["sub"] == "1"
+
+    def test_private_key_verifies(self):
+        engine = CryptographyEngine()
+        assert engine.decode(sign("ES256"), engine.construct_key(KEYS["ES256"][0], "ES256"))["sub"] == "1"
+
+    def test_validate_claims(self):
+        options = {"verify_iat": True, "verify_sub": True, "require_exp": True}
+        with pytest.raises(InvalidToken):
+            validate_claims({"sub": "1"}, options)
+        with pytest.raises(InvalidToken):
+            validate_claims({"exp": "tomorrow"}, {"verify_exp": True})
+        with pytest.raises(InvalidToken):
+            validate_claims({"exp": time.time() + 60, "sub": 1}, options)
+        with pytest.raises(InvalidToken):
+            validate_claims({"aud": ["a", 1]}, {"verify_aud": True}, audience="a")
+        validate_claims({"exp": time.time() + 60, "sub": "1", "iat": int(time.time())}, options)
+
+
+class TestGetEngine:
+
+    def test_default_is_cryptography(self):
+        assert isinstance(get_engine(), CryptographyEngine)
+        assert get_engine() is get_engine()
+
+    def test_by_name(self):
+        assert isinstance(get_engine("pyjwt"), PyJWTEngine)
+        assert isinstance(get_engine("python-jose"), JoseEngine)
+        engine = JoseEngine()
+        assert get_engine(engine) is engine
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            get_engine("unknown")
+
+    def test_keyring_engine_is_used(self):
+        app = OAuth2Middleware(None, public_key=Keyring(PUBLIC_KEY, engine="pyjwt"))
+        assert isinstance(app.backend.engine, PyJWTEngine)
+
+    def test_keyring_engine_mismatch(self):
+        with pytest.raises(ValueError):
+            OAuth2Middleware(None, public_key=Keyring(PUBLIC_KEY, engine="pyjwt"), engine="python-jose")
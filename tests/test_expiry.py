@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from fastapi_auth_middleware import OAuth2Middleware, ExpiryScheduler
+from tests.keys import PUBLIC_KEY, sign_token
+
+
+class TestExpiryScheduler:
+
+    def test_fires_in_order(self):
+        scheduler = ExpiryScheduler()
+        fired = []
+
+        def record(name):
+            async def callback():
+                fired.append(name)
+            return callback
+
+        async def main():
+            now = time.time()
+            scheduler.schedule(now + 0.06, record("late"))
+            scheduler.schedule(now + 0.02, record("early"))
+            scheduler.schedule(now - 1, record("lapsed"))
+            assert len(scheduler) == 3
+            await asyncio.sleep(0.1)
+
+        asyncio.run(main())
+        assert fired == ["lapsed", "early", "late"]
+        assert len(scheduler) == 0
+
+    def test_cancel(self):
+        scheduler = ExpiryScheduler()
+        fired = []
+
+        async def callback():
+            fired.append(1)
+
+        async def main():
+            expiry = scheduler.schedule(time.time() + 0.02, callback)
+            expiry.cancel()
+            expiry.cancel()  # Idempotent
+            assert len(scheduler) == 0
+            await asyncio.sleep(0.05)
+
+        asyncio.run(main())
+        assert fired == []
+
+    def test_compaction(self):
+        scheduler = ExpiryScheduler()
+
+        async def callback():
+            pass
+
+        async def main():
+            expiries = [scheduler.schedule(time.time() + 60, callback) for _ in range(200)]
+            for expiry in expiries[:150]:
+                expiry.cancel()
+            wheel = scheduler._wheels[asyncio.get_running_loop()]
+            assert len(wheel.heap) < 200  # Rebuilt once most entries were cancelled
+            assert len(scheduler) == 50
+            for expiry in expiries[150:]:
+                expiry.cancel()
+
+        asyncio.run(main())
+
+
+class Clock:
+    """ Wall clock of an ExpiryScheduler that only moves when a test advances it """
+
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestOAuth2MiddlewareWebsocketExpiry:
+
+    @pytest.fixture
+    def clock(self) -> Clock:
+        return Clock()
+
+    @pytest.fixture
+    def client(self, clock) -> TestClient:
+        app = FastAPI()
+        app.add_middleware(OAuth2Middleware, public_key=PUBLIC_KEY, expiry_scheduler=ExpiryScheduler(close_code=4001, clock=clock))
+
+        @app.websocket("/ws")
+        async def websocket_endpoint(websocket: WebSocket):
+            await websocket.accept()
+            await websocket.send_text("connected")
+            try:
+                while True:
+                    await websocket.receive_text()
+            except WebSocketDisconnect:
+                pass
+
+        @app.websocket("/closing")
+        async def closing(websocket: WebSocket):
+            await websocket.accept()
+            await websocket.close()
+
+        return TestClient(app)
+
+    def test_closed_when_token_expires(self, client, clock):
+        scheduler = client.app.user_middleware[0].kwargs["expiry_scheduler"]
+        with client.websocket_connect("/ws", headers={"Authorization": f"Bearer {sign_token()}"}) as websocket:
+            assert websocket.receive_text() == "connected"
+            clock.now += 7200  # The token expires an hour after it has been signed
+            wheel, = scheduler._wheels.values()
+            wheel.loop.call_soon_threadsafe(wheel.fire)  # Wake up the timer, that still waits for the real expiry
+            with pytest.raises(WebSocketDisconnect) as disconnect:
+                websocket.receive_text()
+            assert disconnect.value.code == 4001
+
+    def test_open_while_token_is_valid(self, client):
+        token = sign_token()
+        with client.websocket_connect("/ws", headers={"Authorization": f"Bearer {token}"}) as websocket:
+            assert websocket.receive_text() == "connected"
+            websocket.send_text("ping")
+
+    def test_closed_by_app(self, client):
+        scheduler = client.app.user_middleware[0].kwargs["expiry_scheduler"]
+        with client.websocket_connect("/closing", headers={"Authorization": f"Bearer {sign_token()}"}) as websocket:
+            with pytest.raises(WebSocketDisconnect):
+                websocket.receive_text()
+        assert len(scheduler) == 0
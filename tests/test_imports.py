@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+from typing import Dict
+
+import pytest
+
+import fastapi_auth_middleware
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_PACKAGES = ("jose", "cryptography", "jwt", "ecdsa", "rsa", "fastapi", "pydantic")
+
+
+def import_times(statement: str) -> Dict[str, int]:
+    """ Runs an import statement in a fresh interpreter with -X importtime and returns {module: cumulative microseconds} """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:  # Skip the header
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+class TestLazyImports:
+
+    def test_package_imports_no_submodules(self):
+        times = import_times("import fastapi_auth_middleware")
+        assert "fastapi_auth_middleware" in times
+        assert [module for module in times if module.startswith("fastapi_auth_middleware.")] == []
+
+    @pytest.mark.parametrize("name", ["AuthMiddleware", "OAuth2Middleware"])
+    def test_no_heavy_dependencies(self, name):
+        times = import_times(f"from fastapi_auth_middleware import {name}")
+        heavy = [module for module in times if module.split(".")[0] in HEAVY_PACKAGES]
+        assert heavy == [], f"Importing {name} loads {heavy}"
+
+    def test_auth_middleware_skips_oauth2(self):
+        times = import_times("from fastapi_auth_middleware import AuthMiddleware")
+        assert "fastapi_auth_middleware.oauth2_middleware" not in times
+        assert "fastapi_auth_middleware.engines" not in times
+
+    def test_public_names(self):
+        for name in fastapi_auth_middleware.__all__:
+            assert getattr(fastapi_auth_middleware, name).__name__ == name
+        assert set(fastapi_auth_middleware.__all__) <= set(dir(fastapi_auth_middleware))
+
+    def test_unknown_name(self):
+        with pytest.raises(AttributeError):
+            fastapi_auth_middleware.DoesNotExist  # noqa
@@ -0,0 +1,212 @@
+import asyncio
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+from fastapi import FastAPI
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.testclient import TestClient
+
+from fastapi_auth_middleware import AuthMiddleware, IntrospectionBackend, TokenCache
+from fastapi_auth_middleware.exceptions import AuthenticationHeaderMissing, IntrospectionFailed, InvalidToken, TokenHasExpired
+
+
+class StubIntrospectionServer:
+    """ Introspection endpoint that answers from a dict of {token: response} """
+
+    def __init__(self, tokens: dict):
+        self.tokens = tokens
+        self.requests = []
+        self.delay = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, so pooled connections are reused
+
+            def do_POST(self):
+                form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+                token = form["token"][0]
+                stub.requests.append((token, self.headers.get("Authorization"), self.client_address))
+                time.sleep(stub.delay)
+
+                if token == "error":
+                    status, body = 500, b"Internal Server Error"
+                else:
+                    status, body = 200, json.dumps(stub.tokens.get(token, {"active": False})).encode()
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/introspect"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "StubIntrospectionServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+TOKENS = {
+    "valid": {"active": True, "sub": "1", "scope": "a b", "exp": time.time() + 3600},
+    "no-exp": {"active": True, "sub": "2"},
+    "lapsed": {"active": True, "sub": "3", "exp": time.time() - 10},
+}
+
+
+@pytest.fixture
+def server():
+    with StubIntrospectionServer(TOKENS) as stub:
+        yield stub
+
+
+def verify(backend: IntrospectionBackend, token: str):
+    async def main():
+        try:
+            return await backend.verify_header(Headers({"Authorization": f"Bearer {token}"}))
+        finally:
+            await backend.aclose()
+    return asyncio.run(main())
+
+
+class TestIntrospectionBackend:
+
+    def test_active(self, server):
+        scopes, user = verify(IntrospectionBackend(server.url, client_id="api", client_secret="secret"), "valid")
+        assert list(scopes) == ["a", "b"]
+        assert user.identity == "1"
+        assert server.requests[0][1] == "Basic " + base64.b64encode(b"api:secret").decode()
+
+    def test_inactive(self, server):
+        with pytest.raises(InvalidToken):
+            verify(IntrospectionBackend(server.url), "unknown")
+
+    def test_lapsed(self, server):
+        with pytest.raises(TokenHasExpired):
+            verify(IntrospectionBackend(server.url), "lapsed")
+
+    def test_missing_header(self, server):
+        with pytest.raises(AuthenticationHeaderMissing):
+            asyncio.run(IntrospectionBackend(server.url).verify_header(Headers({})))
+
+    def test_server_error(self, server):
+        with pytest.raises(IntrospectionFailed):
+            verify(IntrospectionBackend(server.url), "error")
+
+    def test_timeout(self, server):
+        server.delay = 0.3
+        with pytest.raises(IntrospectionFailed):
+            verify(IntrospectionBackend(server.url, timeout=0.05), "valid")
+
+    def test_cached_until_exp(self, server):
+        backend = IntrospectionBackend(server.url)
+
+        async def main():
+            for _ in range(3):
+                await backend.introspect("valid")
+                await backend.introspect("no-exp")  # Not cached without a ttl
+            await backend.aclose()
+
+        asyncio.run(main())
+        assert [token for token, _, _ in server.requests] == ["valid", "no-exp", "no-exp", "no-exp"]
+
+    def test_cached_with_ttl(self, server):
+        backend = IntrospectionBackend(server.url, token_cache=TokenCache(ttl=60))
+        for _ in range(2):
+            verify(backend, "no-exp")
+        assert len(server.requests) == 1
+
+    def test_coalesced_and_pooled(self, server):
+        server.delay = 0.05
+        backend = IntrospectionBackend(server.url)
+
+        async def main():
+            await asyncio.gather(*(backend.introspect("valid") for _ in range(10)))
+            backend.token_cache.clear()
+            for _ in range(3):  # One after the other, over the same connection
+                await backend.introspect("valid")
+                backend.token_cache.clear()
+            await backend.aclose()
+
+        asyncio.run(main())
+        assert len(server.requests) == 4
+        assert len({client_address for _, _, client_address in server.requests[1:]}) == 1
+
+    def test_client_of_other_loop_closed(self, server):
+        backend = IntrospectionBackend(server.url)
+        other_loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=other_loop.run_forever, daemon=True)
+        thread.start()
+
+        try:
+            asyncio.run_coroutine_threadsafe(backend.introspect("no-exp"), other_loop).result()
+            other_client = backend._client
+            verify(backend, "no-exp")  # On a new loop
+
+            deadline = time.monotonic() + 1
+            while not other_client.is_closed and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert other_client.is_closed
+        finally:
+            other_loop.call_soon_threadsafe(other_loop.stop)
+            thread.join()
+            other_loop.close()
+
+    def test_client_of_closed_loop_discarded(self, server):
+        backend = IntrospectionBackend(server.url)
+        asyncio.run(backend.introspect("no-exp"))  # The loop is closed without closing the client
+        verify(backend, "no-exp")
+        assert len(server.requests) == 2
+
+    def test_client_of_stopped_loop_discarded(self, server):
+        backend = IntrospectionBackend(server.url)
+        stopped_loop = asyncio.new_event_loop()
+        try:
+            stopped_loop.run_until_complete(backend.introspect("no-exp"))  # The loop is stopped, but not closed
+            stopped_client = backend._client
+            verify(backend, "no-exp")
+            assert backend._client is not stopped_client
+            assert len(server.requests) == 2
+        finally:
+            stopped_loop.close()
+
+
+class TestAuthMiddlewareWithIntrospection:
+
+    def test_request(self, server):
+        app = FastAPI()
+        app.add_middleware(AuthMiddleware, verify_header=IntrospectionBackend(server.url).verify_header)
+
+        @app.get("/")
+        def home(request: Request):
+            return {"user": request.user.identity, "scopes": list(request.auth.scopes)}
+
+        client = TestClient(app)
+        assert client.get("/", headers={"Authorization": "Bearer valid"}).json() == {"user": "1", "scopes": ["a", "b"]}
+        assert client.get("/", headers={"Authorization": "Bearer unknown"}).status_code == 400
+
+    def test_endpoint_unavailable(self, server):
+        app = FastAPI()
+        app.add_middleware(AuthMiddleware, verify_header=IntrospectionBackend(server.url).verify_header)
+
+        @app.get("/")
+        def home():
+            return {}
+
+        response = TestClient(app).get("/", headers={"Authorization": "Bearer error"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from starlette.requests import Request
+from starlette.testclient import TestClient
+
+from fastapi_auth_middleware import FastAPIUser, OAuth2Middleware, TokenCache
+from fastapi_auth_middleware.exceptions import InvalidToken
+from fastapi_auth_middleware.issuers import MultiIssuerBackend, UnknownIssuer, get_unverified_issuer
+from fastapi_auth_middleware.oauth2_middleware import OAuth2Backend
+from tests.keys import PUBLIC_KEY, sign_token
+
+SECRET = "tenant-b-secret"
+
+
+def tenant_b_user(decoded_token: dict) -> FastAPIUser:
+    return FastAPIUser(first_name="Tenant", last_name="B", user_id=decoded_token["sub"])
+
+
+class TestGetUnverifiedIssuer:
+
+    def test_issuer(self):
+        assert get_unverified_issuer(sign_token(iss="https://a")) == "https://a"
+        assert get_unverified_issuer(sign_token()) is None
+
+    @pytest.mark.parametrize("token", ["garbage", "a.b.c", "a.bnVsbA.c"])  # "bnVsbA" is null
+    def test_malformed(self, token):
+        with pytest.raises(InvalidToken):
+            get_unverified_issuer(token)
+
+
+class TestMultiIssuerBackend:
+
+    @pytest.fixture
+    def backend(self) -> MultiIssuerBackend:
+        def oauth2_backend(public_key, algorithms):
+            return OAuth2Backend(public_key=public_key, get_scopes=None, get_user=None, issuer=None, audience=None, decode_token_options=None, algorithms=algorithms)
+        return MultiIssuerBackend({"https://a": oauth2_backend(PUBLIC_KEY, ["RS256"]), "https://b": oauth2_backend(SECRET, ["HS256"])})
+
+    def test_dispatch(self, backend):
+        claims, _, _ = asyncio.run(backend.verify_header(f"Bearer {sign_token(iss='https://a')}"))
+        assert claims["iss"] == "https://a"
+        claims, _, _ = asyncio.run(backend.verify_header(f"Bearer {sign_token(key=SECRET, algorithm='HS256', iss='https://b')}"))
+        assert claims["iss"] == "https://b"
+
+    def test_unknown_issuer(self, backend):
+        for token in [sign_token(iss="https://c"), sign_token()]:
+            with pytest.raises(UnknownIssuer):
+                asyncio.run(backend.verify_header(f"Bearer {token}"))
+
+    def test_keys_of_other_issuer(self, backend):
+        with pytest.raises(InvalidToken):  # Claims to be from "b", but is signed with the key of "a"
+            asyncio.run(backend.verify_header(f"Bearer {sign_token(iss='https://b')}"))
+
+
+class TestOAuth2MiddlewareIssuers:
+
+    @pytest.fixture
+    def client(self) -> TestClient:
+        app = FastAPI()
+        app.add_middleware(OAuth2Middleware, token_cache=TokenCache(), issuers={
+            "https://a": {"public_key": PUBLIC_KEY},
+            "https://b": {"public_key": SECRET, "algorithms": ["HS256"], "get_user": tenant_b_user},
+        })
+
+        @app.get("/")
+        def home(request: Request):
+            return {"user": request.user.display_name, "scopes": list(request.auth.scopes)}
+
+        return TestClient(app)
+
+    def test_per_issuer_settings(self, client):
+        response = client.get("/", headers={"Authorization": f"Bearer {sign_token(iss='https://a', scope='a', name='Code Specialist')}"})
+        assert response.json() == {"user": "Code Specialist", "scopes": ["a"]}
+
+        response = client.get("/", headers={"Authorization": f"Bearer {sign_token(key=SECRET, algorithm='HS256', iss='https://b', scope='a')}"})
+        assert response.json() == {"user": "Tenant B", "scopes": ["a"]}
+
+    def test_rejected(self, client):
+        assert client.get("/", headers={"Authorization": f"Bearer {sign_token(iss='https://c')}"}).status_code == 401
+        assert client.get("/", headers={"Authorization": "Bearer garbage"}).status_code == 401
+        assert client.get("/").status_code == 401
+
+    def test_public_key_or_issuers(self):
+        with pytest.raises(ValueError):
+            OAuth2Middleware(FastAPI())
+        with pytest.raises(ValueError):
+            OAuth2Middleware(FastAPI(), public_key=PUBLIC_KEY, issuers={"https://a": {"public_key": PUBLIC_KEY}})
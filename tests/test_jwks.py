@@ -0,0 +1,140 @@
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from fastapi_auth_middleware import OAuth2Middleware, JWKSKeySource
+from tests.keys import sign_token
+
+
+def oct_jwk(kid: str, secret: str) -> dict:
+    return {"kty": "oct", "kid": kid, "alg": "HS256", "k": base64.urlsafe_b64encode(secret.encode()).decode().rstrip("=")}
+
+
+class StubJWKSServer:
+    """ Local HTTP server that serves a mutable JWK Set """
+
+    def __init__(self, jwks: dict):
+        self.jwks = jwks
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                body = json.dumps(stub.jwks).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/.well-known/jwks.json"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_server():
+    server = StubJWKSServer({"keys": [oct_jwk("k1", "first-secret")]})
+    yield server
+    server.close()
+
+
+def app_with(source: JWKSKeySource) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(OAuth2Middleware, public_key=source)
+
+    @app.get("/")
+    def home():
+        return 'Hello World'
+
+    return TestClient(app)
+
+
+class TestJWKSKeySource:
+
+    def test_requires_exactly_one_location(self):
+        with pytest.raises(ValueError):
+            JWKSKeySource()
+        with pytest.raises(ValueError):
+            JWKSKeySource(url="http://localhost", path="jwks.json")
+
+    def test_load_from_file(self, tmp_path):
+        path = tmp_path / "jwks.json"
+        path.write_text(json.dumps({"keys": [oct_jwk("k1", "first-secret")]}))
+
+        source = JWKSKeySource(path=str(path), refresh_interval=None)
+        assert "k1" in source
+        assert source.get("k1", "HS256") is source.keyring.get("k1", "HS256")
+
+    def test_refresh_swaps_keyring(self, tmp_path):
+        path = tmp_path / "jwks.json"
+        path.write_text(json.dumps({"keys": [oct_jwk("k1", "first-secret")]}))
+        source = JWKSKeySource(path=str(path), refresh_interval=None)
+        keyring = source.keyring
+
+        path.write_text(json.dumps({"keys": [oct_jwk("k2", "second-secret")]}))
+        assert source.refresh()
+        assert source.keyring is not keyring
+        assert "k2" in source and "k1" not in source
+        assert source.fingerprint == JWKSKeySource(path=str(path), refresh_interval=None).fingerprint  # Identifies the source, not its current keys
+
+    def test_failed_refresh_keeps_keys(self, tmp_path):
+        path = tmp_path / "jwks.json"
+        path.write_text(json.dumps({"keys": [oct_jwk("k1", "first-secret")]}))
+        source = JWKSKeySource(path=str(path), refresh_interval=None)
+
+        path.write_text("not json")
+        assert not source.refresh()
+        assert source.last_error is not None
+        assert "k1" in source
+
+    def test_background_refresh(self, stub_server):
+        source = JWKSKeySource(url=stub_server.url, refresh_interval=0.05)
+        stub_server.jwks = {"keys": [oct_jwk("k2", "second-secret")]}
+
+        deadline = time.monotonic() + 5
+        while "k2" not in source and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        source.stop()
+        assert "k2" in source
+
+    def test_unknown_kid_triggers_refresh(self, stub_server):
+        source = JWKSKeySource(url=stub_server.url, refresh_interval=None, min_refresh_interval=0)
+        client = app_with(source)
+        assert client.get("/", headers={"Authorization": f"Bearer {sign_token(key='first-secret', algorithm='HS256', headers={'kid': 'k1'})}"}).status_code == 200
+
+        stub_server.jwks = {"keys": [oct_jwk("k2", "second-secret")]}  # Rotate
+        assert client.get("/", headers={"Authorization": f"Bearer {sign_token(key='second-secret', algorithm='HS256', headers={'kid': 'k2'})}"}).status_code == 200
+        assert stub_server.requests == 2
+
+    def test_unknown_kid_refresh_right_after_startup(self, stub_server):
+        source = JWKSKeySource(url=stub_server.url, refresh_interval=None, min_refresh_interval=60)
+        client = app_with(source)
+
+        stub_server.jwks = {"keys": [oct_jwk("k2", "second-secret")]}  # Rotated before the first request
+        assert client.get("/", headers={"Authorization": f"Bearer {sign_token(key='second-secret', algorithm='HS256', headers={'kid': 'k2'})}"}).status_code == 200
+        assert stub_server.requests == 2
+
+    def test_unknown_kid_refresh_is_rate_limited(self, stub_server):
+        source = JWKSKeySource(url=stub_server.url, refresh_interval=None, min_refresh_interval=60)
+        client = app_with(source)
+
+        for _ in range(3):
+            assert client.get("/", headers={"Authorization": f"Bearer {sign_token(key='secret', algorithm='HS256', headers={'kid': 'unknown'})}"}).status_code == 401
+        assert stub_server.requests == 2  # The initial load and one refresh
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from jose import jwt, jwk
+from jose.backends.base import Key
+from starlette.testclient import TestClient
+
+from fastapi_auth_middleware import OAuth2Middleware, Keyring
+from fastapi_auth_middleware.exceptions import InvalidToken
+from tests.keys import PUBLIC_KEY, PRIVATE_KEY
+
+SECRETS = {"k1": "first-secret", "k2": "second-secret"}
+
+
+def claims():
+    return {
+        "sub": "1",
+        "iat": datetime.utcnow(),
+        "exp": datetime.utcnow() + timedelta(hours=1),  # Valid for 1 hour
+        "name": "Code Specialist",
+        "scope": "a b c"
+    }
+
+
+class TestKeyring:
+
+    def test_parsed_up_front(self):
+        keyring = Keyring(PUBLIC_KEY, algorithms=["RS256"], engine="python-jose")
+        key = keyring._parsed[(None, "RS256")]
+        assert isinstance(key, Key)
+        assert keyring.get(None, "RS256") is key
+        assert keyring.get("any-kid", "RS256") is key  # Single key verifies any kid
+
+    def test_parsed_lazily_once(self):
+        keyring = Keyring(PUBLIC_KEY)
+        assert keyring._parsed == {}
+        key = keyring.get(None, "RS256")
+        assert keyring.get(None, "RS256") is key
+
+    def test_kid_lookup(self):
+        keyring = Keyring(SECRETS, algorithms="HS256")
+        assert keyring.kids == ["k1", "k2"]
+        assert "k1" in keyring
+        assert keyring.get("k1", "HS256") is not keyring.get("k2", "HS256")
+
+    def test_unknown_kid(self):
+        keyring = Keyring(SECRETS, algorithms="HS256")
+        with pytest.raises(InvalidToken):
+            keyring.get("k3", "HS256")
+
+    def test_algorithm_not_allowed(self):
+        keyring = Keyring(PUBLIC_KEY, algorithms=["RS256"])
+        with pytest.raises(InvalidToken):
+            keyring.get(None, "HS256")
+
+    def test_missing_algorithm(self):
+        keyring = Keyring(PUBLIC_KEY)
+        with pytest.raises(InvalidToken):
+            keyring.get(None, None)
+
+    def test_invalid_key_for_algorithm(self):
+        keyring = Keyring(PUBLIC_KEY)
+        with pytest.raises(InvalidToken):
+            keyring.get(None, "HS256")  # PEM keys must not be used as HMAC secrets
+
+    def test_from_jwks(self):
+        jwks = {"keys": [dict(jwk.construct(PUBLIC_KEY, "RS256").to_dict(), kid="rsa", alg="RS256")]}
+        keyring = Keyring.from_jwks(jwks)
+        assert ("rsa", "RS256") in keyring._parsed
+        token = jwt.encode(claims(), key=PRIVATE_KEY, algorithm="RS256", headers={"kid": "rsa"})
+        assert keyring.engine.decode(token, key=keyring.get("rsa", "RS256"))["sub"] == "1"
+
+    def test_fingerprint(self):
+        assert Keyring(PUBLIC_KEY, algorithms="RS256").fingerprint == Keyring(PUBLIC_KEY, algorithms=["RS256"]).fingerprint
+        assert Keyring(PUBLIC_KEY, algorithms="RS256").fingerprint != Keyring(PUBLIC_KEY, algorithms="RS512").fingerprint
+        assert Keyring(PUBLIC_KEY).fingerprint != Keyring({"other": PUBLIC_KEY}).fingerprint
+
+
+class TestOAuth2MiddlewareKeyring:
+
+    @pytest.fixture
+    def client(self) -> TestClient:
+        app = FastAPI()
+        app.add_middleware(OAuth2Middleware, public_key=SECRETS, algorithms=["HS256"])
+
+        @app.get("/")
+        def home():
+            return 'Hello World'
+
+        return TestClient(app)
+
+    @pytest.mark.parametrize("kid", SECRETS.keys())
+    def test_key_selected_by_kid(self, client, kid):
+        token = jwt.encode(claims(), key=SECRETS[kid], algorithm="HS256", headers={"kid": kid})
+        assert client.get("/", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+
+    def test_wrong_key_for_kid(self, client):
+        token = jwt.encode(claims(), key=SECRETS["k1"], algorithm="HS256", headers={"kid": "k2"})
+        assert client.get("/", headers={"Authorization": f"Bearer {token}"}).status_code == 401
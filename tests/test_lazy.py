@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+
+from fastapi import FastAPI
+from jose import jwt
+from starlette.authentication import requires
+from starlette.requests import Request
+from starlette.testclient import TestClient
+
+from fastapi_auth_middleware import AuthMiddleware, FastAPIUser, OAuth2Middleware
+from fastapi_auth_middleware.lazy import LazyAuthCredentials, LazyUser
+from tests.keys import PUBLIC_KEY, PRIVATE_KEY
+
+
+def add_routes(app: FastAPI):
+    @app.get("/")
+    def home():
+        return 'Hello World'
+
+    @app.get("/user")
+    def user(request: Request):
+        return f'{request.user.display_name} {request.user.first_name}'
+
+    @app.get("/a-scope")
+    @requires("a")
+    def a_scope_required(request: Request):
+        return 'OK'
+
+    return app
+
+
+class TestLazyProxies:
+
+    def test_credentials(self):
+        calls = []
+        credentials = LazyAuthCredentials(lambda: calls.append(1) or ("a", "b"))
+        assert not credentials.resolved
+        assert list(credentials.scopes) == ["a", "b"]
+        assert list(credentials.scopes) == ["a", "b"]
+        assert credentials.resolved and len(calls) == 1
+
+        credentials.scopes = ["c"]
+        assert list(credentials.scopes) == ["c"]
+
+    def test_user(self):
+        calls = []
+        user = LazyUser(lambda: calls.append(1) or FastAPIUser(first_name="Code", last_name="Specialist", user_id=1))
+        assert not user.resolved
+        assert user.is_authenticated
+        assert user.display_name == "Code Specialist"
+        assert user.identity == 1
+        assert user.first_name == "Code"
+        assert user.resolved and len(calls) == 1
+
+    def test_user_private_attribute(self):
+        user = LazyUser(lambda: FastAPIUser(first_name="Code", last_name="Specialist", user_id=1))
+        assert not hasattr(user, "_private")
+        assert not user.resolved
+
+
+class TestOAuth2MiddlewareLazy:
+
+    def test_user_and_scopes_resolved_on_access(self):
+        calls = []
+
+        def get_user(decoded_token: dict):
+            calls.append("user")
+            return FastAPIUser(first_name="Code", last_name="Specialist", user_id=decoded_token["sub"])
+
+        def get_scopes(decoded_token: dict):
+            calls.append("scopes")
+            return decoded_token["scope"].split(" ")
+
+        app = FastAPI()
+        app.add_middleware(OAuth2Middleware, public_key=PUBLIC_KEY, get_user=get_user, get_scopes=get_scopes, lazy=True)
+        client = TestClient(add_routes(app))
+
+        token = jwt.encode({"sub": "1", "exp": datetime.utcnow() + timedelta(hours=1), "scope": "a b"}, key=PRIVATE_KEY, algorithm="RS256")
+        headers = {"Authorization": f"Bearer {token}"}
+
+        assert client.get("/", headers=headers).status_code == 200
+        assert calls == []
+
+        assert client.get("/user", headers=headers).json() == "Code Specialist Code"
+        assert calls == ["user"]
+
+        assert client.get("/a-scope", headers=headers).status_code == 200
+        assert calls == ["user", "scopes"]
+
+
+class TestAuthMiddlewareLazy:
+
+    def test_callables_resolved_on_access(self):
+        calls = []
+
+        def verify_header(headers):
+            def get_user():
+                calls.append("user")
+                return FastAPIUser(first_name="Code", last_name="Specialist", user_id=1)
+
+            return ["a"], get_user
+
+        app = FastAPI()
+        app.add_middleware(AuthMiddleware, verify_header=verify_header, lazy=True)
+        client = TestClient(add_routes(app))
+
+        assert client.get("/", headers={"Authorization": "ey.."}).status_code == 200
+        assert client.get("/a-scope", headers={"Authorization": "ey.."}).status_code == 200
+        assert calls == []
+
+        assert client.get("/user", headers={"Authorization": "ey.."}).json() == "Code Specialist Code"
+        assert calls == ["user"]
+
+    def test_lazy_scopes(self):
+        def verify_header(headers):
+            return lambda: ["a"], FastAPIUser(first_name="Code", last_name="Specialist", user_id=1)
+
+        app = FastAPI()
+        app.add_middleware(AuthMiddleware, verify_header=verify_header, lazy=True)
+        assert TestClient(add_routes(app)).get("/a-scope", headers={"Authorization": "ey.."}).status_code == 200
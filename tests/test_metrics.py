@@ -0,0 +1,98 @@
+from datetime import timedelta
+
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from fastapi_auth_middleware import OAuth2Middleware, TokenCache, Metrics, PrometheusMetrics
+from tests.keys import PUBLIC_KEY, sign_token
+
+
+def oauth2_client(metrics: Metrics, **kwargs) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(OAuth2Middleware, public_key=PUBLIC_KEY, metrics=metrics, **kwargs)
+
+    @app.get("/")
+    def home():
+        return 'Hello World'
+
+    return TestClient(app)
+
+
+class TestPrometheusMetrics:
+
+    def test_render(self):
+        metrics = PrometheusMetrics(buckets=(0.1, 1.0))
+        metrics.observe("decode", 0.05)
+        metrics.observe("decode", 0.5)
+        metrics.observe("decode", 2.0)
+        metrics.increment("ok")
+
+        rendered = metrics.render()
+        assert '# TYPE fastapi_auth_phase_seconds histogram' in rendered
+        assert 'fastapi_auth_phase_seconds_bucket{phase="decode",le="0.1"} 1' in rendered
+        assert 'fastapi_auth_phase_seconds_bucket{phase="decode",le="1.0"} 2' in rendered
+        assert 'fastapi_auth_phase_seconds_bucket{phase="decode",le="+Inf"} 3' in rendered
+        assert 'fastapi_auth_phase_seconds_sum{phase="decode"} 2.55' in rendered
+        assert 'fastapi_auth_phase_seconds_count{phase="decode"} 3' in rendered
+        assert 'fastapi_auth_outcomes_total{outcome="ok"} 1' in rendered
+        assert 'fastapi_auth_outcomes_total{outcome="invalid"} 0' in rendered
+
+    def test_response(self):
+        metrics = PrometheusMetrics()
+        app = FastAPI()
+        app.add_route("/metrics", metrics.response)
+
+        response = TestClient(app).get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+    def test_default_is_disabled(self):
+        assert not Metrics.enabled
+        Metrics().observe("decode", 1.0)  # Discarded
+        Metrics().increment("ok")
+
+
+class TestOAuth2MiddlewareMetrics:
+
+    def test_outcomes(self):
+        metrics = PrometheusMetrics()
+        client = oauth2_client(metrics, token_cache=TokenCache(), get_new_token=lambda old_token: "new")
+        token = sign_token()
+
+        assert client.get("/", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+        assert client.get("/", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+        assert client.get("/").status_code == 401
+        assert client.get("/", headers={"Authorization": "Bearer invalid"}).status_code == 401
+        assert client.get("/", headers={"Authorization": f"Bearer {sign_token(timedelta(hours=-1))}"}).headers["New-Access-Token"] == "new"
+
+        assert metrics.count("ok") == 2
+        assert metrics.count("missing") == 1
+        assert metrics.count("invalid") == 1
+        assert metrics.count("renewed") == 1
+        assert metrics.count("cache_hit") == 1
+        assert metrics.count("cache_miss") == 3
+
+    def test_expired_without_renewal(self):
+        metrics = PrometheusMetrics()
+        client = oauth2_client(metrics)
+        assert client.get("/", headers={"Authorization": f"Bearer {sign_token(timedelta(hours=-1))}"}).status_code == 401
+        assert metrics.count("expired") == 1
+
+    def test_phases(self):
+        metrics = PrometheusMetrics()
+        client = oauth2_client(metrics, get_new_token=lambda old_token: "new")
+        client.get("/", headers={"Authorization": f"Bearer {sign_token()}"})
+        client.get("/", headers={"Authorization": f"Bearer {sign_token(timedelta(hours=-1))}"})
+
+        rendered = metrics.render()
+        for phase in ("header", "split", "decode", "get_scopes", "get_user", "renewal"):
+            assert f'fastapi_auth_phase_seconds_count{{phase="{phase}"}}' in rendered
+
+    def test_lazy_phases_observed_on_access(self):
+        metrics = PrometheusMetrics()
+        client = oauth2_client(metrics, lazy=True)
+        client.get("/", headers={"Authorization": f"Bearer {sign_token()}"})
+
+        rendered = metrics.render()
+        assert 'phase="decode"' in rendered
+        assert 'phase="get_user"' not in rendered
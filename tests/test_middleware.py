@@ -1,13 +1,17 @@
+import asyncio
 from typing import Callable, List, Dict
 
+import pytest
 from _pytest.fixtures import fixture
 from fastapi import FastAPI
 from starlette.authentication import requires, AuthenticationError
-from starlette.requests import Request
+from starlette.requests import Request, HTTPConnection
 from starlette.responses import JSONResponse
 from starlette.testclient import TestClient
+from starlette.websockets import WebSocket, WebSocketDisconnect
 
 from fastapi_auth_middleware import AuthMiddleware, FastAPIUser
+from fastapi_auth_middleware.middleware import FastAPIAuthBackend
 
 
 # Sample verification function, does nothing of effect
@@ -36,6 +40,15 @@ def fastapi_app(verify_header: Callable, auth_error_handler: Callable = None, ex
     def public():
         return 'Hello Public World'
 
+    @app.get("/docs/{page}")
+    def docs(page: str):
+        return page
+
+    @app.get("/health")
+    @app.post("/health")
+    def health():
+        return 'OK'
+
     @app.get("/")
     def home():
         return 'Hello World'
@@ -45,6 +58,12 @@ def fastapi_app(verify_header: Callable, auth_error_handler: Callable = None, ex
         user: FastAPIUser = request.user
         return f'{user.is_authenticated} {user.display_name} {user.identity}'
 
+    @app.websocket("/ws")
+    async def websocket(websocket: WebSocket):
+        await websocket.accept()
+        await websocket.send_text(websocket.user.display_name)
+        await websocket.close()
+
     @app.get("/admin-scope")
     @requires("admin")
     def admin_scope_required(request: Request):
@@ -107,3 +126,35 @@ class TestBasicBehaviour:
 
     def test_public_path_with_query(self, client):
         assert client.get("/public?abcdef=x").status_code == 200
+
+    def test_public_prefix(self):
+        client = TestClient(fastapi_app(raise_exception_in_verify_authorization_header, excluded_urls=["/docs/*"]))
+        assert client.get("/docs/index").status_code == 200
+        assert client.get("/").status_code == 400
+
+    def test_public_method(self):
+        client = TestClient(fastapi_app(raise_exception_in_verify_authorization_header, excluded_urls=["GET /health"]))
+        assert client.get("/health").status_code == 200
+        assert client.post("/health").status_code == 400
+
+    def test_public_pattern(self):
+        client = TestClient(fastapi_app(raise_exception_in_verify_authorization_header, excluded_urls=["^/docs/[a-z]+$"]))
+        assert client.get("/docs/index").status_code == 200
+        assert client.get("/docs/index2").status_code == 400
+
+    def test_websocket(self, client):
+        with client.websocket_connect("/ws", headers={"Authorization": "ey.."}) as websocket:
+            assert websocket.receive_text() == "Code Specialist"
+
+    def test_websocket_auth_error(self):
+        client = TestClient(fastapi_app(raise_exception_in_verify_authorization_header))
+        with pytest.raises(WebSocketDisconnect):
+            with client.websocket_connect("/ws", headers={"Authorization": "ey.."}) as websocket:
+                websocket.receive_text()
+
+    def test_backend_with_connection(self):
+        backend = FastAPIAuthBackend(verify_header=verify_header)
+        connection = HTTPConnection({"type": "http", "method": "GET", "path": "/", "headers": [(b"authorization", b"ey..")]})
+        credentials, user = asyncio.run(backend.authenticate(connection))
+        assert list(credentials.scopes) == ["authenticated"]
+        assert user.display_name == "Code Specialist"
@@ -1,13 +1,18 @@
+import asyncio
 from datetime import datetime, timedelta
 
 import pytest
 from _pytest.fixtures import fixture
 from jose import jwt
+from starlette.requests import HTTPConnection
 from starlette.testclient import TestClient
 
+from fastapi_auth_middleware.exceptions import AuthenticationHeaderMissing
+from fastapi_auth_middleware.headers import get_authorization_header
+from fastapi_auth_middleware.oauth2_middleware import OAuth2Backend
 from tests.basic_fastapi_app import app as basic_app
 from tests.custom_oauth2_fastapi_app import app as oauth2_custom_app
-from tests.keys import PRIVATE_KEY
+from tests.keys import PRIVATE_KEY, PUBLIC_KEY
 
 
 def sign_token(content: dict):
@@ -112,3 +117,25 @@ class TestOAuth2Middleware:
         })
         response = client.get("/", headers={"Authorization": f"Bearer {token}"})
         assert response.status_code == 200
+
+
+class TestOAuth2Backend:
+
+    @staticmethod
+    def connection(headers: list) -> HTTPConnection:
+        return HTTPConnection({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+    def test_get_authorization_header(self):
+        assert get_authorization_header({"headers": [(b"accept", b"*/*"), (b"authorization", b"Bearer ey..")]}) == "Bearer ey.."
+        assert get_authorization_header({"headers": [(b"accept", b"*/*")]}) is None
+
+    def test_authenticate_connection(self):
+        backend = OAuth2Backend(public_key=PUBLIC_KEY, get_scopes=None, get_user=None, issuer=None, audience=None, decode_token_options=None, algorithms=None)
+        token = sign_token({"sub": "1", "exp": datetime.utcnow() + timedelta(hours=1), "scope": "a b c"})
+
+        credentials, user = asyncio.run(backend.authenticate(self.connection([(b"authorization", f"Bearer {token}".encode())])))
+        assert list(credentials.scopes) == ["a", "b", "c"]
+        assert user.identity == "1"
+
+        with pytest.raises(AuthenticationHeaderMissing):
+            asyncio.run(backend.authenticate(self.connection([])))
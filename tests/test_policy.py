@@ -0,0 +1,162 @@
+from datetime import timedelta
+
+import pytest
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from fastapi_auth_middleware import AuthMiddleware, FastAPIUser, OAuth2Middleware, PrometheusMetrics, ScopePolicy
+from fastapi_auth_middleware.exceptions import VerificationQueueFull
+from fastapi_auth_middleware.oauth2_middleware import OAuth2Backend
+from fastapi_auth_middleware.scopes import parse_scopes
+from tests.keys import PUBLIC_KEY, sign_token
+
+POLICY = {
+    "GET /items/*": "items:read",
+    "POST /items/*": ["items:read", "items:write"],
+    "^/admin/.*$": "admin",
+    "/ws": "stream",
+}
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+    app.calls = 0
+
+    @app.api_route("/items/{item_id}", methods=["GET", "POST"])
+    def item(item_id: int):
+        app.calls += 1
+        return {"item": item_id}
+
+    @app.get("/admin/users")
+    def admin():
+        app.calls += 1
+        return {}
+
+    @app.get("/open")
+    def open_route():
+        return {}
+
+    @app.websocket("/ws")
+    async def websocket_endpoint(websocket: WebSocket):
+        await websocket.accept()
+        await websocket.send_text("connected")
+        await websocket.close()
+
+    return app
+
+
+class TestScopePolicy:
+
+    @pytest.fixture
+    def policy(self) -> ScopePolicy:
+        return ScopePolicy(POLICY)
+
+    @pytest.mark.parametrize("method, path, scopes, allowed", [
+        ("GET", "/items/1", ["items:read"], True),
+        ("GET", "/items/1", ["other"], False),
+        ("POST", "/items/1", ["items:read"], False),
+        ("POST", "/items/1", ["items:write", "items:read", "other"], True),
+        ("DELETE", "/items/1", [], True),  # Not part of the policy
+        ("GET", "/admin/users", ["admin"], True),
+        ("GET", "/admin/users", [], False),
+        (None, "/ws", ["stream"], True),
+        ("GET", "/open", [], True),
+    ])
+    def test_allows(self, policy, method, path, scopes, allowed):
+        assert policy.allows(method, path, scopes) is allowed
+
+    def test_bitmasks(self, policy):
+        assert sorted(policy.bits.values()) == [1, 2, 4, 8]
+        assert policy.required("POST", "/items/1") == policy.bits["items:read"] | policy.bits["items:write"]
+        assert policy.required("GET", "/open") == 0
+
+    def test_mask_cached_per_scope_set(self, policy):
+        scopes = parse_scopes("items:read admin")
+        assert policy.allows("GET", "/admin/users", scopes)
+        assert policy.allows("GET", "/items/1", scopes)
+        assert policy.mask.cache_info().hits == 1
+
+
+class TestOAuth2MiddlewarePolicy:
+
+    @pytest.fixture
+    def metrics(self) -> PrometheusMetrics:
+        return PrometheusMetrics()
+
+    @pytest.fixture
+    def app(self, metrics) -> FastAPI:
+        app = create_app()
+        app.add_middleware(OAuth2Middleware, public_key=PUBLIC_KEY, scope_policy=POLICY, metrics=metrics)
+        return app
+
+    def test_allowed(self, app):
+        response = TestClient(app).post("/items/1", headers={"Authorization": f"Bearer {sign_token(scope='items:read items:write')}"})
+        assert response.status_code == 200
+
+    def test_rejected_before_app(self, app, metrics):
+        response = TestClient(app).post("/items/1", headers={"Authorization": f"Bearer {sign_token(scope='items:read')}"})
+        assert response.status_code == 403
+        assert app.calls == 0
+        assert metrics.count("forbidden") == 1
+
+    def test_unlisted_route(self, app):
+        assert TestClient(app).get("/open", headers={"Authorization": f"Bearer {sign_token(scope='')}"}).status_code == 200
+
+    @pytest.mark.parametrize("scope, status_code", [("admin", 200), ("read", 403)])
+    def test_renewed_expired_token(self, metrics, decode_calls, scope, status_code):
+        app = create_app()
+        app.add_middleware(OAuth2Middleware, public_key=PUBLIC_KEY, scope_policy=POLICY, metrics=metrics, get_new_token=lambda old_token: sign_token(scope=scope))
+        response = TestClient(app).get("/admin/users", headers={"Authorization": f"Bearer {sign_token(timedelta(hours=-1), scope=scope)}"})
+        assert response.status_code == status_code
+        assert app.calls == (1 if status_code == 200 else 0)
+        assert len(decode_calls) == 1  # The scopes are taken from the expired token's claims, it isn't verified again
+
+    def test_renewal_of_expired_token_with_invalid_audience(self, metrics):
+        app = create_app()
+        app.add_middleware(OAuth2Middleware, public_key=PUBLIC_KEY, audience="api", decode_token_options={"verify_aud": True}, scope_policy=POLICY, metrics=metrics, get_new_token=lambda old_token: sign_token())
+        response = TestClient(app).get("/admin/users", headers={"Authorization": f"Bearer {sign_token(timedelta(hours=-1), scope='admin', aud='other')}"})
+        assert response.status_code == 401
+        assert app.calls == 0
+
+    def test_renewal_overloaded(self, metrics, monkeypatch):
+        async def verify_expired_header(backend, auth_header, claims=None):
+            raise VerificationQueueFull
+
+        monkeypatch.setattr(OAuth2Backend, "verify_expired_header", verify_expired_header)
+        app = create_app()
+        app.add_middleware(OAuth2Middleware, public_key=PUBLIC_KEY, scope_policy=POLICY, metrics=metrics, get_new_token=lambda old_token: sign_token(scope="admin"))
+        response = TestClient(app).get("/admin/users", headers={"Authorization": f"Bearer {sign_token(timedelta(hours=-1), scope='admin')}"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        assert app.calls == 0
+
+    def test_websocket(self, app):
+        client = TestClient(app)
+        with client.websocket_connect("/ws", headers={"Authorization": f"Bearer {sign_token(scope='stream')}"}) as websocket:
+            assert websocket.receive_text() == "connected"
+
+        with pytest.raises(WebSocketDisconnect) as disconnect:
+            with client.websocket_connect("/ws", headers={"Authorization": f"Bearer {sign_token(scope='items:read')}"}):
+                pass
+        assert disconnect.value.code == 1008
+
+
+class TestAuthMiddlewarePolicy:
+
+    @pytest.fixture
+    def client(self) -> TestClient:
+        def verify_header(headers):
+            return headers["Authorization"].split(","), FastAPIUser(first_name="Code", last_name="Specialist", user_id=1)
+
+        app = create_app()
+        app.add_middleware(AuthMiddleware, verify_header=verify_header, scope_policy=ScopePolicy(POLICY))
+        return TestClient(app)
+
+    def test_allowed(self, client):
+        assert client.get("/admin/users", headers={"Authorization": "admin"}).status_code == 200
+
+    def test_rejected_before_app(self, client):
+        response = client.get("/admin/users", headers={"Authorization": "items:read"})
+        assert response.status_code == 403
+        assert client.app.calls == 0
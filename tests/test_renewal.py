@@ -0,0 +1,79 @@
+import asyncio
+from datetime import timedelta
+
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from fastapi_auth_middleware import OAuth2Middleware
+from tests.keys import PUBLIC_KEY, sign_token
+
+
+def oauth2_app(get_new_token, renewal_ttl: float = None) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(OAuth2Middleware, public_key=PUBLIC_KEY, get_new_token=get_new_token, renewal_ttl=renewal_ttl)
+
+    @app.get("/")
+    def home():
+        return 'Hello World'
+
+    return app
+
+
+class TestTokenRenewal:
+
+    def test_async_get_new_token(self):
+        async def get_new_token(old_token: str):
+            await asyncio.sleep(0)
+            return "new-token"
+
+        client = TestClient(oauth2_app(get_new_token))
+        response = client.get("/", headers={"Authorization": f"Bearer {sign_token(timedelta(hours=-1))}"})
+        assert response.status_code == 200
+        assert response.headers["New-Access-Token"] == "new-token"
+
+    def test_memoized(self):
+        calls = []
+
+        def get_new_token(old_token: str):
+            calls.append(old_token)
+            return f"new-token-{len(calls)}"
+
+        client = TestClient(oauth2_app(get_new_token, renewal_ttl=60))
+        expired_token = sign_token(timedelta(hours=-1))
+
+        for _ in range(3):
+            response = client.get("/", headers={"Authorization": f"Bearer {expired_token}"})
+            assert response.headers["New-Access-Token"] == "new-token-1"
+
+        client.get("/", headers={"Authorization": f"Bearer {sign_token(timedelta(hours=-2))}"})
+        assert len(calls) == 2
+
+    def test_not_memoized_by_default(self):
+        calls = []
+
+        def get_new_token(old_token: str):
+            calls.append(old_token)
+            return "new-token"
+
+        client = TestClient(oauth2_app(get_new_token))
+        expired_token = sign_token(timedelta(hours=-1))
+        for _ in range(2):
+            client.get("/", headers={"Authorization": f"Bearer {expired_token}"})
+
+        assert len(calls) == 2
+
+    def test_coalesced(self):
+        calls = []
+
+        async def get_new_token(old_token: str):
+            calls.append(old_token)
+            await asyncio.sleep(0.01)
+            return "new-token"
+
+        middleware = OAuth2Middleware(app=None, public_key=PUBLIC_KEY, get_new_token=get_new_token)
+
+        async def main():
+            return await asyncio.gather(*(middleware.renew_token("Bearer old") for _ in range(20)))
+
+        assert asyncio.run(main()) == ["new-token"] * 20
+        assert calls == ["Bearer old"]
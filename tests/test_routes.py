@@ -0,0 +1,65 @@
+import re
+
+import pytest
+
+from fastapi_auth_middleware.routes import RouteIndex
+
+
+class TestRouteIndex:
+
+    @pytest.fixture
+    def index(self) -> RouteIndex:
+        return RouteIndex({
+            "/login": "exact",
+            "GET /health": "get-health",
+            "/public/*": "public",
+            "/public/admin/*": "public-admin",
+            "POST /public/*": "post-public",
+            "^/items/[0-9]+$": "item",
+            "DELETE ^/items/.*": "delete-item",
+            re.compile("/static/(css|js)/.+"): "static",
+        })
+
+    @pytest.mark.parametrize("method, path, expected", [
+        ("GET", "/login", "exact"),
+        ("POST", "/login", "exact"),
+        ("GET", "/login/", None),
+        ("GET", "/health", "get-health"),
+        ("POST", "/health", None),
+        ("GET", "/public", "public"),
+        ("GET", "/public/", "public"),
+        ("GET", "/public/a/b", "public"),
+        ("GET", "/publicity", None),
+        ("GET", "/public/admin/users", "public-admin"),
+        ("POST", "/public/a", "post-public"),
+        ("GET", "/items/12", "item"),
+        ("GET", "/items/abc", None),
+        ("DELETE", "/items/abc", "delete-item"),
+        ("DELETE", "/items/12", "delete-item"),
+        ("GET", "/static/css/main.css", "static"),
+        ("GET", "/static/img/logo.png", None),
+        (None, "/public/socket", "public"),
+        ("GET", "/", None),
+    ])
+    def test_match(self, index, method, path, expected):
+        assert index.match(method, path) == expected
+
+    def test_list_of_routes(self):
+        index = RouteIndex(["/login", "/public/*"])
+        assert ("GET", "/login") in index
+        assert ("GET", "/public/x") in index
+        assert ("GET", "/private") not in index
+
+    def test_root_prefix(self):
+        index = RouteIndex(["/*"])
+        assert ("GET", "/") in index
+        assert ("GET", "/anything/else") in index
+
+    def test_empty(self):
+        assert not RouteIndex()
+        assert not RouteIndex([])
+        assert RouteIndex().match("GET", "/") is None
+
+    def test_path_with_spaces_is_not_a_method(self):
+        index = RouteIndex(["/a b"])
+        assert ("GET", "/a b") in index
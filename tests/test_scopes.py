@@ -0,0 +1,79 @@
+import copy
+import json
+import pickle
+
+import pytest
+
+from fastapi_auth_middleware import FastAPIUser
+from fastapi_auth_middleware.oauth2_middleware import OAuth2Backend
+from fastapi_auth_middleware.scopes import EMPTY_SCOPES, ScopeCredentials, ScopeSet, intern_scopes, parse_scopes
+
+
+class TestScopeSet:
+
+    def test_set_semantics(self):
+        scopes = ScopeSet(["b", "a", "b"])
+        assert "a" in scopes and "c" not in scopes
+        assert scopes == frozenset({"a", "b"})
+        assert len(scopes) == 2
+
+    def test_keeps_order(self):
+        assert list(ScopeSet(["c", "a", "b"])) == ["c", "a", "b"]
+        assert json.dumps(list(ScopeSet(["c", "a"]))) == '["c", "a"]'
+
+    def test_repr(self):
+        assert repr(ScopeSet(["a"])) == "ScopeSet(['a'])"
+
+    def test_pickle(self):
+        scopes = pickle.loads(pickle.dumps(ScopeSet(["b", "a"])))
+        assert isinstance(scopes, ScopeSet)
+        assert scopes == {"a", "b"}
+
+    def test_no_instance_dict(self):
+        assert not hasattr(ScopeSet(), "__dict__")
+
+    def test_parse_scopes_interned(self):
+        assert parse_scopes("a b c") is parse_scopes("a b c")
+        assert list(parse_scopes("a  b")) == ["a", "b"]
+        assert parse_scopes("") == EMPTY_SCOPES
+
+    def test_intern_scopes(self):
+        scopes = intern_scopes(["a", "b"])
+        assert intern_scopes(["a", "b"]) is scopes
+        assert intern_scopes(scopes) is scopes
+        assert intern_scopes(None) is EMPTY_SCOPES
+
+    def test_credentials(self):
+        credentials = ScopeCredentials(["a", "b"])
+        assert isinstance(credentials.scopes, ScopeSet)
+        assert ScopeCredentials().scopes is EMPTY_SCOPES
+
+    @pytest.mark.parametrize("decoded_token, expected", [
+        ({"scope": "a b"}, ["a", "b"]),
+        ({"scope": None}, []),
+        ({"scope": 1}, []),
+        ({}, []),
+    ])
+    def test_default_get_scopes(self, decoded_token, expected):
+        assert list(OAuth2Backend._get_scopes(decoded_token)) == expected
+
+
+class TestFastAPIUser:
+
+    def test_immutable(self):
+        user = FastAPIUser(first_name="Code", last_name="Specialist", user_id=1)
+        with pytest.raises(AttributeError):
+            user.first_name = "Other"
+        with pytest.raises(AttributeError):
+            del user.user_id
+        assert user.display_name == "Code Specialist"
+
+    def test_repr(self):
+        assert repr(FastAPIUser(first_name="Code", last_name="Specialist", user_id=1)) == "FastAPIUser(first_name='Code', last_name='Specialist', user_id=1)"
+
+    @pytest.mark.parametrize("clone", [copy.copy, copy.deepcopy, lambda user: pickle.loads(pickle.dumps(user))])
+    def test_copy_and_pickle(self, clone):
+        user = FastAPIUser(first_name="Code", last_name="Specialist", user_id=1)
+        cloned = clone(user)
+        assert type(cloned) is FastAPIUser
+        assert (cloned.first_name, cloned.last_name, cloned.user_id) == ("Code", "Specialist", 1)
@@ -0,0 +1,110 @@
+import time
+from datetime import timedelta
+
+import pytest
+from fastapi import FastAPI
+from starlette.requests import Request
+from starlette.testclient import TestClient
+
+from fastapi_auth_middleware import OAuth2Middleware, SessionTokenSigner, TokenCache
+from fastapi_auth_middleware.engines import get_engine
+from fastapi_auth_middleware.exceptions import InvalidToken
+from fastapi_auth_middleware.session import SessionExpired
+from tests.keys import PUBLIC_KEY, sign_token
+
+SECRET = "0123456789abcdef0123456789abcdef"
+
+
+class TestSessionTokenSigner:
+
+    @pytest.fixture
+    def signer(self) -> SessionTokenSigner:
+        return SessionTokenSigner(SECRET, lifetime=60)
+
+    def test_round_trip(self, signer):
+        claims = {"sub": "1", "exp": time.time() + 3600}
+        token = signer.issue(claims)
+        assert SessionTokenSigner.is_session_token(token)
+        verified, expires_at = signer.verify(token)
+        assert verified == claims
+        assert expires_at == pytest.approx(time.time() + 60, abs=1)
+
+    def test_lifetime_bound_by_exp(self, signer):
+        exp = time.time() + 10
+        _, expires_at = signer.verify(signer.issue({"sub": "1", "exp": exp}))
+        assert expires_at == exp
+        assert signer.issue({"sub": "1", "exp": time.time() - 1}) is None
+
+    def test_expired(self):
+        signer = SessionTokenSigner(SECRET, lifetime=0.01)
+        token = signer.issue({"sub": "1"})
+        time.sleep(0.02)
+        with pytest.raises(SessionExpired):
+            signer.verify(token)
+
+    @pytest.mark.parametrize("tamper", [
+        lambda token: token[:-2] + ("AA" if not token.endswith("AA") else "BB"),  # Signature
+        lambda token: token.replace("fas1.", "fas1.e30.", 1),  # Additional segment
+        lambda token: "fas1." + token[5:].split(".")[0],  # No signature
+        lambda token: token + "!",
+    ])
+    def test_tampered(self, signer, tamper):
+        with pytest.raises(InvalidToken):
+            signer.verify(tamper(signer.issue({"sub": "1"})))
+
+    def test_other_secret(self, signer):
+        with pytest.raises(InvalidToken):
+            SessionTokenSigner("x" * 32).verify(signer.issue({"sub": "1"}))
+
+    def test_rotation(self, signer):
+        token = signer.issue({"sub": "1"})
+        rotated = SessionTokenSigner("y" * 32, previous_secrets=[SECRET])
+        assert rotated.verify(token)[0] == {"sub": "1"}
+
+    def test_short_secret(self):
+        with pytest.raises(ValueError):
+            SessionTokenSigner("too short")
+
+
+class TestOAuth2MiddlewareSessions:
+
+    @pytest.fixture
+    def client(self) -> TestClient:
+        app = FastAPI()
+        app.add_middleware(OAuth2Middleware, public_key=PUBLIC_KEY, session_signer=SessionTokenSigner(SECRET), token_cache=TokenCache())
+
+        @app.get("/")
+        def home(request: Request):
+            return {"user": request.user.identity, "scopes": list(request.auth.scopes)}
+
+        return TestClient(app)
+
+    def test_exchange(self, client, monkeypatch):
+        response = client.get("/", headers={"Authorization": f"Bearer {sign_token(scope='a b')}"})
+        session_token = response.headers["New-Session-Token"]
+
+        def no_decode(*args, **kwargs):
+            raise AssertionError("Session tokens must not be verified with the public key")
+
+        monkeypatch.setattr(get_engine(), "decode", no_decode)
+        response = client.get("/", headers={"Authorization": f"Bearer {session_token}"})
+        assert response.json() == {"user": "1", "scopes": ["a", "b"]}
+        assert "New-Session-Token" not in response.headers
+
+    def test_issued_once_per_access_token(self, client, monkeypatch):
+        token = sign_token()
+        first = client.get("/", headers={"Authorization": f"Bearer {token}"}).headers["New-Session-Token"]
+
+        def no_issue(claims):
+            raise AssertionError("The session token must be reused")
+
+        signer = client.app.user_middleware[0].kwargs["session_signer"]
+        monkeypatch.setattr(signer, "issue", no_issue)
+        assert client.get("/", headers={"Authorization": f"Bearer {token}"}).headers["New-Session-Token"] == first
+
+    def test_forged(self, client):
+        forged = SessionTokenSigner("z" * 32).issue({"sub": "admin", "exp": time.time() + 60})
+        assert client.get("/", headers={"Authorization": f"Bearer {forged}"}).status_code == 401
+
+    def test_expired_access_token(self, client):
+        assert "New-Session-Token" not in client.get("/", headers={"Authorization": f"Bearer {sign_token(timedelta(seconds=-10))}"}).headers
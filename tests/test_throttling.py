@@ -0,0 +1,98 @@
+import time
+from datetime import timedelta
+
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from fastapi_auth_middleware import OAuth2Middleware, TokenCache, FailureBudget
+from fastapi_auth_middleware.throttling import get_client_host
+from tests.keys import PUBLIC_KEY, sign_token
+
+
+def oauth2_client(**kwargs) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(OAuth2Middleware, public_key=PUBLIC_KEY, **kwargs)
+
+    @app.get("/")
+    def home():
+        return 'Hello World'
+
+    return TestClient(app)
+
+
+class TestFailureBudget:
+
+    def test_exhausted(self):
+        budget = FailureBudget(max_failures=2)
+        budget.record_failure("10.0.0.1")
+        assert not budget.exhausted("10.0.0.1")
+        budget.record_failure("10.0.0.1")
+        assert budget.exhausted("10.0.0.1")
+        assert not budget.exhausted("10.0.0.2")
+
+    def test_window_restores_budget(self):
+        budget = FailureBudget(max_failures=1, window=0.01)
+        budget.record_failure("10.0.0.1")
+        assert budget.exhausted("10.0.0.1")
+        time.sleep(0.02)
+        assert not budget.exhausted("10.0.0.1")
+        budget.record_failure("10.0.0.1")
+        time.sleep(0.02)
+        budget.record_failure("10.0.0.1")  # Starts a new window
+        assert budget.exhausted("10.0.0.1")
+
+    def test_unknown_client_is_not_tracked(self):
+        budget = FailureBudget(max_failures=1)
+        budget.record_failure(None)
+        assert not budget.exhausted(None)
+
+    def test_max_clients(self):
+        budget = FailureBudget(max_failures=1, max_clients=2)
+        for client in ("a", "b", "c"):
+            budget.record_failure(client)
+        assert not budget.exhausted("a")
+        assert budget.exhausted("b") and budget.exhausted("c")
+
+    def test_get_client_host(self):
+        assert get_client_host({"client": ("10.0.0.1", 1234)}) == "10.0.0.1"
+        assert get_client_host({"client": None}) is None
+        assert get_client_host({}) is None
+
+
+class TestInvalidTokens:
+
+    def test_invalid_token_rejected(self):
+        client = oauth2_client()
+        assert client.get("/", headers={"Authorization": "Bearer garbage"}).status_code == 401
+        assert client.get("/", headers={"Authorization": f"Bearer {sign_token(timedelta(hours=1), 'secret', 'HS256')}"}).status_code == 401
+
+    def test_negative_cache(self, decode_calls):
+        negative_cache = TokenCache(ttl=30)
+        client = oauth2_client(negative_cache=negative_cache)
+        forged = sign_token()[:-4] + "AAAA"
+
+        for _ in range(3):
+            assert client.get("/", headers={"Authorization": f"Bearer {forged}"}).status_code == 401
+
+        assert len(decode_calls) == 1
+        assert len(negative_cache) == 1
+
+    def test_negative_cache_expired_token_is_renewed(self, decode_calls):
+        client = oauth2_client(negative_cache=TokenCache(ttl=30), get_new_token=lambda old_token: "new-token")
+        expired = sign_token(timedelta(hours=-1))
+
+        for _ in range(2):
+            response = client.get("/", headers={"Authorization": f"Bearer {expired}"})
+            assert response.status_code == 200
+            assert response.headers["New-Access-Token"] == "new-token"
+
+        assert len(decode_calls) == 1
+
+    def test_failure_budget(self, decode_calls):
+        client = oauth2_client(failure_budget=FailureBudget(max_failures=2))
+        valid, expired = sign_token(), sign_token(timedelta(hours=-1))
+
+        assert client.get("/", headers={"Authorization": "Bearer garbage"}).status_code == 401
+        assert client.get("/", headers={"Authorization": f"Bearer {expired}"}).status_code == 401
+        assert client.get("/", headers={"Authorization": f"Bearer {valid}"}).status_code == 429  # Budget is used up
+        assert len(decode_calls) == 1  # "garbage" fails before decoding, the valid token is never verified
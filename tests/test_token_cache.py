@@ -0,0 +1,76 @@
+import time
+
+import pytest
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from fastapi_auth_middleware import OAuth2Middleware, TokenCache
+from tests.keys import PUBLIC_KEY, sign_token
+
+
+class TestTokenCache:
+
+    def test_get_set(self):
+        cache = TokenCache()
+        cache.set("token", "value", expires_at=time.time() + 60)
+        assert cache.get("token") == "value"
+        assert cache.get("unknown") is None
+
+    def test_raw_token_is_not_stored(self):
+        cache = TokenCache()
+        cache.set("token", "value")
+        assert "token" not in cache._entries
+        assert TokenCache.digest("token") in cache._entries
+
+    def test_expired_entry(self):
+        cache = TokenCache()
+        cache.set("token", "value", expires_at=time.time() - 1)
+        assert cache.get("token") is None
+        assert len(cache) == 0
+
+    def test_ttl_caps_expiry(self):
+        cache = TokenCache(ttl=-1)
+        cache.set("token", "value", expires_at=time.time() + 60)
+        assert cache.get("token") is None
+
+    def test_lru_eviction(self):
+        cache = TokenCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        assert cache.get("a") == 1  # "b" is now the least recently used entry
+        cache.set("c", 3)
+        assert len(cache) == 2
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+    def test_clear(self):
+        cache = TokenCache()
+        cache.set("token", "value")
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_invalid_size(self):
+        with pytest.raises(ValueError):
+            TokenCache(max_size=0)
+
+
+class TestOAuth2MiddlewareTokenCache:
+
+    def test_decode_once(self, decode_calls):
+        cache = TokenCache(max_size=8)
+        app = FastAPI()
+        app.add_middleware(OAuth2Middleware, public_key=PUBLIC_KEY, token_cache=cache)
+
+        @app.get("/")
+        def home():
+            return 'Hello World'
+
+        client = TestClient(app)
+        token = sign_token()
+
+        for _ in range(3):
+            assert client.get("/", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+
+        assert len(decode_calls) == 1
+        assert len(cache) == 1
@@ -0,0 +1,85 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+
+from fastapi_auth_middleware import TokenCache, VerificationExecutor
+from fastapi_auth_middleware.exceptions import InvalidToken, TokenHasExpired, VerificationQueueFull
+from fastapi_auth_middleware.keys import UnknownKeyId
+from fastapi_auth_middleware.oauth2_middleware import OAuth2Backend
+from tests.keys import PUBLIC_KEY, sign_token
+
+
+def backend(**kwargs) -> OAuth2Backend:
+    return OAuth2Backend(public_key=PUBLIC_KEY, get_scopes=None, get_user=None, issuer=None, audience=None, decode_token_options=None, algorithms=["RS256"], **kwargs)
+
+
+class TestVerifyMany:
+
+    def test_results_in_order(self):
+        valid, expired = sign_token(sub="1", scope="a b"), sign_token(timedelta(hours=-1), sub="2")
+        forged = sign_token(sub="3")[:-4] + "AAAA"
+
+        results = asyncio.run(backend().verify_many([valid, expired, "garbage", forged, valid]))
+
+        assert [result.ok for result in results] == [True, False, False, False, True]
+        assert results[0].claims["sub"] == "1"
+        assert list(results[0].credentials.scopes) == ["a", "b"]
+        assert results[0].user.identity == "1"
+        assert isinstance(results[1].error, TokenHasExpired)
+        assert isinstance(results[2].error, InvalidToken)
+        assert isinstance(results[3].error, InvalidToken)
+        assert results[4] is results[0]  # Duplicates are verified once
+
+    def test_deduplicates(self, decode_calls):
+        token = sign_token(sub="1")
+        asyncio.run(backend().verify_many([token] * 10))
+        assert len(decode_calls) == 1
+
+    def test_thread_pool(self):
+        tokens = [sign_token(sub=str(i)) for i in range(20)]
+        results = asyncio.run(backend(verification_executor=VerificationExecutor(max_workers=4)).verify_many(tokens))
+        assert [result.claims["sub"] for result in results] == [str(i) for i in range(20)]
+
+    def test_process_pool(self):
+        executor = VerificationExecutor(ProcessPoolExecutor(max_workers=2))
+        tokens = [sign_token(sub=str(i)) for i in range(6)] + [sign_token(timedelta(hours=-1), sub="expired")]
+        try:
+            results = asyncio.run(backend(verification_executor=executor).verify_many(tokens))
+        finally:
+            executor.shutdown()
+
+        assert [result.claims["sub"] for result in results[:-1]] == [str(i) for i in range(6)]
+        assert isinstance(results[-1].error, TokenHasExpired)
+
+    def test_queue_full(self):
+        executor = VerificationExecutor(max_workers=1, max_concurrency=1, max_queue=0)
+        tokens = [sign_token(sub=str(i)) for i in range(3)]
+        assert all(result.ok for result in asyncio.run(backend(verification_executor=executor).verify_many(tokens)))  # A single chunk fits
+
+        executor.pending = 1  # Busy with another verification
+        results = asyncio.run(backend(verification_executor=executor).verify_many(tokens))
+        assert all(isinstance(result.error, VerificationQueueFull) for result in results)
+
+    def test_unknown_kid(self):
+        keyed_backend = OAuth2Backend(public_key={"k1": PUBLIC_KEY, "k2": PUBLIC_KEY}, get_scopes=None, get_user=None, issuer=None, audience=None,
+                                      decode_token_options=None, algorithms=["RS256"])
+        results = asyncio.run(keyed_backend.verify_many([sign_token(headers={"kid": "k1"}, sub="1"), sign_token(headers={"kid": "k3"}, sub="2"), sign_token(headers={"kid": "k3"}, sub="3")]))
+        assert results[0].ok
+        assert isinstance(results[1].error, UnknownKeyId) and isinstance(results[2].error, UnknownKeyId)
+
+    def test_caches(self):
+        token_cache, negative_cache = TokenCache(), TokenCache(ttl=30)
+        cached_backend = backend(token_cache=token_cache, negative_cache=negative_cache)
+        valid, expired = sign_token(sub="1"), sign_token(timedelta(hours=-1), sub="2")
+
+        asyncio.run(cached_backend.verify_many([valid, expired]))
+        assert len(token_cache) == 1 and len(negative_cache) == 1
+
+        credentials, user = asyncio.run(cached_backend.authenticate_header(f"Bearer {valid}"))  # Shared with single requests
+        results = asyncio.run(cached_backend.verify_many([valid, expired]))
+        assert results[0].user is user
+        assert isinstance(results[1].error, TokenHasExpired)
+
+    def test_empty(self):
+        assert asyncio.run(backend().verify_many([])) == []